@@ -1,11 +1,33 @@
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import APIRouter, FastAPI
+from sqlalchemy.exc import DBAPIError
 from starlette.middleware.cors import CORSMiddleware
 
 from api import routers
+from api.compression import CompressionMiddleware
+from api.deadlines import DisconnectMiddleware, database_error, deadline_exceeded
+from api.dependencies import get_receipt_feed, get_receipt_spool
+from api.exceptions import DeadlineExceeded
+from config import CompressionConfig
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replays receipts spooled during a database outage, also those left by a
+    # previous process
+    spool = get_receipt_spool()
+    if spool is not None:
+        spool.start()
+    yield
+    if spool is not None:
+        await spool.stop()
+    # Its LISTEN connections are opened by the first subscriber
+    await get_receipt_feed().close()
+
+
+app = FastAPI(lifespan=lifespan)
 prefix_router = APIRouter(prefix="/api/v1")
 
 log_level = logging.INFO
@@ -20,6 +42,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+compression_config = CompressionConfig()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=compression_config.compression_minimum_size,
+    levels={
+        "gzip": compression_config.compression_gzip_level,
+        "br": compression_config.compression_brotli_level,
+        "zstd": compression_config.compression_zstd_level,
+    },
+)
+
+# Outermost, so that nothing keeps running for a client that is gone
+app.add_middleware(DisconnectMiddleware)
+app.add_exception_handler(DeadlineExceeded, deadline_exceeded)
+app.add_exception_handler(DBAPIError, database_error)
+
 logging.getLogger(__name__).setLevel(logging.INFO)
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +68,7 @@ logging.basicConfig(
 for router in [
     routers.auth_api.router,
     routers.receipts_api.router,
+    routers.metrics_api.router,
 ]:
     prefix_router.include_router(router)
 
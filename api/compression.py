@@ -0,0 +1,262 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/plain",
+    "text/html",
+    "text/csv",
+    "application/x-ndjson",
+)
+
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        )
+
+
+class BrotliEncoder:
+    def __init__(self, level: int):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        compressed = self.compressor.process(data)
+        if final:
+            return compressed + self.compressor.finish()
+        return compressed + self.compressor.flush()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+
+def available_encodings() -> dict[str, type]:
+    # In order of preference when the client accepts several of them
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encodings["br"] = BrotliEncoder
+    encodings["gzip"] = GzipEncoder
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, supported: list[str]) -> str | None:
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    candidates = [
+        (accepted.get(encoding, wildcard), -position, encoding)
+        for position, encoding in enumerate(supported)
+    ]
+    quality, _, encoding = max(candidates, default=(0.0, 0, None))
+    return encoding if quality > 0 else None
+
+
+def encode_etag(etag: str, encoding: str) -> str:
+    """
+    Strong `etag` of the representation compressed with `encoding`: byte
+    different representations must not share a strong validator.
+    """
+    if etag.startswith('"'):
+        return f'{etag[:-1]}-{encoding}"'
+    return etag
+
+
+def decode_etags(if_none_match: str, encodings: list[str]) -> tuple[str, str | None]:
+    """
+    `If-None-Match` with the encodings taken off its ETags, so the application
+    compares them to its own, and the encoding taken off.
+    """
+    decoded, found = [], None
+    for etag in if_none_match.split(","):
+        etag = etag.strip()
+        for encoding in encodings:
+            suffix = f'-{encoding}"'
+            if etag.startswith('"') and etag.endswith(suffix):
+                etag, found = etag[: -len(suffix)] + '"', encoding
+                break
+        decoded.append(etag)
+    return ", ".join(decoded), found
+
+
+class CompressionMiddleware:
+    """
+    Negotiated zstd / brotli / gzip response compression.
+
+    Bodies are buffered until `minimum_size` bytes are seen, so small responses
+    go out untouched. Streaming responses are compressed chunk by chunk, and
+    every chunk is flushed so that a client never waits for the next one.
+
+    Compressed responses get the encoding appended to their ETag, and taken
+    off again in `If-None-Match`, so a `304 Not Modified` answers with the
+    ETag the client has. Every compressible response varies on
+    `Accept-Encoding`, compressed or not.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        levels: dict[str, int] | None = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.encoders = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(
+            request_headers.get("Accept-Encoding", ""), list(self.encoders)
+        )
+
+        revalidated = None
+        if "If-None-Match" in request_headers:
+            if_none_match, revalidated = decode_etags(
+                request_headers["If-None-Match"], list(self.encoders)
+            )
+            scope = {**scope, "headers": list(scope["headers"])}
+            MutableHeaders(scope=scope)["If-None-Match"] = if_none_match
+
+        responder = CompressionResponder(
+            send,
+            self.minimum_size,
+            encoding,
+            encoding and (lambda: self.encoders[encoding](self.levels[encoding])),
+            revalidated,
+        )
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(
+        self,
+        send: Send,
+        minimum_size: int,
+        encoding: str | None,
+        make_encoder,
+        revalidated: str | None = None,
+    ):
+        self._send = send
+        self.minimum_size = minimum_size
+        # None when the client accepts no encoding we have
+        self.encoding = encoding
+        self.make_encoder = make_encoder
+        # Encoding of the ETag in the request's `If-None-Match`
+        self.revalidated = revalidated
+
+        self.start_message: Message | None = None
+        self.buffer: list[bytes] = []
+        self.buffered_size = 0
+        self.encoder = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            content_type = headers.get("Content-Type", "")
+            if message["status"] == 304:
+                # Validates the representation the client has
+                headers.add_vary_header("Accept-Encoding")
+                if self.revalidated and "ETag" in headers:
+                    headers["ETag"] = encode_etag(headers["ETag"], self.revalidated)
+                self.passthrough = True
+                await self._send(message)
+                return
+            if "Content-Encoding" in headers or not content_type.startswith(
+                COMPRESSIBLE_TYPES
+            ):
+                self.passthrough = True
+                await self._send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if self.encoding is None:
+                self.passthrough = True
+                await self._send(message)
+                return
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            self.buffer.append(body)
+            self.buffered_size += len(body)
+
+            if self.buffered_size < self.minimum_size:
+                if more_body:
+                    return
+                await self._send(self.start_message)
+                await self._send(
+                    {"type": "http.response.body", "body": b"".join(self.buffer)}
+                )
+                return
+
+            self.encoder = self.make_encoder()
+            compressed = self.encoder.compress(b"".join(self.buffer), not more_body)
+            self.buffer = []
+
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            if "ETag" in headers:
+                headers["ETag"] = encode_etag(headers["ETag"], self.encoding)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(compressed))
+            await self._send(self.start_message)
+        else:
+            compressed = self.encoder.compress(body, not more_body)
+
+        await self._send(
+            {"type": "http.response.body", "body": compressed, "more_body": more_body}
+        )
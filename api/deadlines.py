@@ -0,0 +1,89 @@
+import asyncio
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.exceptions import DeadlineExceeded
+from database.deadlines import is_query_canceled
+
+EMPTY_BODY = {"type": "http.request", "body": b"", "more_body": False}
+
+
+def has_body(scope: Scope) -> bool:
+    headers = Headers(scope=scope)
+    return "transfer-encoding" in headers or headers.get("content-length", "0") != "0"
+
+
+class DisconnectMiddleware:
+    """
+    Cancels the handler of a request once its client disconnects, so that the
+    running query is cancelled and its connection goes back to the pool
+    instead of working for nobody.
+
+    The client is watched once the handler has read the request body, bodies
+    are not buffered ahead of the handler.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        disconnected = asyncio.Event()
+        body_read = False
+        watcher: asyncio.Task | None = None
+
+        async def watch():
+            # The first message of a request without a body is its empty body
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+            handler.cancel()
+
+        async def receive_request() -> Message:
+            nonlocal body_read, watcher
+            if watcher is None:
+                message = await receive()
+                if message["type"] == "http.disconnect" or not message.get("more_body"):
+                    body_read = True
+                    watcher = asyncio.ensure_future(watch())
+                return message
+            if not body_read:
+                body_read = True
+                return EMPTY_BODY
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        if not has_body(scope):
+            watcher = asyncio.ensure_future(watch())
+
+        handler = asyncio.ensure_future(self.app(scope, receive_request, send))
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not disconnected.is_set():
+                raise
+        finally:
+            handler.cancel()
+            if watcher is not None:
+                watcher.cancel()
+
+
+async def deadline_exceeded(request: Request, error: Exception) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "Request deadline exceeded"},
+    )
+
+
+async def database_error(request: Request, error: DBAPIError) -> JSONResponse:
+    # Queries run out of time on their `statement_timeout`, see `set_deadline`
+    if is_query_canceled(error):
+        return await deadline_exceeded(request, error)
+    raise error
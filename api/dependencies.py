@@ -1,10 +1,22 @@
-from functools import lru_cache
+import time
+from collections.abc import Callable
+from contextlib import AbstractAsyncContextManager, AsyncExitStack, asynccontextmanager
+from functools import lru_cache, partial
+from pathlib import Path
 
-from fastapi import Depends
+from fastapi import Depends, Header, Request
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from config import Config, load_config
+from database.deadlines import set_deadline
+from database.repo.memory import MemoryRequestsRepo, MemoryStorage
 from database.repo.requests import RequestsRepo
+from services.cache import MemoryCacheBackend, ReceiptsCache, RedisCacheBackend
+from services.feed import ReceiptFeed
+from services.metrics import Metrics
+from services.reports import ReceiptSnapshots
+from services.singleflight import SingleFlight
+from services.spool import ReceiptSpool, replay_receipts
 
 
 @lru_cache
@@ -13,13 +25,200 @@ def get_config() -> Config:
 
 
 @lru_cache
-def get_session_pool():
+def get_session_pools() -> list[async_sessionmaker]:
+    # One pool per shard, see `database.sharding`
     config = get_config()
-    engine = create_async_engine(config.db.get_connection_string())
-    session_pool = async_sessionmaker(engine, expire_on_commit=False)
-    return session_pool
+    return [
+        async_sessionmaker(
+            create_async_engine(config.db.get_connection_string(host)),
+            expire_on_commit=False,
+        )
+        for host in config.db.get_shard_hosts()
+    ]
 
 
-async def get_repository(session_pool: async_sessionmaker = Depends(get_session_pool)):
-    async with session_pool() as session:
-        yield RequestsRepo(session)
+@lru_cache
+def get_receipts_cache() -> ReceiptsCache:
+    config = get_config().cache
+    if config.cache_backend == "redis":
+        backend = RedisCacheBackend.from_url(config.cache_redis_url)
+    else:
+        backend = MemoryCacheBackend(max_entries=config.cache_max_entries)
+    return ReceiptsCache(backend, ttl=config.cache_ttl)
+
+
+@lru_cache
+def get_receipt_feed() -> ReceiptFeed:
+    config = get_config()
+    return ReceiptFeed(
+        [config.db.get_dsn(host) for host in config.db.get_shard_hosts()],
+        queue_size=config.feed.feed_queue_size,
+    )
+
+
+@lru_cache
+def get_memory_storage() -> MemoryStorage:
+    return MemoryStorage()
+
+
+@lru_cache
+def get_receipt_snapshots() -> ReceiptSnapshots:
+    config = get_config().reports
+    return ReceiptSnapshots(
+        max_users=config.reports_max_users,
+        max_age=config.reports_max_age,
+        settle=config.reports_settle_seconds,
+    )
+
+
+@lru_cache
+def get_receipt_flights() -> SingleFlight:
+    return SingleFlight()
+
+
+@lru_cache
+def get_receipt_spool() -> ReceiptSpool | None:
+    config = get_config()
+    if not config.spool.spool_enabled or config.db.db_backend == "memory":
+        return None
+    return ReceiptSpool(
+        Path(config.spool.spool_directory),
+        replay=partial(
+            replay_receipts,
+            partial(open_repository, config, get_session_pools()),
+            get_receipts_cache(),
+            config.receipt_text.receipt_text_widths,
+        ),
+        segment_bytes=config.spool.spool_segment_bytes,
+        batch_size=config.spool.spool_replay_batch,
+        retry_interval=config.spool.spool_retry_interval,
+    )
+
+
+@lru_cache
+def get_metrics() -> Metrics:
+    metrics = Metrics()
+    flights = get_receipt_flights()
+    metrics.register(
+        "receipt_reads_total",
+        "counter",
+        "Reads of a single receipt or its text",
+        lambda: flights.calls,
+    )
+    metrics.register(
+        "receipt_reads_coalesced_total",
+        "counter",
+        "Receipt reads served by a load already in flight",
+        lambda: flights.coalesced,
+    )
+    metrics.register(
+        "receipt_read_errors_total",
+        "counter",
+        "Shared receipt loads that failed",
+        lambda: flights.errors,
+    )
+
+    spool = get_receipt_spool()
+    if spool is not None:
+        metrics.register(
+            "receipt_spool_depth",
+            "gauge",
+            "Spooled receipts waiting to be replayed into the database",
+            lambda: spool.depth,
+        )
+        metrics.register(
+            "receipt_spooled_total",
+            "counter",
+            "Receipts accepted into the spool while the database was unreachable",
+            lambda: spool.spooled,
+        )
+        metrics.register(
+            "receipt_spool_replayed_total",
+            "counter",
+            "Spooled receipts replayed into the database",
+            lambda: spool.replayed,
+        )
+        metrics.register(
+            "receipt_spool_dropped_total",
+            "counter",
+            "Spooled receipts that could not be stored, moved to the dead letters",
+            lambda: spool.dropped,
+        )
+        metrics.register(
+            "receipt_spool_replay_failures_total",
+            "counter",
+            "Replays of a batch of spooled receipts that failed",
+            lambda: spool.replay_failures,
+        )
+        metrics.register(
+            "receipt_spool_drain_rate",
+            "gauge",
+            "Receipts per second replayed in the last batch",
+            lambda: spool.drain_rate,
+        )
+    return metrics
+
+
+def get_deadline(
+    request: Request,
+    config: Config = Depends(get_config),
+    x_request_timeout: float | None = Header(None, gt=0),
+) -> float:
+    """
+    When the database queries of the request have to be done, in
+    `time.monotonic()` time: after the deadline of the route, or the seconds
+    in the X-Request-Timeout header, up to `deadline_max`.
+    """
+    config = config.deadline
+    route = request.scope.get("route")
+    timeout = config.deadline_routes.get(
+        getattr(route, "name", None), config.deadline_default
+    )
+    if x_request_timeout is not None:
+        timeout = min(x_request_timeout, config.deadline_max)
+    return time.monotonic() + timeout
+
+
+@asynccontextmanager
+async def open_repository(
+    config: Config,
+    session_pools: list[async_sessionmaker],
+    deadline: float | None = None,
+):
+    if config.db.db_backend == "memory":
+        yield MemoryRequestsRepo(storage=get_memory_storage())
+        return
+
+    # Sessions only take a connection from their pool once they are used
+    async with AsyncExitStack() as stack:
+        sessions = [
+            await stack.enter_async_context(session_pool())
+            for session_pool in session_pools
+        ]
+        if deadline is not None:
+            for session in sessions:
+                set_deadline(session, deadline)
+        yield RequestsRepo(sessions[0], sessions)
+
+
+RepositoryOpener = Callable[[], AbstractAsyncContextManager[RequestsRepo]]
+
+
+async def get_repository(
+    session_pools: list[async_sessionmaker] = Depends(get_session_pools),
+    config: Config = Depends(get_config),
+    deadline: float = Depends(get_deadline),
+):
+    async with open_repository(config, session_pools, deadline) as repo:
+        yield repo
+
+
+def get_repository_opener(
+    session_pools: list[async_sessionmaker] = Depends(get_session_pools),
+    config: Config = Depends(get_config),
+) -> RepositoryOpener:
+    """
+    Opens repositories that are not tied to the request, see `SingleFlight`.
+    Their queries have no deadline, as they serve several requests.
+    """
+    return partial(open_repository, config, session_pools)
@@ -1,2 +1,22 @@
 class NotEnoughMoney(Exception):
     pass
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class InvalidFields(Exception):
+    pass
+
+
+class InvalidReceiptStream(Exception):
+    pass
+
+
+class ReceiptStreamTimeout(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
@@ -1,7 +1,13 @@
-from pydantic import BaseModel, condecimal
+from decimal import Decimal
+
+from pydantic import BaseModel, condecimal, model_validator
 
 from database.models.receipts import PaymentType
 
+HALF_KOPECK = Decimal("0.005")
+# Rounds to 100000000000000.00, 17 digits
+MAX_LINE_TOTAL = Decimal("99999999999999.995")
+
 
 class Token(BaseModel):
     access_token: str
@@ -14,6 +20,17 @@ class Product(BaseModel):
     price: condecimal(gt=0, max_digits=16, decimal_places=2)  # type: ignore
     quantity: condecimal(gt=0, max_digits=10, decimal_places=3)  # type: ignore
 
+    @model_validator(mode="after")
+    def check_total(self) -> "Product":
+        # The line total is rounded half-up to kopecks, see `services.money`,
+        # and has to fit `ProductResponse.total`
+        line_total = self.price * self.quantity
+        if line_total < HALF_KOPECK:
+            raise ValueError("price * quantity is less than 0.01")
+        if line_total >= MAX_LINE_TOTAL:
+            raise ValueError("price * quantity has more than 16 digits")
+        return self
+
 
 class Payment(BaseModel):
     type: PaymentType
@@ -42,6 +59,77 @@ class CreateReceiptResponse(BaseModel):
     user_full_name: str | None = None
 
 
+class SpooledReceiptResponse(BaseModel):
+    # Stored later, see `GET /receipts/spooled/{provisional_id}`
+    provisional_id: str
+    products: list[ProductResponse]
+    payment: Payment
+    comment: str | None = None
+    total: condecimal(gt=0, max_digits=16, decimal_places=2)  # type: ignore
+    rest: condecimal(ge=0, max_digits=16, decimal_places=2)  # type: ignore
+    created_at: str
+
+
+class StreamedReceiptHeader(BaseModel):
+    # First line of a streamed receipt, followed by a `Product` per line
+    payment: Payment
+    comment: str | None = None
+
+
+class StreamedReceiptResponse(BaseModel):
+    # Without the products, see `GET /receipts/{receipt_id}`
+    receipt_id: int
+    items_count: int
+    payment: Payment
+    comment: str | None = None
+    total: condecimal(gt=0, max_digits=16, decimal_places=2)  # type: ignore
+    rest: condecimal(ge=0, max_digits=16, decimal_places=2)  # type: ignore
+    created_at: str
+
+
+class BatchReceiptsResponse(BaseModel):
+    receipts: list[CreateReceiptResponse]
+    missing: list[int]
+
+
+class SearchReceiptsResponse(BaseModel):
+    receipts: list[CreateReceiptResponse]
+    next_cursor: str | None = None
+
+
+class ProductStatsResponse(BaseModel):
+    name: str
+    quantity: Decimal
+    revenue: Decimal
+    receipts_count: int
+
+
+class HistogramResponse(BaseModel):
+    # Bin `i` holds the values from `edges[i]` up to, excluding, `edges[i + 1]`
+    edges: list[Decimal]
+    counts: list[int]
+
+
+class DistributionResponse(BaseModel):
+    mean: Decimal
+    percentiles: dict[str, Decimal]
+    histogram: HistogramResponse
+
+
+class PaymentMixResponse(BaseModel):
+    count: int
+    total: Decimal
+
+
+class ReceiptsReportResponse(BaseModel):
+    receipts_count: int
+    totals: DistributionResponse | None = None
+    basket_size: DistributionResponse | None = None
+    # Receipts per weekday, from Monday, and hour
+    hours: list[list[int]] | None = None
+    payments: dict[PaymentType, PaymentMixResponse] | None = None
+
+
 class SignupRequest(BaseModel):
     username: str
     full_name: str
@@ -1,3 +1,3 @@
-from . import auth_api, receipts_api
+from . import auth_api, metrics_api, receipts_api
 
-__all__ = ["auth_api", "receipts_api"]
+__all__ = ["auth_api", "metrics_api", "receipts_api"]
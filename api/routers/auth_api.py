@@ -7,8 +7,12 @@ from api.dependencies import get_config, get_repository
 from api.models import SignupRequest, Token
 from config import Config
 from database.repo.requests import RequestsRepo
-from services.auth import (authenticate_user, create_access_token,
-                           get_password_hash)
+from services.auth import (
+    authenticate_user,
+    create_access_token,
+    create_user,
+    get_password_hash,
+)
 
 router = APIRouter()
 
@@ -22,12 +26,12 @@ async def signup_for_access_token(
     user = await authenticate_user(repo, form_data.username, form_data.password)
 
     if not user:
-        await repo.users.create_user(
+        await create_user(
+            repo,
             form_data.full_name,
             form_data.username,
             get_password_hash(form_data.password),
         )
-        await repo.session.commit()
 
     access_token_expires = timedelta(days=config.api.access_token_expire_days)
     access_token = create_access_token(
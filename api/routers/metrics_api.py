@@ -0,0 +1,14 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from api.dependencies import get_metrics
+from services.metrics import Metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics_text(metrics: Annotated[Metrics, Depends(get_metrics)]):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
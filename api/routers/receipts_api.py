@@ -1,34 +1,188 @@
-from datetime import datetime
+import asyncio
+import uuid
+from datetime import date, datetime, timezone
 from decimal import Decimal
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
+from sqlalchemy.exc import DBAPIError
 
-from api.dependencies import get_repository
-from api.exceptions import NotEnoughMoney
-from api.models import CreateReceiptRequest, CreateReceiptResponse
+from api.dependencies import (
+    RepositoryOpener,
+    get_config,
+    get_receipt_feed,
+    get_receipt_flights,
+    get_receipt_snapshots,
+    get_receipt_spool,
+    get_receipts_cache,
+    get_repository,
+    get_repository_opener,
+)
+from api.exceptions import (
+    InvalidCursor,
+    InvalidFields,
+    InvalidReceiptStream,
+    NotEnoughMoney,
+    ReceiptStreamTimeout,
+)
+from api.models import (
+    BatchReceiptsResponse,
+    CreateReceiptRequest,
+    CreateReceiptResponse,
+    ProductStatsResponse,
+    ReceiptsReportResponse,
+    SearchReceiptsResponse,
+    SpooledReceiptResponse,
+    StreamedReceiptResponse,
+)
+from config import Config
 from database.models import User
 from database.models.receipts import PaymentType
+from database.repo.receipts import ReceiptSort
 from database.repo.requests import RequestsRepo
-from services.auth import get_current_user
-from services.receipts import ReceiptService, generate_receipt_text
+from services import money
+from services.auth import get_current_user, get_token_username, get_user
+from services.cache import ReceiptsCache
+from services.feed import ReceiptFeed, stream_events
+from services.receipts import (
+    ReceiptService,
+    parse_fields,
+    parse_streamed_receipt,
+    price_receipt,
+    read_lines,
+    read_with_timeout,
+)
+from services.reports import REPORT_STATS, ReceiptSnapshots, build_report
+from services.singleflight import SingleFlight
+from services.spool import ReceiptSpool, is_database_unavailable
 
 router = APIRouter(prefix="/receipts")
 
+MAX_BATCH_IDS = 500
+# Longest line of a streamed receipt
+MAX_LINE_BYTES = 64 * 1024
+# Seconds a streamed receipt may send nothing for, and may keep its transaction
+# waiting for the next chunk of products
+STREAM_READ_TIMEOUT = 10
+STREAM_IDLE_TIMEOUT = 30
+
 
 @router.post(
     "/",
     response_model=CreateReceiptResponse,
     status_code=status.HTTP_201_CREATED,
+    responses={status.HTTP_202_ACCEPTED: {"model": SpooledReceiptResponse}},
 )
 async def create_receipt(
     receipt_request: CreateReceiptRequest,
+    username: Annotated[str, Depends(get_token_username)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    cache: Annotated[ReceiptsCache, Depends(get_receipts_cache)],
+    config: Annotated[Config, Depends(get_config)],
+    spool: Annotated[ReceiptSpool | None, Depends(get_receipt_spool)],
+):
+    try:
+        user = await get_user(repo, username)
+    except (OSError, DBAPIError) as error:
+        # Only receipts that never reached the database are spooled
+        if spool is None or not is_database_unavailable(error):
+            raise
+        try:
+            products, total, rest = price_receipt(receipt_request)
+        except NotEnoughMoney:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough money"
+            )
+        created_at = datetime.now(timezone.utc)
+        spool_id = uuid.uuid4().hex
+        await spool.append(
+            {
+                "spool_id": spool_id,
+                "username": username,
+                "created_at": created_at.isoformat(),
+                "request": receipt_request.model_dump(mode="json"),
+            }
+        )
+        response = SpooledReceiptResponse(
+            provisional_id=spool_id,
+            products=products,
+            payment=receipt_request.payment,
+            comment=receipt_request.comment,
+            total=money.from_kopecks(total),
+            rest=money.from_kopecks(rest),
+            created_at=created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        return Response(
+            content=response.model_dump_json(),
+            status_code=status.HTTP_202_ACCEPTED,
+            media_type="application/json",
+        )
+
+    receipt_service = ReceiptService(repo.for_user(user.user_id), cache)
+    try:
+        response = await receipt_service.create_receipt(
+            user.user_id,
+            receipt_request,
+            user_full_name=user.full_name,
+            text_widths=config.receipt_text.receipt_text_widths,
+        )
+    except NotEnoughMoney:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough money"
+        )
+
+    return response
+
+
+@router.post(
+    "/stream",
+    response_model=StreamedReceiptResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+        }
+    },
+)
+async def create_streamed_receipt(
+    request: Request,
     user: Annotated[User, Depends(get_current_user)],
     repo: Annotated[RequestsRepo, Depends(get_repository)],
+    cache: Annotated[ReceiptsCache, Depends(get_receipts_cache)],
 ):
-    receipt_service = ReceiptService(repo)
+    # NDJSON: `{"payment": ..., "comment": ...}`, then a product per line
+    receipt_service = ReceiptService(repo.for_user(user.user_id), cache)
     try:
-        response = await receipt_service.create_receipt(user.user_id, receipt_request)
+        header, products = await parse_streamed_receipt(
+            read_lines(
+                read_with_timeout(request.stream(), STREAM_READ_TIMEOUT),
+                MAX_LINE_BYTES,
+            )
+        )
+        response = await receipt_service.create_streamed_receipt(
+            user.user_id, header, products, idle_timeout=STREAM_IDLE_TIMEOUT
+        )
+    except InvalidReceiptStream as error:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error)
+        )
+    except ReceiptStreamTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_408_REQUEST_TIMEOUT,
+            detail=f"No data for {STREAM_READ_TIMEOUT} seconds",
+        )
     except NotEnoughMoney:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Not enough money"
@@ -37,10 +191,34 @@ async def create_receipt(
     return response
 
 
+@router.get("/spooled/{provisional_id}", response_model=CreateReceiptResponse)
+async def get_spooled_receipt(
+    provisional_id: str,
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+):
+    # Spooled receipts are stored on the shard of their user
+    receipt_service = ReceiptService(repo.for_user(user.user_id))
+    receipt_id = await receipt_service.repo.receipts.get_spooled_receipt_id(
+        provisional_id
+    )
+    result = None
+    if receipt_id is not None:
+        result = await receipt_service.get_receipt_by_id(receipt_id)
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Receipt not stored yet"
+        )
+
+    return Response(content=to_json(result), media_type="application/json")
+
+
 @router.get("/", response_model=list[CreateReceiptResponse])
 async def get_receipts(
     user: Annotated[User, Depends(get_current_user)],
     repo: Annotated[RequestsRepo, Depends(get_repository)],
+    cache: Annotated[ReceiptsCache, Depends(get_receipts_cache)],
+    config: Annotated[Config, Depends(get_config)],
     start_date: datetime | None = None,
     end_date: datetime | None = None,
     min_total: Decimal | None = None,
@@ -48,9 +226,20 @@ async def get_receipts(
     payment_type: PaymentType | None = None,
     limit: int = Query(10, gt=0),
     offset: int = Query(0, ge=0),
+    fields: str | None = None,
+    view: Literal["full", "summary"] = "full",
+    sort: ReceiptSort | None = None,
+    count: bool = False,
+    exact: bool = False,
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    receipt_service = ReceiptService(repo)
-    result = await receipt_service.get_receipts(
+    try:
+        projection = parse_fields(fields, view)
+    except InvalidFields as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+    receipt_service = ReceiptService(repo.for_user(user.user_id), cache)
+    etag, body = await receipt_service.get_receipts_page(
         user_id=user.user_id,
         start_date=start_date,
         end_date=end_date,
@@ -59,43 +248,188 @@ async def get_receipts(
         payment_type=payment_type,
         offset=offset,
         limit=limit,
+        fields=projection,
+        sort=sort,
+        if_none_match=if_none_match,
     )
-    if not result:
+    if body is None:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    if body == b"[]":
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Receipts not found"
         )
 
+    headers = {"ETag": etag}
+    if count or exact:
+        total, is_exact = await receipt_service.count_receipts(
+            user_id=user.user_id,
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            exact=exact,
+            timeout=config.count.count_exact_timeout,
+        )
+        headers["X-Total-Count"] = str(total)
+        headers["X-Total-Count-Exact"] = "true" if is_exact else "false"
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/batch", response_model=BatchReceiptsResponse)
+async def get_receipts_batch(
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    ids: list[int] = Query(min_length=1, max_length=MAX_BATCH_IDS),
+):
+    # A user's receipts live on the user's shard, IDs of other shards are
+    # reported as missing
+    receipt_service = ReceiptService(repo.for_user(user.user_id))
+    receipts, missing = await receipt_service.get_receipts_by_ids(
+        user.user_id, ids, user_full_name=user.full_name
+    )
+    return Response(
+        content=to_json({"receipts": receipts, "missing": missing}),
+        media_type="application/json",
+    )
+
+
+@router.get("/search", response_model=SearchReceiptsResponse)
+async def search_receipts(
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    q: str = Query(min_length=1, max_length=255),
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    min_total: Decimal | None = None,
+    max_total: Decimal | None = None,
+    payment_type: PaymentType | None = None,
+    limit: int = Query(10, gt=0, le=100),
+    cursor: str | None = None,
+):
+    receipt_service = ReceiptService(repo.for_user(user.user_id))
+    try:
+        result = await receipt_service.search_receipts(
+            user_id=user.user_id,
+            text=q,
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            limit=limit,
+            cursor=cursor,
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
     return result
 
 
+@router.get("/analytics/products", response_model=list[ProductStatsResponse])
+async def get_top_products(
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    start_date: date | None = None,
+    end_date: date | None = None,
+    order_by: Literal["quantity", "revenue"] = "revenue",
+    limit: int = Query(10, gt=0, le=100),
+):
+    receipt_service = ReceiptService(repo.for_user(user.user_id))
+    return await receipt_service.get_top_products(
+        user_id=user.user_id,
+        start_date=start_date,
+        end_date=end_date,
+        order_by=order_by,
+        limit=limit,
+    )
+
+
+@router.get("/analytics/distributions", response_model=ReceiptsReportResponse)
+async def get_receipts_report(
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    snapshots: Annotated[ReceiptSnapshots, Depends(get_receipt_snapshots)],
+    stats: list[Literal[REPORT_STATS]] = Query(list(REPORT_STATS)),
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    bins: int = Query(10, gt=0, le=100),
+    utc_offset: int = Query(0, ge=-12 * 60, le=14 * 60),
+):
+    snapshot = await snapshots.get(repo.for_user(user.user_id), user.user_id)
+    # Reports over many receipts take a while, the view is safe to read in a
+    # thread while the snapshot grows
+    return await asyncio.to_thread(
+        build_report,
+        snapshot.view(),
+        stats=stats,
+        start_date=start_date,
+        end_date=end_date,
+        bins=bins,
+        utc_offset=utc_offset,
+    )
+
+
+@router.get("/feed")
+async def receipts_feed(
+    user: Annotated[User, Depends(get_current_user)],
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    feed: Annotated[ReceiptFeed, Depends(get_receipt_feed)],
+    config: Annotated[Config, Depends(get_config)],
+):
+    # The stream outlives the request, don't hold pooled connections for it
+    await repo.close()
+
+    return StreamingResponse(
+        stream_events(feed, user.user_id, config.feed.feed_keepalive),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{receipt_id}", response_model=CreateReceiptResponse)
 async def get_receipt_by_id(
     receipt_id: int,
-    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    open_repository: Annotated[RepositoryOpener, Depends(get_repository_opener)],
+    flights: Annotated[SingleFlight, Depends(get_receipt_flights)],
 ):
-    receipt_service = ReceiptService(repo)
-    result = await receipt_service.get_receipt_by_id(receipt_id)
-    if not result:
+    async def load() -> bytes | None:
+        async with open_repository() as repo:
+            receipt_service = ReceiptService(repo.for_receipt(receipt_id))
+            result = await receipt_service.get_receipt_by_id(receipt_id)
+        return None if result is None else to_json(result)
+
+    # Concurrent reads of a shared receipt link run a single load
+    body = await flights.do(("receipt", receipt_id), load)
+    if body is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Receipt not found"
         )
 
-    return result
+    return Response(content=body, media_type="application/json")
 
 
 @router.get("/show/{receipt_id}/")
 async def show_receipt_by_id(
     receipt_id: int,
-    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    open_repository: Annotated[RepositoryOpener, Depends(get_repository_opener)],
+    flights: Annotated[SingleFlight, Depends(get_receipt_flights)],
     max_characters: int = Query(30, ge=20),
 ):
-    receipt_service = ReceiptService(repo)
-    result = await receipt_service.get_receipt_by_id(receipt_id)
-    if not result:
+    async def load() -> str | None:
+        async with open_repository() as repo:
+            receipt_service = ReceiptService(repo.for_receipt(receipt_id))
+            return await receipt_service.get_receipt_text(receipt_id, max_characters)
+
+    receipt_text = await flights.do(("text", receipt_id, max_characters), load)
+    if receipt_text is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Receipt not found"
         )
 
-    receipt_text = generate_receipt_text(result, max_characters)
-
     return Response(content=receipt_text, media_type="text/plain")
@@ -0,0 +1,53 @@
+"""
+Rebuild the per-day product sales counters and the per-user receipt counts
+from existing receipts.
+
+    python -m cli.backfill_product_stats [--user-id ID]
+"""
+
+import argparse
+import asyncio
+import logging
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from config import load_config
+from database.repo.requests import RequestsRepo
+from database.sharding import shard_of
+
+log = logging.getLogger(__name__)
+
+
+async def backfill(user_id: int | None):
+    config = load_config()
+    hosts = config.db.get_shard_hosts()
+    if user_id is not None:
+        hosts = [hosts[shard_of(user_id) % len(hosts)]]
+
+    for host in hosts:
+        engine = create_async_engine(config.db.get_connection_string(host))
+        session_pool = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with session_pool() as session:
+            repo = RequestsRepo(session)
+            rows = await repo.analytics.rebuild_product_stats(user_id=user_id)
+            counts = await repo.analytics.rebuild_receipt_counts(user_id=user_id)
+            await session.commit()
+
+        await engine.dispose()
+        log.info(
+            "Rebuilt %s product stats rows, %s receipt counts on %s", rows, counts, host
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--user-id", type=int, help="only rebuild this user's stats")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(backfill(args.user_id))
+
+
+if __name__ == "__main__":
+    main()
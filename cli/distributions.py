@@ -0,0 +1,33 @@
+import random
+
+
+def parse_distribution(spec: str):
+    """
+    Parse an item-count distribution into a sampler taking a `random.Random`.
+
+    - `5` - always five items;
+    - `1-20` - uniform between 1 and 20;
+    - `lognormal:2.0,0.8` - log-normal with mu 2.0 and sigma 0.8, at least one.
+    """
+    kind, _, params = spec.partition(":")
+    if kind == "lognormal":
+        mu, sigma = (float(value) for value in params.split(","))
+        return lambda rng: max(1, round(rng.lognormvariate(mu, sigma)))
+
+    low, _, high = spec.partition("-")
+    low, high = int(low), int(high or low)
+    if low < 1 or high < low:
+        raise ValueError(f"Invalid item count range: {spec}")
+    return lambda rng: rng.randint(low, high)
+
+
+PRODUCT_KINDS = ["Молоко", "Хліб", "Кава", "Сир", "Вода", "Cookies", "Juice", "Tea"]
+PRODUCT_BRANDS = ["Галичина", "Київхліб", "Lavazza", "Моршинська", "Premium", "Eco"]
+
+
+def product_name(rng: random.Random, catalog_size: int) -> str:
+    # Few names are popular, most are rare, like in a real shop
+    number = min(int(rng.paretovariate(1.2)), catalog_size)
+    kind = PRODUCT_KINDS[number % len(PRODUCT_KINDS)]
+    brand = PRODUCT_BRANDS[number % len(PRODUCT_BRANDS)]
+    return f"{kind} {brand} #{number}"
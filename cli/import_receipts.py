@@ -0,0 +1,376 @@
+"""
+Import historical receipts from a CSV or NDJSON file.
+
+    python -m cli.import_receipts receipts.ndjson --username merchant
+
+NDJSON files hold one receipt per line, in the `POST /receipts/` request format
+plus `created_at`. CSV files hold one item per row with the columns `receipt`,
+`created_at`, `payment_type`, `payment_amount`, `comment`, `name`, `price` and
+`quantity`; consecutive rows with the same `receipt` form one receipt.
+
+Records are validated in a pool of worker processes and written with COPY in
+chunks. Every chunk commits together with the byte offset it reaches, stored in
+`receiptimports` under the user and the file path, so an interrupted import
+resumes where it stopped without importing a receipt twice; `--restart` imports
+the file again. Invalid records, including lines that are not UTF-8, are logged
+and skipped.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import asyncpg
+
+from api.models import CreateReceiptRequest
+from cli.backfill_product_stats import backfill
+from cli.seed import allocate_ids, get_product_ids
+from config import load_config
+from database.sharding import shard_of
+from services import money
+from services.cache import ReceiptsCache, RedisCacheBackend
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2_000
+
+
+class ImportedReceipt(CreateReceiptRequest):
+    created_at: datetime
+
+
+def read_ndjson(file, offset: int):
+    """
+    Yield `(start, end, line)` for every non-empty line after `offset`.
+    """
+    file.seek(offset)
+    for line in file:
+        start, offset = offset, offset + len(line)
+        if line.strip():
+            yield start, offset, line
+
+
+def read_csv(file, offset: int):
+    """
+    Yield `(start, end, rows)` for every receipt after `offset`, where `rows` are
+    the receipt's item rows as dicts.
+    """
+    # Bytes that are not UTF-8 are kept as surrogates, and the records holding
+    # them are rejected by `parse_chunk`
+    header_line = file.readline()
+    header = next(csv.reader([header_line.decode("utf-8-sig", "surrogateescape")]))
+    position = max(offset, len(header_line))
+    file.seek(position)
+
+    def lines():
+        nonlocal position
+        for line in file:
+            position += len(line)
+            yield line.decode(errors="surrogateescape")
+
+    rows, start, receipt = [], position, None
+    row_start = position
+    for row in csv.reader(lines()):
+        if row:
+            values = dict(zip(header, row))
+            if rows and values.get("receipt") != receipt:
+                yield start, row_start, rows
+                rows, start = [], row_start
+            receipt = values.get("receipt")
+            rows.append(values)
+        row_start = position
+    if rows:
+        yield start, position, rows
+
+
+def read_chunks(records, size: int):
+    """
+    Group records into lists of `(start, record)`, yielded with the end offset
+    of the last record.
+    """
+    chunk = []
+    for start, end, record in records:
+        chunk.append((start, record))
+        if len(chunk) == size:
+            yield end, chunk
+            chunk = []
+    if chunk:
+        yield end, chunk
+
+
+def from_csv_rows(rows: list[dict]) -> dict:
+    for row in rows:
+        for value in row.values():
+            # Raises UnicodeEncodeError on the surrogates left by `read_csv`
+            value.encode()
+    first = rows[0]
+    return {
+        "created_at": first.get("created_at"),
+        "comment": first.get("comment") or None,
+        "payment": {
+            "type": first.get("payment_type"),
+            "amount": first.get("payment_amount"),
+        },
+        "products": [
+            {
+                "name": row.get("name"),
+                "price": row.get("price"),
+                "quantity": row.get("quantity"),
+            }
+            for row in rows
+        ],
+    }
+
+
+def prepare_receipt(receipt: ImportedReceipt) -> tuple:
+    items = []
+    total = 0
+    for product in receipt.products:
+        line_total = money.line_total(
+            money.to_kopecks(product.price), money.to_milli(product.quantity)
+        )
+        total += line_total
+        items.append(
+            (
+                product.name,
+                product.price,
+                product.quantity,
+                money.from_kopecks(line_total),
+            )
+        )
+
+    rest = money.to_kopecks(receipt.payment.amount) - total
+    if rest < 0:
+        raise ValueError("Not enough money")
+
+    created_at = receipt.created_at
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (
+        created_at,
+        money.from_kopecks(total),
+        money.from_kopecks(rest),
+        receipt.comment,
+        receipt.payment.type.name,
+        receipt.payment.amount,
+        items,
+    )
+
+
+def parse_chunk(chunk: list[tuple[int, bytes | list[dict]]]):
+    """
+    Validate a chunk in a worker process. Returns the prepared receipts and the
+    `(offset, error)` of every rejected record.
+    """
+    receipts, errors = [], []
+    for start, record in chunk:
+        try:
+            if isinstance(record, bytes):
+                data = json.loads(record)
+            else:
+                data = from_csv_rows(record)
+            receipts.append(prepare_receipt(ImportedReceipt.model_validate(data)))
+        except ValueError as error:
+            errors.append((start, str(error)))
+    return receipts, errors
+
+
+async def load_receipts(connection: asyncpg.Connection, user_id: int, receipts):
+    """
+    Write prepared receipts with COPY, in the transaction of the caller.
+    """
+    receipt_ids = await allocate_ids(
+        connection, "receipts_receipt_id_seq", len(receipts)
+    )
+    product_ids = await get_product_ids(
+        connection, {item[0] for receipt in receipts for item in receipt[6]}
+    )
+
+    await connection.copy_records_to_table(
+        "receipts",
+        records=[
+            (receipt_id, user_id, total, rest, comment, created_at)
+            for receipt_id, (created_at, total, rest, comment, *_) in zip(
+                receipt_ids, receipts
+            )
+        ],
+        columns=["receipt_id", "user_id", "total", "rest", "comment", "created_at"],
+    )
+    await connection.copy_records_to_table(
+        "payments",
+        records=[
+            (receipt_id, payment_type, amount, created_at)
+            for receipt_id, (created_at, *_, payment_type, amount, _) in zip(
+                receipt_ids, receipts
+            )
+        ],
+        columns=["receipt_id", "type", "amount", "created_at"],
+    )
+    await connection.copy_records_to_table(
+        "receiptitems",
+        records=[
+            (receipt_id, product_ids[name], price, quantity, total)
+            for receipt_id, receipt in zip(receipt_ids, receipts)
+            for name, price, quantity, total in receipt[6]
+        ],
+        columns=[
+            "receipt_id",
+            "product_id",
+            "price_per_unit",
+            "quantity",
+            "total_price",
+        ],
+    )
+
+
+async def load_position(
+    connection: asyncpg.Connection, user_id: int, source: str
+) -> int:
+    position = await connection.fetchval(
+        "SELECT position FROM receiptimports WHERE user_id = $1 AND source = $2",
+        user_id,
+        source,
+    )
+    return position or 0
+
+
+async def save_progress(
+    connection: asyncpg.Connection,
+    user_id: int,
+    source: str,
+    position: int,
+    imported: int,
+    rejected: int,
+) -> tuple[int, int]:
+    """
+    Move the progress of `source` to `position`, adding to its counters. Returns
+    the receipts imported and rejected so far.
+    """
+    row = await connection.fetchrow(
+        """
+        INSERT INTO receiptimports (user_id, source, position, imported, rejected)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT (user_id, source) DO UPDATE SET
+            position = excluded.position,
+            imported = receiptimports.imported + excluded.imported,
+            rejected = receiptimports.rejected + excluded.rejected
+        RETURNING imported, rejected
+        """,
+        user_id,
+        source,
+        position,
+        imported,
+        rejected,
+    )
+    return tuple(row)
+
+
+async def import_file(args):
+    config = load_config()
+    path = Path(args.file)
+    file_format = args.format or ("csv" if path.suffix == ".csv" else "ndjson")
+    source = args.source or str(path.resolve())
+
+    # Receipts go to the shard of their user, see `database.sharding`
+    hosts = config.db.get_shard_hosts()
+    connection = await asyncpg.connect(config.db.get_dsn())
+    user_id = await connection.fetchval(
+        "SELECT user_id FROM usernames WHERE username = $1", args.username
+    )
+    if user_id is not None and shard_of(user_id) != 0:
+        await connection.close()
+        host = hosts[shard_of(user_id) % len(hosts)]
+        connection = await asyncpg.connect(config.db.get_dsn(host))
+    user_id = await connection.fetchval(
+        "SELECT user_id FROM users WHERE username = $1", args.username
+    )
+    if user_id is None:
+        await connection.close()
+        raise SystemExit(f"User {args.username} does not exist")
+
+    if args.restart:
+        await connection.execute(
+            "DELETE FROM receiptimports WHERE user_id = $1 AND source = $2",
+            user_id,
+            source,
+        )
+    position = await load_position(connection, user_id, source)
+    if position:
+        log.info("Resuming from byte %s", position)
+
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    imported = 0
+
+    async def load(end: int, parsed):
+        nonlocal imported
+        receipts, errors = await parsed
+        for offset, error in errors:
+            log.warning("Skipped the record at byte %s: %s", offset, error)
+        # The progress commits with the receipts, so a crash never loses or
+        # repeats a chunk
+        async with connection.transaction():
+            if receipts:
+                await load_receipts(connection, user_id, receipts)
+            total_imported, total_rejected = await save_progress(
+                connection, user_id, source, end, len(receipts), len(errors)
+            )
+        imported += len(receipts)
+        log.info("Imported %s receipts, rejected %s", total_imported, total_rejected)
+
+    # Chunks are loaded in file order, so the progress never skips past a chunk
+    # that is not in the database yet. At most two chunks per worker are
+    # in flight, which bounds memory use regardless of the file size.
+    with open(path, "rb") as file, ProcessPoolExecutor(args.workers) as pool:
+        reader = read_csv if file_format == "csv" else read_ndjson
+        pending = deque()
+        for end, chunk in read_chunks(reader(file, position), args.chunk_size):
+            pending.append((end, loop.run_in_executor(pool, parse_chunk, chunk)))
+            if len(pending) >= args.workers * 2:
+                await load(*pending.popleft())
+        while pending:
+            await load(*pending.popleft())
+
+    if imported:
+        await connection.execute("ANALYZE receipts, payments, receiptitems")
+    await connection.close()
+
+    if imported:
+        await backfill(user_id)
+        if config.cache.cache_backend == "redis":
+            backend = RedisCacheBackend.from_url(config.cache.cache_redis_url)
+            await ReceiptsCache(backend).invalidate(user_id)
+
+    elapsed = time.monotonic() - started
+    log.info("Done in %.1fs: %s receipts/s", elapsed, round(imported / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file")
+    parser.add_argument("--username", required=True, help="owner of the receipts")
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    parser.add_argument(
+        "--source", help="key of the import progress, defaults to the file path"
+    )
+    parser.add_argument(
+        "--restart", action="store_true", help="import the file from the start"
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(import_file(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Generate a mixed workload against a running API and report latencies.
+
+    python -m cli.loadtest --base-url http://localhost:8000 --duration 60
+
+Each virtual user signs up (or logs in as a user made by `cli.seed`) and then
+loops over weighted operations until the time is up. Throughput and p50 / p95
+/ p99 latencies are reported per endpoint.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import httpx
+
+from cli.distributions import parse_distribution, product_name
+
+DEFAULT_MIX = "create=20,list=50,show=20,login=10"
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self, elapsed: float) -> str:
+        lines = [
+            f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'rps':>8}"
+            f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        ]
+        for name in sorted(self.latencies):
+            latencies = self.latencies[name]
+            if len(latencies) > 1:
+                percentiles = statistics.quantiles(latencies, n=100)
+            else:
+                percentiles = latencies * 99
+            lines.append(
+                f"{name:<10} {len(latencies):>9} {self.errors[name]:>7}"
+                f" {len(latencies) / elapsed:>8.1f}"
+                + "".join(f" {percentiles[p - 1] * 1000:>8.1f}" for p in (50, 95, 99))
+            )
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        lines.append(f"\n{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} rps")
+        return "\n".join(lines)
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, stats: Stats, args, number: int):
+        self.client = client
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(args.seed * 100_000 + number)
+        self.sample_items = parse_distribution(args.items)
+        self.username = f"{args.prefix}-{number}"
+        self.token = None
+        self.receipt_ids: list[int] = []
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        if self.token:
+            kwargs.setdefault("headers", {})["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(name, time.perf_counter() - started, False)
+            return None
+        self.stats.record(
+            name, time.perf_counter() - started, response.status_code < 500
+        )
+        return response
+
+    async def signup(self):
+        response = await self.request(
+            "signup",
+            "POST",
+            "/api/v1/signup",
+            json={
+                "username": self.username,
+                "password": self.args.password,
+                "full_name": f"Load Test {self.username}",
+            },
+        )
+        if response is not None and response.status_code == 200:
+            self.token = response.json()["access_token"]
+
+    async def login(self):
+        response = await self.request(
+            "login",
+            "GET",
+            "/api/v1/token",
+            params={"username": self.username, "password": self.args.password},
+        )
+        if response is not None and response.status_code == 200:
+            self.token = response.json()["access_token"]
+
+    async def create(self):
+        products = [
+            {
+                "name": product_name(self.rng, self.args.catalog),
+                "price": str(Decimal(self.rng.randint(100, 50_000)).scaleb(-2)),
+                "quantity": str(self.rng.choice([1, 2, 3, 0.5, 1.25])),
+            }
+            for _ in range(self.sample_items(self.rng))
+        ]
+        response = await self.request(
+            "create",
+            "POST",
+            "/api/v1/receipts/",
+            json={
+                "products": products,
+                "payment": {"type": "card", "amount": "10000000.00"},
+            },
+        )
+        if response is not None and response.status_code == 201:
+            self.receipt_ids.append(response.json()["receipt_id"])
+
+    async def list(self):
+        params = {"limit": self.rng.choice([10, 10, 20, 50])}
+        if self.rng.random() < 0.3:
+            params["payment_type"] = self.rng.choice(["cash", "card"])
+        if self.rng.random() < 0.3:
+            params["min_total"] = self.rng.choice([10, 100, 1000])
+        if self.rng.random() < 0.2:
+            params["offset"] = self.rng.choice([10, 20, 50])
+        await self.request("list", "GET", "/api/v1/receipts/", params=params)
+
+    async def show(self):
+        if not self.receipt_ids:
+            return await self.create()
+        receipt_id = self.rng.choice(self.receipt_ids)
+        if self.rng.random() < 0.5:
+            await self.request("get", "GET", f"/api/v1/receipts/{receipt_id}")
+        else:
+            await self.request("show", "GET", f"/api/v1/receipts/show/{receipt_id}/")
+
+    async def run(self, deadline: float, mix: dict[str, int]):
+        await self.signup()
+        operations = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.monotonic() < deadline:
+            await self.rng.choices(operations, weights)[0]()
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("create", "list", "show", "login"):
+            raise ValueError(f"Unknown operation: {name}")
+        mix[name] = int(weight)
+    return mix
+
+
+async def run(args):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        users = [
+            VirtualUser(client, stats, args, number)
+            for number in range(1, args.concurrency + 1)
+        ]
+        started = time.monotonic()
+        await asyncio.gather(
+            *(user.run(started + args.duration, parse_mix(args.mix)) for user in users)
+        )
+        elapsed = time.monotonic() - started
+
+    print(stats.report(elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    parser.add_argument(
+        "--items", default="lognormal:1.5,0.8", help="items per created receipt"
+    )
+    parser.add_argument("--catalog", type=int, default=5_000, help="product names")
+    parser.add_argument("--prefix", default="loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Publish outbox events to downstream systems.
+
+    python -m cli.outbox_relay run [--sink ndjson|http] [--metrics-port 9100]
+    python -m cli.outbox_relay receive [--port 8081]
+
+`run` relays events of every shard until stopped, see `services.outbox`. Start
+as many relays as needed: they claim disjoint batches. With `--metrics-port`
+the relay serves its counters in the Prometheus text format on that port.
+
+`receive` is a local stand-in for an HTTP consumer: it accepts the batches of
+the `http` sink and logs them.
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import random
+import signal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from config import OutboxConfig, load_config
+from services.metrics import Metrics
+from services.outbox import HttpSink, NdjsonSink, OutboxRelay, Sink
+
+log = logging.getLogger(__name__)
+
+
+def relay_metrics(relay: OutboxRelay) -> Metrics:
+    metrics = Metrics()
+    metrics.register(
+        "outbox_batches_total",
+        "counter",
+        "Batches of outbox events published",
+        lambda: relay.batches,
+    )
+    metrics.register(
+        "outbox_events_published_total",
+        "counter",
+        "Outbox events published",
+        lambda: relay.published,
+    )
+    metrics.register(
+        "outbox_publish_failures_total",
+        "counter",
+        "Batches the sink failed to publish, retried later",
+        lambda: relay.failures,
+    )
+    metrics.register(
+        "outbox_last_batch_size",
+        "gauge",
+        "Events in the last published batch",
+        lambda: relay.last_batch_size,
+    )
+    metrics.register(
+        "outbox_event_latency_seconds_sum",
+        "counter",
+        "Seconds from the commit of published events until their publishing",
+        lambda: relay.latency_sum,
+    )
+    metrics.register(
+        "outbox_last_event_latency_seconds",
+        "gauge",
+        "Longest latency of an event in the last published batch",
+        lambda: relay.last_latency,
+    )
+    metrics.register(
+        "outbox_publish_seconds_sum",
+        "counter",
+        "Seconds spent publishing batches",
+        lambda: relay.publish_seconds,
+    )
+    return metrics
+
+
+async def serve_metrics(metrics: Metrics, port: int) -> asyncio.Server:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Every request gets the metrics, whatever its path
+        await reader.readuntil(b"\r\n\r\n")
+        body = metrics.render().encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/plain; version=0.0.4\r\n"
+            b"Content-Length: %d\r\n"
+            b"Connection: close\r\n\r\n" % len(body) + body
+        )
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, port=port)
+
+
+def make_sink(config: OutboxConfig) -> Sink:
+    if config.outbox_sink == "http":
+        return HttpSink(config.outbox_http_url, timeout=config.outbox_http_timeout)
+    return NdjsonSink(
+        Path(config.outbox_directory), max_bytes=config.outbox_file_max_bytes
+    )
+
+
+async def run(args):
+    config = load_config()
+    if args.sink:
+        config.outbox.outbox_sink = args.sink
+
+    engines = [
+        create_async_engine(config.db.get_connection_string(host))
+        for host in config.db.get_shard_hosts()
+    ]
+    sink = make_sink(config.outbox)
+    relay = OutboxRelay(
+        [async_sessionmaker(engine, expire_on_commit=False) for engine in engines],
+        sink,
+        batch_size=config.outbox.outbox_batch_size,
+        retry_delay=datetime.timedelta(seconds=config.outbox.outbox_retry_delay),
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    server = None
+    if args.metrics_port:
+        server = await serve_metrics(relay_metrics(relay), args.metrics_port)
+
+    log.info(
+        "Relaying outbox events of %s shards to the %s sink",
+        len(engines),
+        config.outbox.outbox_sink,
+    )
+    await relay.run(config.outbox.outbox_poll_interval, stop)
+
+    if server is not None:
+        server.close()
+    await sink.close()
+    for engine in engines:
+        await engine.dispose()
+    log.info("Published %s events in %s batches", relay.published, relay.batches)
+
+
+class ReceiveHandler(BaseHTTPRequestHandler):
+    fail_rate = 0.0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Failed batches exercise the retries of the relay
+        if random.random() < self.fail_rate:
+            self.send_response(503)
+            self.end_headers()
+            return
+        self.received(body)
+        self.send_response(204)
+        self.end_headers()
+
+    def received(self, body: bytes):
+        log.info("Received %s events", body.count(b"\n"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def receive(args):
+    ReceiveHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer(("", args.port), ReceiveHandler)
+    log.info("Receiving outbox events on port %s", args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="relay outbox events")
+    run_parser.add_argument(
+        "--sink", choices=["ndjson", "http"], help="overrides OUTBOX_SINK"
+    )
+    run_parser.add_argument(
+        "--metrics-port", type=int, help="serve Prometheus metrics on this port"
+    )
+
+    receive_parser = commands.add_parser("receive", help="stand-in HTTP consumer")
+    receive_parser.add_argument("--port", type=int, default=8081)
+    receive_parser.add_argument(
+        "--fail-rate", type=float, default=0.0, help="share of batches to refuse"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        receive(args)
+
+
+if __name__ == "__main__":
+    main()
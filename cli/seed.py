@@ -0,0 +1,222 @@
+"""
+Fill the database with synthetic users and receipts for benchmarking.
+
+    python -m cli.seed --users 100 --receipts 1000 --items lognormal:1.5,0.8
+
+Users are named `<prefix>-<n>` and share the password given with
+`--password`, so `cli.loadtest` can log in as them. Rows are written with
+COPY in batches, so memory use does not depend on the amount of data. All
+data goes to DB_HOST, shard 0 when sharded.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import asyncpg
+
+from cli.distributions import parse_distribution, product_name
+from config import load_config
+from services import money
+from services.auth import get_password_hash
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 5_000
+
+
+async def allocate_ids(connection: asyncpg.Connection, sequence: str, count: int):
+    rows = await connection.fetch(
+        "SELECT nextval($1::regclass) FROM generate_series(1, $2)", sequence, count
+    )
+    return [row[0] for row in rows]
+
+
+async def get_product_ids(connection: asyncpg.Connection, names: set[str]):
+    await connection.execute(
+        "INSERT INTO products (name) SELECT unnest($1::text[]) "
+        "ON CONFLICT (name) DO NOTHING",
+        list(names),
+    )
+    rows = await connection.fetch(
+        "SELECT name, product_id FROM products WHERE name = ANY($1::text[])",
+        list(names),
+    )
+    return dict(rows)
+
+
+async def seed_users(
+    connection: asyncpg.Connection, prefix: str, count: int, password: str
+) -> list[int]:
+    password_hash = get_password_hash(password)
+    rows = await connection.fetch(
+        """
+        INSERT INTO users (full_name, username, password_hash)
+        SELECT 'Load Test ' || n, $1 || '-' || n, $2 FROM generate_series(1, $3) n
+        ON CONFLICT (username) DO UPDATE SET password_hash = excluded.password_hash
+        RETURNING user_id
+        """,
+        prefix,
+        password_hash,
+        count,
+    )
+    return [row["user_id"] for row in rows]
+
+
+async def seed_receipts(
+    connection: asyncpg.Connection,
+    user_ids: list[int],
+    count: int,
+    sample_items,
+    days: int,
+    rng: random.Random,
+    catalog_size: int,
+):
+    now = datetime.now(timezone.utc)
+    receipt_ids = await allocate_ids(connection, "receipts_receipt_id_seq", count)
+    receipts, payments, items = [], [], []
+    for receipt_id in receipt_ids:
+        created_at = now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+        products = []
+        total = 0
+        for _ in range(sample_items(rng)):
+            price = rng.randint(100, 50_000)
+            quantity = rng.choice([1000, 2000, 3000, rng.randint(1, 5000)])
+            line_total = money.line_total(price, quantity)
+            total += line_total
+            products.append(
+                (product_name(rng, catalog_size), price, quantity, line_total)
+            )
+
+        payment_type = rng.choice(["CASH", "CARD"])
+        paid = total if payment_type == "CARD" else -(-total // 10_000) * 10_000
+        receipts.append(
+            (
+                receipt_id,
+                rng.choice(user_ids),
+                money.from_kopecks(total),
+                money.from_kopecks(paid - total),
+                rng.choice([None, None, None, "Доставка", "Знижка"]),
+                created_at,
+            )
+        )
+        payments.append(
+            (receipt_id, payment_type, money.from_kopecks(paid), created_at)
+        )
+        items.extend((receipt_id, *product) for product in products)
+
+    product_ids = await get_product_ids(connection, {item[1] for item in items})
+
+    async with connection.transaction():
+        await connection.copy_records_to_table(
+            "receipts",
+            records=receipts,
+            columns=["receipt_id", "user_id", "total", "rest", "comment", "created_at"],
+        )
+        await connection.copy_records_to_table(
+            "payments",
+            records=payments,
+            columns=["receipt_id", "type", "amount", "created_at"],
+        )
+        await connection.copy_records_to_table(
+            "receiptitems",
+            records=[
+                (
+                    receipt_id,
+                    product_ids[name],
+                    money.from_kopecks(price),
+                    Decimal(quantity).scaleb(-3),
+                    money.from_kopecks(line_total),
+                )
+                for receipt_id, name, price, quantity, line_total in items
+            ],
+            columns=[
+                "receipt_id",
+                "product_id",
+                "price_per_unit",
+                "quantity",
+                "total_price",
+            ],
+        )
+    return len(items)
+
+
+async def seed(args):
+    config = load_config()
+    connection = await asyncpg.connect(config.db.get_dsn())
+    rng = random.Random(args.seed)
+    sample_items = parse_distribution(args.items)
+
+    started = time.monotonic()
+    user_ids = await seed_users(connection, args.prefix, args.users, args.password)
+    log.info("Seeded %s users", len(user_ids))
+
+    receipts_left = args.users * args.receipts
+    receipts_done = items_done = 0
+    while receipts_left > 0:
+        batch = min(BATCH_SIZE, receipts_left)
+        items_done += await seed_receipts(
+            connection, user_ids, batch, sample_items, args.days, rng, args.catalog
+        )
+        receipts_left -= batch
+        receipts_done += batch
+        log.info("Seeded %s receipts, %s items", receipts_done, items_done)
+
+    log.info("Rebuilding product stats and receipt counts")
+    await connection.execute(
+        """
+        INSERT INTO productdailystats
+            (user_id, day, product_id, quantity, revenue, receipts_count)
+        SELECT r.user_id, (r.created_at AT TIME ZONE 'UTC')::date, i.product_id,
+               sum(i.quantity), sum(i.total_price), count(DISTINCT r.receipt_id)
+        FROM receipts r JOIN receiptitems i ON i.receipt_id = r.receipt_id
+        WHERE r.user_id = ANY($1::bigint[])
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, day, product_id) DO UPDATE SET
+            quantity = excluded.quantity,
+            revenue = excluded.revenue,
+            receipts_count = excluded.receipts_count
+        """,
+        user_ids,
+    )
+    await connection.execute(
+        """
+        INSERT INTO userreceiptcounts (user_id, receipts_count)
+        SELECT user_id, count(*) FROM receipts
+        WHERE user_id = ANY($1::bigint[])
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET receipts_count = excluded.receipts_count
+        """,
+        user_ids,
+    )
+    await connection.execute("ANALYZE")
+    await connection.close()
+
+    elapsed = time.monotonic() - started
+    log.info("Done in %.1fs: %s receipts/s", elapsed, round(receipts_done / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--receipts", type=int, default=100, help="per user")
+    parser.add_argument(
+        "--items", default="lognormal:1.5,0.8", help="items per receipt"
+    )
+    parser.add_argument("--days", type=int, default=90, help="spread receipts over")
+    parser.add_argument("--catalog", type=int, default=5_000, help="product names")
+    parser.add_argument("--prefix", default="loadtest")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(seed(args))
+
+
+if __name__ == "__main__":
+    main()
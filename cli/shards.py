@@ -0,0 +1,83 @@
+"""
+Set up the shard databases listed in DB_HOST and DB_SHARD_HOSTS.
+
+    python -m cli.shards migrate
+    python -m cli.shards prepare
+
+`migrate` runs the Alembic migrations on every shard. `prepare` limits the ID
+sequences of every shard to the shard's own range (see `database.sharding`).
+Both are safe to run again, for example after adding a shard.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+
+import asyncpg
+
+from config import load_config
+from database.sharding import first_id, last_id
+
+log = logging.getLogger(__name__)
+
+SHARDED_SEQUENCES = [
+    "users_user_id_seq",
+    "receipts_receipt_id_seq",
+    "outboxevents_event_id_seq",
+]
+
+
+def migrate(hosts: list[str]):
+    for shard, host in enumerate(hosts):
+        log.info("Migrating shard %s at %s", shard, host)
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            env={**os.environ, "DB_HOST": host},
+            check=True,
+        )
+
+
+async def prepare_shard(dsn: str, shard: int):
+    connection = await asyncpg.connect(dsn)
+    start, end = first_id(shard), last_id(shard)
+    for sequence in SHARDED_SEQUENCES:
+        last_value = await connection.fetchval(
+            "SELECT last_value FROM pg_sequences WHERE sequencename = $1", sequence
+        )
+        restart = ""
+        if last_value is None or last_value < start:
+            restart = f" RESTART WITH {start}"
+        elif last_value > end:
+            raise SystemExit(f"{sequence} of shard {shard} is past its ID range")
+        await connection.execute(
+            f"ALTER SEQUENCE {sequence}"
+            f" MINVALUE {start} MAXVALUE {end} START WITH {start}{restart}"
+        )
+        log.info("Shard %s: %s limited to %s..%s", shard, sequence, start, end)
+    await connection.close()
+
+
+async def prepare(dsns: list[str]):
+    for shard, dsn in enumerate(dsns):
+        await prepare_shard(dsn, shard)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["migrate", "prepare"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = load_config()
+    hosts = config.db.get_shard_hosts()
+    if args.command == "migrate":
+        migrate(hosts)
+    else:
+        asyncio.run(prepare([config.db.get_dsn(host) for host in hosts]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,27 @@
 from dataclasses import dataclass
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class DBConfig(BaseSettings):
+    # "memory" keeps all data in the process, for tests and profiling only
+    db_backend: Literal["postgres", "memory"] = "postgres"
     postgres_user: str
     postgres_password: str
     postgres_db: str
     db_host: str
+    # Hosts of shards 1, 2, ...; DB_HOST is shard 0, see `database.sharding`
+    db_shard_hosts: list[str] = []
+
+    def get_connection_string(self, host: str | None = None):
+        return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{host or self.db_host}/{self.postgres_db}"
 
-    def get_connection_string(self):
-        return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.db_host}/{self.postgres_db}"
+    def get_dsn(self, host: str | None = None):
+        return f"postgresql://{self.postgres_user}:{self.postgres_password}@{host or self.db_host}/{self.postgres_db}"
+
+    def get_shard_hosts(self) -> list[str]:
+        return [self.db_host, *self.db_shard_hosts]
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
@@ -26,11 +38,144 @@ class ApiConfig(BaseSettings):
     )
 
 
+class CompressionConfig(BaseSettings):
+    compression_minimum_size: int = 1000
+    compression_gzip_level: int = 6
+    compression_brotli_level: int = 4
+    compression_zstd_level: int = 3
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class CacheConfig(BaseSettings):
+    cache_backend: Literal["memory", "redis"] = "memory"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_ttl: int = 300
+    cache_max_entries: int = 10_000
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class ReceiptTextConfig(BaseSettings):
+    # Line widths rendered when a receipt is created, empty to render on read only
+    receipt_text_widths: list[int] = [30]
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class FeedConfig(BaseSettings):
+    # Events buffered per subscriber before a slow client is disconnected
+    feed_queue_size: int = 100
+    feed_keepalive: float = 15
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class CountConfig(BaseSettings):
+    # Seconds an `exact=true` receipt count may take before the estimate is sent
+    count_exact_timeout: float = 1.0
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class DeadlineConfig(BaseSettings):
+    # Seconds the database queries of a request may take, by route name
+    deadline_default: float = 10
+    deadline_routes: dict[str, float] = {
+        "get_receipts_report": 30,
+        "create_streamed_receipt": 60,
+    }
+    # Longest deadline a client may ask for with the X-Request-Timeout header
+    deadline_max: float = 60
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class ReportsConfig(BaseSettings):
+    # Users whose receipt snapshots are kept in memory, per worker
+    reports_max_users: int = 100
+    # Seconds before a snapshot is read again in full
+    reports_max_age: float = 3600
+    # Seconds after which a receipt is expected to be committed
+    reports_settle_seconds: int = 60
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class OutboxConfig(BaseSettings):
+    # Where `cli.outbox_relay` publishes events: NDJSON files or an HTTP endpoint
+    outbox_sink: Literal["ndjson", "http"] = "ndjson"
+    outbox_directory: str = "outbox"
+    # Size after which the NDJSON sink starts a new file
+    outbox_file_max_bytes: int = 64 * 1024 * 1024
+    outbox_http_url: str = "http://localhost:8081/events"
+    outbox_http_timeout: float = 10
+    # Events published at once, seconds between polls when none are due, and
+    # seconds before a batch that failed to publish is retried
+    outbox_batch_size: int = 500
+    outbox_poll_interval: float = 1.0
+    outbox_retry_delay: float = 30
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
+class SpoolConfig(BaseSettings):
+    # Accept new receipts into a local spool while the database is unreachable
+    spool_enabled: bool = False
+    spool_directory: str = "spool"
+    spool_segment_bytes: int = 16 * 1024 * 1024
+    # Receipts replayed per transaction, and seconds between replay attempts
+    # while the database is still unavailable
+    spool_replay_batch: int = 200
+    spool_retry_interval: float = 5.0
+
+    model_config = SettingsConfigDict(
+        env_file=".env", env_file_encoding="utf-8", extra="ignore"
+    )
+
+
 @dataclass
 class Config:
     db: DBConfig
     api: ApiConfig
+    compression: CompressionConfig
+    cache: CacheConfig
+    receipt_text: ReceiptTextConfig
+    feed: FeedConfig
+    reports: ReportsConfig
+    count: CountConfig
+    deadline: DeadlineConfig
+    outbox: OutboxConfig
+    spool: SpoolConfig
 
 
 def load_config():
-    return Config(db=DBConfig(), api=ApiConfig())  # type: ignore
+    return Config(
+        db=DBConfig(),  # type: ignore
+        api=ApiConfig(),  # type: ignore
+        compression=CompressionConfig(),
+        cache=CacheConfig(),
+        receipt_text=ReceiptTextConfig(),
+        feed=FeedConfig(),
+        reports=ReportsConfig(),
+        count=CountConfig(),
+        deadline=DeadlineConfig(),
+        outbox=OutboxConfig(),
+        spool=SpoolConfig(),
+    )
@@ -0,0 +1,98 @@
+"""
+Request deadlines enforced on database queries.
+
+Every statement of a session with a deadline runs under a local
+`statement_timeout` of the time left until the deadline, so a query of a
+request that ran out of time is cancelled by Postgres instead of holding its
+connection, however many queries came before it. The timeout is local to the
+transaction and never outlives it on the pooled connection.
+"""
+
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.exceptions import DeadlineExceeded
+
+# SQLSTATE of a statement cancelled by `statement_timeout` or a cancel request
+QUERY_CANCELED = "57014"
+# Seconds a timeout is reused for by the next statements, which may run as much
+# past the deadline in exchange for a round trip less each
+REARM_INTERVAL = 0.01
+TRANSACTION_CONTROL = ("SAVEPOINT", "ROLLBACK", "RELEASE")
+
+
+def set_deadline(session: AsyncSession, deadline: float) -> None:
+    """
+    Limit the queries of `session` to `deadline`, in `time.monotonic()` time.
+    """
+    session.info["deadline"] = deadline
+
+    @event.listens_for(session.sync_session, "after_begin")
+    def limit_transaction(session, transaction, connection):
+        # The deadline the timeout was last set for, and when
+        armed = None
+
+        # Statements are cancelled `statement_timeout` after they start, so the
+        # timeout is set again as the deadline approaches
+        @event.listens_for(connection, "before_cursor_execute")
+        def limit_statement(conn, cursor, statement, parameters, context, many):
+            nonlocal armed
+            # After a failed statement nothing but the rollback may run
+            if statement.startswith(TRANSACTION_CONTROL):
+                return
+            # Lowered by `limit_time` for a while
+            deadline = session.info["deadline"]
+            now = time.monotonic()
+            if armed and armed[0] == deadline and now - armed[1] < REARM_INTERVAL:
+                return
+            left = deadline - now
+            if left <= 0:
+                raise DeadlineExceeded()
+            # 0 would disable the timeout
+            milliseconds = max(1, round(left * 1000))
+            cursor.execute(f"SET LOCAL statement_timeout = {milliseconds}")
+            armed = deadline, now
+
+
+@asynccontextmanager
+async def limit_time(session: AsyncSession, timeout: float):
+    """
+    Limit the queries in the block to `timeout` seconds, or to the deadline of
+    `session` when it comes first, and then raise DeadlineExceeded when they are
+    cancelled. The previous limit is restored after the block.
+    """
+    deadline = session.info.get("deadline")
+    limit = time.monotonic() + timeout
+    if deadline is None:
+        previous = await session.scalar(
+            select(func.current_setting("statement_timeout"))
+        )
+        # 0 would disable the timeout
+        milliseconds = max(1, round(timeout * 1000))
+        await session.execute(
+            select(func.set_config("statement_timeout", str(milliseconds), True))
+        )
+        yield
+        await session.execute(
+            select(func.set_config("statement_timeout", previous, True))
+        )
+        return
+
+    # Applied by `set_deadline` before every query
+    session.info["deadline"] = min(deadline, limit)
+    try:
+        yield
+    except DBAPIError as error:
+        if is_query_canceled(error) and deadline <= limit:
+            raise DeadlineExceeded() from error
+        raise
+    finally:
+        session.info["deadline"] = deadline
+
+
+def is_query_canceled(error: Exception) -> bool:
+    return getattr(getattr(error, "orig", None), "sqlstate", None) == QUERY_CANCELED
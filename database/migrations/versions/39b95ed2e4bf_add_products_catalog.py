@@ -0,0 +1,64 @@
+"""add products catalog
+
+Revision ID: 39b95ed2e4bf
+Revises: 2fbc40c76e47
+Create Date: 2026-10-19 17:05:10.333199
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '39b95ed2e4bf'
+down_revision: Union[str, None] = '2fbc40c76e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('products',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple', name)", persisted=True), nullable=False),
+    sa.PrimaryKeyConstraint('product_id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index(op.f('ix_products_product_id'), 'products', ['product_id'], unique=False)
+    op.create_index('ix_products_search_vector', 'products', ['search_vector'], unique=False, postgresql_using='gin')
+
+    op.add_column('receiptitems', sa.Column('product_id', sa.Integer(), nullable=True))
+    op.execute(
+        "INSERT INTO products (name) SELECT DISTINCT product_name FROM receiptitems"
+    )
+    op.execute(
+        "UPDATE receiptitems SET product_id = products.product_id "
+        "FROM products WHERE products.name = receiptitems.product_name"
+    )
+    op.alter_column('receiptitems', 'product_id', nullable=False)
+    op.create_index(op.f('ix_receiptitems_product_id'), 'receiptitems', ['product_id'], unique=False)
+    op.create_foreign_key('receiptitems_product_id_fkey', 'receiptitems', 'products', ['product_id'], ['product_id'])
+
+    op.drop_index('ix_receiptitems_search_vector', table_name='receiptitems', postgresql_using='gin')
+    op.drop_column('receiptitems', 'search_vector')
+    op.drop_column('receiptitems', 'product_name')
+
+
+def downgrade() -> None:
+    op.add_column('receiptitems', sa.Column('product_name', sa.VARCHAR(length=255), autoincrement=False, nullable=True))
+    op.execute(
+        "UPDATE receiptitems SET product_name = products.name "
+        "FROM products WHERE products.product_id = receiptitems.product_id"
+    )
+    op.alter_column('receiptitems', 'product_name', nullable=False)
+    op.add_column('receiptitems', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('simple', product_name)", persisted=True), nullable=False))
+    op.create_index('ix_receiptitems_search_vector', 'receiptitems', ['search_vector'], unique=False, postgresql_using='gin')
+
+    op.drop_constraint('receiptitems_product_id_fkey', 'receiptitems', type_='foreignkey')
+    op.drop_index(op.f('ix_receiptitems_product_id'), table_name='receiptitems')
+    op.drop_column('receiptitems', 'product_id')
+    op.drop_index('ix_products_search_vector', table_name='products', postgresql_using='gin')
+    op.drop_index(op.f('ix_products_product_id'), table_name='products')
+    op.drop_table('products')
@@ -1,11 +1,29 @@
+from .analytics import ProductDailyStat, UserReceiptCount
 from .base import Base
-from .receipts import Payment, Receipt, ReceiptItem
-from .users import User
+from .outbox import OutboxEvent
+from .products import Product
+from .receipts import (
+    Payment,
+    Receipt,
+    ReceiptImport,
+    ReceiptItem,
+    ReceiptText,
+    SpooledReceipt,
+)
+from .users import User, Username
 
 __all__ = [
     "Base",
     "User",
+    "Username",
     "Receipt",
     "ReceiptItem",
+    "ReceiptText",
+    "SpooledReceipt",
+    "ReceiptImport",
     "Payment",
+    "Product",
+    "ProductDailyStat",
+    "UserReceiptCount",
+    "OutboxEvent",
 ]
@@ -0,0 +1,30 @@
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import BIGINT, DECIMAL, Date, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.models.base import Base, TableNameMixin
+
+
+# Sales counters per user, UTC day and product, updated with every receipt
+class ProductDailyStat(Base, TableNameMixin):
+    user_id: Mapped[int] = mapped_column(
+        BIGINT, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.product_id"), primary_key=True
+    )
+
+    quantity: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
+    revenue: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
+    receipts_count: Mapped[int]
+
+
+# Receipts per user, updated with every receipt, for listing totals
+class UserReceiptCount(Base, TableNameMixin):
+    user_id: Mapped[int] = mapped_column(
+        BIGINT, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True
+    )
+    receipts_count: Mapped[int] = mapped_column(BIGINT)
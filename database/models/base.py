@@ -3,7 +3,7 @@ import datetime
 from sqlalchemy.orm import Mapped, declared_attr, mapped_column
 from sqlalchemy.orm.decl_api import DeclarativeBase
 from sqlalchemy.sql import func
-from sqlalchemy.sql.sqltypes import TIMESTAMP, Integer
+from sqlalchemy.sql.sqltypes import BIGINT, TIMESTAMP, Integer
 from typing_extensions import Annotated
 
 
@@ -27,3 +27,4 @@ class TableNameMixin:
 
 # Common column types
 int_pk = Annotated[int, mapped_column(Integer, primary_key=True, index=True)]
+bigint_pk = Annotated[int, mapped_column(BIGINT, primary_key=True, index=True)]
@@ -0,0 +1,22 @@
+import datetime
+
+from sqlalchemy import TIMESTAMP, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from database.models.base import Base, TableNameMixin, TimestampMixin, bigint_pk
+
+
+# Events written in the transaction of the change they describe, published and
+# deleted by `cli.outbox_relay`
+class OutboxEvent(Base, TableNameMixin, TimestampMixin):
+    # Carries the shard, see `database.sharding`
+    event_id: Mapped[bigint_pk]
+    topic: Mapped[str] = mapped_column(String(64))
+    payload: Mapped[dict] = mapped_column(JSONB)
+    # Failed events are retried from then on
+    available_at: Mapped[datetime.datetime] = mapped_column(
+        TIMESTAMP(timezone=True), server_default=func.now()
+    )
+    attempts: Mapped[int] = mapped_column(server_default="0")
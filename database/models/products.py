@@ -0,0 +1,19 @@
+from sqlalchemy import Computed, Index, String
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database.models.base import Base, TableNameMixin, int_pk
+
+
+class Product(Base, TableNameMixin):
+    product_id: Mapped[int_pk]
+    name: Mapped[str] = mapped_column(String(255), unique=True)
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', name)", persisted=True),
+        deferred=True,
+    )
+
+    __table_args__ = (
+        Index("ix_products_search_vector", search_vector, postgresql_using="gin"),
+    )
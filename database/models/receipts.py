@@ -2,10 +2,17 @@ from decimal import Decimal
 from enum import Enum
 from typing import Optional
 
-from sqlalchemy import DECIMAL, ForeignKey, String
+from sqlalchemy import BIGINT, DECIMAL, Computed, ForeignKey, Index, String, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from database.models.base import Base, TableNameMixin, TimestampMixin, int_pk
+from database.models.base import (
+    Base,
+    TableNameMixin,
+    TimestampMixin,
+    bigint_pk,
+    int_pk,
+)
 
 
 class PaymentType(Enum):
@@ -14,13 +21,19 @@ class PaymentType(Enum):
 
 
 class Receipt(Base, TableNameMixin, TimestampMixin):
-    receipt_id: Mapped[int_pk]
+    # Carries the shard, see `database.sharding`
+    receipt_id: Mapped[bigint_pk]
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.user_id", ondelete="CASCADE")
     )
     total: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
     rest: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
     comment: Mapped[Optional[str]]
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('simple', coalesce(comment, ''))", persisted=True),
+        deferred=True,
+    )
 
     items: Mapped[list["ReceiptItem"]] = relationship(
         "ReceiptItem", back_populates="receipt"
@@ -28,26 +41,71 @@ class Receipt(Base, TableNameMixin, TimestampMixin):
     payment: Mapped["Payment"] = relationship("Payment", back_populates="receipt")
     user: Mapped["User"] = relationship("User", back_populates="receipts")
 
+    __table_args__ = (
+        Index("ix_receipts_search_vector", search_vector, postgresql_using="gin"),
+        # Listings of a user in `sort` order, see `RECEIPT_SORT_COLUMNS`
+        Index("ix_receipts_user_id_created_at", "user_id", "created_at", "receipt_id"),
+        Index("ix_receipts_user_id_total", "user_id", "total", "receipt_id"),
+    )
+
 
 class ReceiptItem(Base, TableNameMixin):
     item_id: Mapped[int_pk]
     receipt_id: Mapped[int] = mapped_column(
-        ForeignKey("receipts.receipt_id", ondelete="CASCADE")
+        BIGINT, ForeignKey("receipts.receipt_id", ondelete="CASCADE"), index=True
     )
 
-    product_name: Mapped[str] = mapped_column(String(255))
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.product_id"), index=True
+    )
     price_per_unit: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
     quantity: Mapped[Decimal] = mapped_column(DECIMAL(10, 4))
     total_price: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
 
     receipt: Mapped["Receipt"] = relationship("Receipt", back_populates="items")
+    product: Mapped["Product"] = relationship("Product", lazy="joined")
 
 
 class Payment(Base, TableNameMixin, TimestampMixin):
     payment_id: Mapped[int_pk]
-    receipt_id: Mapped[int] = mapped_column(ForeignKey("receipts.receipt_id"))
+    receipt_id: Mapped[int] = mapped_column(
+        BIGINT, ForeignKey("receipts.receipt_id"), index=True
+    )
 
     type: Mapped[PaymentType]
     amount: Mapped[Decimal] = mapped_column(DECIMAL(16, 4))
 
     receipt: Mapped["Receipt"] = relationship("Receipt", back_populates="payment")
+
+
+# Receipt text rendered at creation time, one row per line width
+class ReceiptText(Base, TableNameMixin):
+    receipt_id: Mapped[int] = mapped_column(
+        BIGINT,
+        ForeignKey("receipts.receipt_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    width: Mapped[int] = mapped_column(primary_key=True)
+    content: Mapped[str] = mapped_column(Text)
+
+
+# Receipts accepted while the database was unreachable, by their provisional ID,
+# see `services.spool`
+class SpooledReceipt(Base, TableNameMixin):
+    spool_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    receipt_id: Mapped[int] = mapped_column(
+        BIGINT, ForeignKey("receipts.receipt_id", ondelete="CASCADE"), index=True
+    )
+
+
+# Progress of `cli.import_receipts` per user and source file, written in the
+# transaction of the receipts it counts
+class ReceiptImport(Base, TableNameMixin):
+    user_id: Mapped[int] = mapped_column(
+        BIGINT, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True
+    )
+    source: Mapped[str] = mapped_column(Text, primary_key=True)
+    # Byte offset in the file up to which every record is imported or rejected
+    position: Mapped[int] = mapped_column(BIGINT)
+    imported: Mapped[int] = mapped_column(BIGINT)
+    rejected: Mapped[int] = mapped_column(BIGINT)
@@ -5,6 +5,7 @@ from database.models.base import Base, TableNameMixin, TimestampMixin
 
 
 class User(Base, TableNameMixin, TimestampMixin):
+    # Carries the shard, see `database.sharding`
     user_id: Mapped[int] = mapped_column(BIGINT, primary_key=True, autoincrement=True)
     full_name: Mapped[str] = mapped_column(String(255))
     username: Mapped[str] = mapped_column(String(64), unique=True)
@@ -12,3 +13,9 @@ class User(Base, TableNameMixin, TimestampMixin):
     password_hash: Mapped[str] = mapped_column(String(255))
 
     receipts: Mapped[list["Receipt"]] = relationship("Receipt", back_populates="user")
+
+
+# Directory of the shard each user lives on, only used on shard 0
+class Username(Base, TableNameMixin):
+    username: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BIGINT, unique=True)
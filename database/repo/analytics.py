@@ -0,0 +1,173 @@
+import datetime
+from decimal import Decimal
+
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database.models import Product, ProductDailyStat, UserReceiptCount
+from database.models.receipts import Receipt, ReceiptItem
+from database.repo.base import MAX_BIND_PARAMETERS, BaseRepo, chunked
+
+
+class AnalyticsRepo(BaseRepo):
+    async def add_product_sales(
+        self,
+        user_id: int,
+        day: datetime.date,
+        sales: list[tuple[int, Decimal, Decimal]],
+    ):
+        """
+        Add `(product_id, quantity, revenue)` sales of one receipt to the counters.
+        """
+        counters: dict[int, tuple[Decimal, Decimal]] = {}
+        for product_id, quantity, revenue in sales:
+            total_quantity, total_revenue = counters.get(product_id, (0, 0))
+            counters[product_id] = (total_quantity + quantity, total_revenue + revenue)
+
+        # Rows are locked in the order of their VALUES: sorted, receipts listing
+        # the same products in another order don't deadlock. Rows of 6 columns
+        rows = sorted(counters.items())
+        for counters_chunk in chunked(rows, MAX_BIND_PARAMETERS // 6):
+            insert_stmt = insert(ProductDailyStat).values(
+                [
+                    dict(
+                        user_id=user_id,
+                        day=day,
+                        product_id=product_id,
+                        quantity=quantity,
+                        revenue=revenue,
+                        receipts_count=1,
+                    )
+                    for product_id, (quantity, revenue) in counters_chunk
+                ]
+            )
+            excluded = insert_stmt.excluded
+            await self.session.execute(
+                insert_stmt.on_conflict_do_update(
+                    index_elements=[
+                        ProductDailyStat.user_id,
+                        ProductDailyStat.day,
+                        ProductDailyStat.product_id,
+                    ],
+                    set_=dict(
+                        quantity=ProductDailyStat.quantity + excluded.quantity,
+                        revenue=ProductDailyStat.revenue + excluded.revenue,
+                        receipts_count=ProductDailyStat.receipts_count + 1,
+                    ),
+                )
+            )
+
+    async def add_receipts(self, user_id: int, count: int = 1):
+        insert_stmt = insert(UserReceiptCount).values(
+            user_id=user_id, receipts_count=count
+        )
+        await self.session.execute(
+            insert_stmt.on_conflict_do_update(
+                index_elements=[UserReceiptCount.user_id],
+                set_=dict(
+                    receipts_count=UserReceiptCount.receipts_count
+                    + insert_stmt.excluded.receipts_count
+                ),
+            )
+        )
+
+    async def get_receipts_count(self, user_id: int) -> int:
+        count = await self.session.scalar(
+            select(UserReceiptCount.receipts_count).where(
+                UserReceiptCount.user_id == user_id
+            )
+        )
+        return count or 0
+
+    async def get_top_products(
+        self,
+        user_id: int,
+        start_date: datetime.date | None = None,
+        end_date: datetime.date | None = None,
+        order_by: str = "revenue",
+        limit: int | None = None,
+    ):
+        quantity = func.sum(ProductDailyStat.quantity).label("quantity")
+        revenue = func.sum(ProductDailyStat.revenue).label("revenue")
+        receipts_count = func.sum(ProductDailyStat.receipts_count).label(
+            "receipts_count"
+        )
+
+        select_stmt = (
+            select(Product.name, quantity, revenue, receipts_count)
+            .join(Product, Product.product_id == ProductDailyStat.product_id)
+            .where(ProductDailyStat.user_id == user_id)
+            .group_by(Product.product_id)
+            .order_by((quantity if order_by == "quantity" else revenue).desc())
+        )
+
+        if start_date:
+            select_stmt = select_stmt.where(ProductDailyStat.day >= start_date)
+
+        if end_date:
+            select_stmt = select_stmt.where(ProductDailyStat.day <= end_date)
+
+        if limit:
+            select_stmt = select_stmt.limit(limit)
+
+        result = await self.session.execute(select_stmt)
+        return result.all()
+
+    async def rebuild_product_stats(self, user_id: int | None = None):
+        """
+        Recompute the counters from `receiptitems`, for one user or everybody.
+        """
+        day = cast(func.timezone("UTC", Receipt.created_at), Date)
+        aggregated = (
+            select(
+                Receipt.user_id,
+                day,
+                ReceiptItem.product_id,
+                func.sum(ReceiptItem.quantity),
+                func.sum(ReceiptItem.total_price),
+                func.count(func.distinct(Receipt.receipt_id)),
+            )
+            .join(ReceiptItem, ReceiptItem.receipt_id == Receipt.receipt_id)
+            .group_by(Receipt.user_id, day, ReceiptItem.product_id)
+        )
+        delete_stmt = ProductDailyStat.__table__.delete()
+
+        if user_id is not None:
+            aggregated = aggregated.where(Receipt.user_id == user_id)
+            delete_stmt = delete_stmt.where(ProductDailyStat.user_id == user_id)
+
+        await self.session.execute(delete_stmt)
+        result = await self.session.execute(
+            insert(ProductDailyStat).from_select(
+                [
+                    ProductDailyStat.user_id,
+                    ProductDailyStat.day,
+                    ProductDailyStat.product_id,
+                    ProductDailyStat.quantity,
+                    ProductDailyStat.revenue,
+                    ProductDailyStat.receipts_count,
+                ],
+                aggregated,
+            )
+        )
+        return result.rowcount
+
+    async def rebuild_receipt_counts(self, user_id: int | None = None):
+        """
+        Recount the receipts of one user or everybody.
+        """
+        aggregated = select(Receipt.user_id, func.count()).group_by(Receipt.user_id)
+        delete_stmt = UserReceiptCount.__table__.delete()
+
+        if user_id is not None:
+            aggregated = aggregated.where(Receipt.user_id == user_id)
+            delete_stmt = delete_stmt.where(UserReceiptCount.user_id == user_id)
+
+        await self.session.execute(delete_stmt)
+        result = await self.session.execute(
+            insert(UserReceiptCount).from_select(
+                [UserReceiptCount.user_id, UserReceiptCount.receipts_count],
+                aggregated,
+            )
+        )
+        return result.rowcount
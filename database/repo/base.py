@@ -1,5 +1,18 @@
+from collections.abc import Iterator, Sequence
+from typing import TypeVar
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
+T = TypeVar("T")
+
+# asyncpg sends at most this many bind parameters with a statement
+MAX_BIND_PARAMETERS = 32767
+
+
+def chunked(items: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
 
 class BaseRepo:
     def __init__(self, session):
@@ -0,0 +1,559 @@
+"""
+In-memory storage behind `RequestsRepo`, selected with DB_BACKEND=memory.
+
+Serves the same methods as the Postgres repositories, with the filter, paging
+and conflict semantics of their queries, from dicts and per user indexes in
+the process. Meant for tests and for profiling services without a database:
+data is lost on restart, every worker has its own copy, and there are no
+transactions, so changes are visible immediately and `commit` does nothing.
+"""
+
+import datetime
+import itertools
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+from operator import attrgetter
+from typing import NamedTuple
+
+from api.models import ProductResponse
+from database.models import (
+    OutboxEvent,
+    Payment,
+    Product,
+    Receipt,
+    ReceiptItem,
+    User,
+)
+from database.models.receipts import PaymentType
+from database.repo.receipts import ReceiptSort
+from database.repo.requests import RequestsRepo
+from database.repo.rows import TIMESTAMP_FORMAT, PaymentRow, ProductRow, ReceiptRow
+
+# Numeric columns are DECIMAL(..., 4)
+SCALE = Decimal("0.0001")
+
+created_at = attrgetter("created_at")
+created_at_id = attrgetter("created_at", "receipt_id")
+
+
+class ProductStats(NamedTuple):
+    name: str
+    quantity: Decimal
+    revenue: Decimal
+    receipts_count: int
+
+
+@dataclass
+class MemoryStorage:
+    users: dict[str, User] = field(default_factory=dict)
+    users_by_id: dict[int, User] = field(default_factory=dict)
+    usernames: dict[str, int] = field(default_factory=dict)
+    receipts: dict[int, Receipt] = field(default_factory=dict)
+    # Receipts are stored once paid, the last row of a receipt written: there
+    # is no transaction to drop a receipt failing halfway, such as a streamed one
+    unpaid_receipts: dict[int, Receipt] = field(default_factory=dict)
+    # Receipts of every user in creation order, sorted by `created_at` and
+    # `receipt_id`
+    user_receipts: defaultdict[int, list[Receipt]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    products: dict[str, Product] = field(default_factory=dict)
+    receipt_texts: dict[tuple[int, int], str] = field(default_factory=dict)
+    spooled_receipts: dict[str, int] = field(default_factory=dict)
+    # (user_id, day, product_id) -> [quantity, revenue, receipts_count]
+    product_stats: dict[tuple[int, datetime.date, int], list] = field(
+        default_factory=dict
+    )
+    receipt_counts: defaultdict[int, int] = field(
+        default_factory=lambda: defaultdict(int)
+    )
+    outbox_events: dict[int, OutboxEvent] = field(default_factory=dict)
+    user_ids: itertools.count = field(default_factory=lambda: itertools.count(1))
+    receipt_ids: itertools.count = field(default_factory=lambda: itertools.count(1))
+    product_ids: itertools.count = field(default_factory=lambda: itertools.count(1))
+    event_ids: itertools.count = field(default_factory=lambda: itertools.count(1))
+
+
+class MemorySession:
+    async def commit(self) -> None:
+        pass
+
+    async def rollback(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRepo:
+    def __init__(self, storage: MemoryStorage):
+        self.storage = storage
+
+
+class MemoryUserRepo(MemoryRepo):
+    async def create_user(
+        self,
+        full_name: str,
+        username: str,
+        password_hash: str,
+        user_id: int | None = None,
+    ):
+        if username in self.storage.users:
+            return
+        user = User(
+            user_id=next(self.storage.user_ids) if user_id is None else user_id,
+            full_name=full_name,
+            username=username,
+            password_hash=password_hash,
+            created_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+        self.storage.users[username] = user
+        self.storage.users_by_id[user.user_id] = user
+
+    async def get_user(self, username: str) -> User | None:
+        return self.storage.users.get(username)
+
+    async def allocate_user_id(self) -> int:
+        return next(self.storage.user_ids)
+
+
+class MemoryUsernameRepo(MemoryRepo):
+    async def get_user_id(self, username: str) -> int | None:
+        return self.storage.usernames.get(username)
+
+    async def add_username(self, username: str, user_id: int) -> int:
+        return self.storage.usernames.setdefault(username, user_id)
+
+
+class MemoryProductRepo(MemoryRepo):
+    async def get_or_create_product_ids(self, names: list[str]) -> dict[str, int]:
+        products = self.storage.products
+        for name in names:
+            if name not in products:
+                products[name] = Product(
+                    product_id=next(self.storage.product_ids), name=name
+                )
+        return {name: products[name].product_id for name in names}
+
+
+class MemoryPaymentsRepo(MemoryRepo):
+    async def create_payment(
+        self, receipt_id: int, payment_type: PaymentType, amount: Decimal
+    ):
+        receipt = self.storage.unpaid_receipts.pop(receipt_id)
+        receipt.payment = Payment(
+            receipt_id=receipt_id, type=payment_type, amount=amount.quantize(SCALE)
+        )
+        self.storage.receipts[receipt_id] = receipt
+        receipts = self.storage.user_receipts[receipt.user_id]
+        if receipts and created_at_id(receipt) < created_at_id(receipts[-1]):
+            insort(receipts, receipt, key=created_at_id)
+        else:
+            receipts.append(receipt)
+
+
+class MemoryReceiptRepo(MemoryRepo):
+    async def create_receipt(
+        self,
+        user_id: int,
+        total: Decimal,
+        rest: Decimal,
+        comment: str | None = None,
+        created_at: datetime.datetime | None = None,
+    ):
+        receipt = Receipt(
+            receipt_id=next(self.storage.receipt_ids),
+            user_id=user_id,
+            total=total.quantize(SCALE),
+            rest=rest.quantize(SCALE),
+            comment=comment,
+            created_at=created_at or datetime.datetime.now(datetime.timezone.utc),
+        )
+        self.storage.unpaid_receipts[receipt.receipt_id] = receipt
+        return receipt
+
+    async def add_spooled_receipt(self, spool_id: str, receipt_id: int):
+        self.storage.spooled_receipts[spool_id] = receipt_id
+
+    async def get_spooled_receipt_id(self, spool_id: str) -> int | None:
+        return self.storage.spooled_receipts.get(spool_id)
+
+    async def notify_receipt_created(self, payload: str):
+        # The receipt feed listens on Postgres, there is nobody to notify
+        pass
+
+    async def create_receipt_items(
+        self, receipt_id: int, products: list[ProductResponse]
+    ) -> dict[str, int]:
+        product_ids = await MemoryProductRepo(self.storage).get_or_create_product_ids(
+            [product.name for product in products]
+        )
+        self.storage.unpaid_receipts[receipt_id].items.extend(
+            ReceiptItem(
+                receipt_id=receipt_id,
+                product_id=product_ids[product.name],
+                product=self.storage.products[product.name],
+                price_per_unit=product.price.quantize(SCALE),
+                quantity=product.quantity.quantize(SCALE),
+                total_price=product.total.quantize(SCALE),
+            )
+            for product in products
+        )
+        return product_ids
+
+    async def set_receipt_totals(self, receipt_id: int, total: Decimal, rest: Decimal):
+        receipt = self.storage.unpaid_receipts[receipt_id]
+        receipt.total = total.quantize(SCALE)
+        receipt.rest = rest.quantize(SCALE)
+
+    async def limit_idle_time(self, seconds: float):
+        # No connection is held while waiting
+        pass
+
+    def _filter(
+        self,
+        user_id: int,
+        start_date: datetime.datetime | None = None,
+        end_date: datetime.datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+    ):
+        # Unset and falsy filters are not applied, as in `apply_receipt_filters`
+        receipts = self.storage.user_receipts.get(user_id, [])
+        start, end = 0, len(receipts)
+        if start_date:
+            start = bisect_left(receipts, as_utc(start_date), key=created_at)
+        if end_date:
+            end = bisect_right(receipts, as_utc(end_date), key=created_at)
+
+        for receipt in itertools.islice(receipts, start, end):
+            if min_total and receipt.total < min_total:
+                continue
+            if max_total and receipt.total > max_total:
+                continue
+            if payment_type and receipt.payment.type != payment_type:
+                continue
+            yield receipt
+
+    async def get_receipts(
+        self,
+        user_id: int,
+        start_date: datetime.datetime | None = None,
+        end_date: datetime.datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        receipts = self._filter(
+            user_id, start_date, end_date, min_total, max_total, payment_type
+        )
+        # Already in `created_at` order, see `MemoryStorage.user_receipts`
+        if sort in ("total", "-total"):
+            receipts = sorted(receipts, key=attrgetter("total", "receipt_id"))
+        if sort and sort.startswith("-"):
+            receipts = reversed(list(receipts))
+        return [
+            to_receipt_row(receipt)
+            for receipt in itertools.islice(
+                receipts, offset or 0, (offset or 0) + limit if limit else None
+            )
+        ]
+
+    async def get_receipt_fields(
+        self,
+        user_id: int,
+        fields: frozenset[str],
+        start_date: datetime.datetime | None = None,
+        end_date: datetime.datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        receipts = await self.get_receipts(
+            user_id,
+            start_date,
+            end_date,
+            min_total,
+            max_total,
+            payment_type,
+            limit,
+            offset,
+            sort,
+        )
+        return [
+            ReceiptRow(
+                **{
+                    name: getattr(receipt, name)
+                    for name in fields
+                    if name != "products"
+                }
+            )
+            for receipt in receipts
+        ]
+
+    async def search_receipts(
+        self,
+        user_id: int,
+        query: str,
+        start_date: datetime.datetime | None = None,
+        end_date: datetime.datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        after: tuple[float, int] | None = None,
+    ):
+        """
+        Receipts with a product name or comment containing every word of the
+        `build_search_query` expression as a prefix. All matches rank 1.0, so
+        the order is by `receipt_id`, newest first.
+        """
+        prefixes = [term.removesuffix(":*") for term in query.split(" & ")]
+        receipts = self._filter(
+            user_id, start_date, end_date, min_total, max_total, payment_type
+        )
+        matches = [
+            (receipt, 1.0)
+            for receipt in receipts
+            if any(
+                matches_prefixes(text, prefixes)
+                for text in [
+                    receipt.comment or "",
+                    *(item.product.name for item in receipt.items),
+                ]
+            )
+        ]
+        matches.sort(key=lambda match: match[0].receipt_id, reverse=True)
+        if after:
+            matches = [
+                (receipt, rank)
+                for receipt, rank in matches
+                if (rank, receipt.receipt_id) < after
+            ]
+        return matches[:limit] if limit else matches
+
+    async def get_receipts_by_ids(
+        self, user_id: int, receipt_ids: list[int]
+    ) -> list[ReceiptRow]:
+        receipts = (self.storage.receipts.get(receipt_id) for receipt_id in receipt_ids)
+        return [
+            to_receipt_row(receipt)
+            for receipt in receipts
+            if receipt is not None and receipt.user_id == user_id
+        ]
+
+    async def get_receipt_columns(
+        self, user_id: int, after_id: int = 0
+    ) -> list[tuple[int, int, int, int, int]]:
+        payment_types = list(PaymentType)
+        return [
+            (
+                receipt.receipt_id,
+                int(receipt.total.scaleb(2)),
+                int(receipt.created_at.timestamp()),
+                payment_types.index(receipt.payment.type),
+                len(receipt.items),
+            )
+            for receipt in self.storage.user_receipts.get(user_id, [])
+            if receipt.receipt_id > after_id
+        ]
+
+    async def estimate_receipts_count(self, user_id: int, **filters) -> int:
+        # Counting is as cheap as estimating here
+        return sum(1 for _ in self._filter(user_id, **filters))
+
+    async def count_receipts(self, user_id: int, timeout: float, **filters) -> int:
+        return sum(1 for _ in self._filter(user_id, **filters))
+
+    async def get_receipt_by_id(self, receipt_id: int) -> ReceiptRow | None:
+        receipt = self.storage.receipts.get(receipt_id)
+        if receipt is None:
+            return None
+
+        row = to_receipt_row(receipt)
+        row.user_full_name = self.storage.users_by_id[receipt.user_id].full_name
+        return row
+
+    async def create_receipt_texts(self, receipt_id: int, texts: dict[int, str]):
+        for width, content in texts.items():
+            self.storage.receipt_texts[receipt_id, width] = content
+
+    async def get_receipt_text(self, receipt_id: int, width: int) -> str | None:
+        return self.storage.receipt_texts.get((receipt_id, width))
+
+
+class MemoryAnalyticsRepo(MemoryRepo):
+    async def add_product_sales(
+        self,
+        user_id: int,
+        day: datetime.date,
+        sales: list[tuple[int, Decimal, Decimal]],
+    ):
+        counted = set()
+        for product_id, quantity, revenue in sales:
+            stats = self.storage.product_stats.setdefault(
+                (user_id, day, product_id), [Decimal(0), Decimal(0), 0]
+            )
+            stats[0] += quantity
+            stats[1] += revenue
+            if product_id not in counted:
+                stats[2] += 1
+                counted.add(product_id)
+
+    async def add_receipts(self, user_id: int, count: int = 1):
+        self.storage.receipt_counts[user_id] += count
+
+    async def get_receipts_count(self, user_id: int) -> int:
+        return self.storage.receipt_counts.get(user_id, 0)
+
+    async def get_top_products(
+        self,
+        user_id: int,
+        start_date: datetime.date | None = None,
+        end_date: datetime.date | None = None,
+        order_by: str = "revenue",
+        limit: int | None = None,
+    ) -> list[ProductStats]:
+        names = {
+            product.product_id: product.name
+            for product in self.storage.products.values()
+        }
+        totals: dict[int, list] = {}
+        for (
+            stats_user_id,
+            day,
+            product_id,
+        ), stats in self.storage.product_stats.items():
+            if stats_user_id != user_id:
+                continue
+            if start_date and day < start_date:
+                continue
+            if end_date and day > end_date:
+                continue
+            product_totals = totals.setdefault(product_id, [Decimal(0), Decimal(0), 0])
+            for index, value in enumerate(stats):
+                product_totals[index] += value
+
+        results = [
+            ProductStats(names[product_id], *product_totals)
+            for product_id, product_totals in totals.items()
+        ]
+        results.sort(key=lambda stats: getattr(stats, order_by), reverse=True)
+        return results[:limit] if limit else results
+
+
+class MemoryOutboxRepo(MemoryRepo):
+    async def add_event(self, topic: str, payload: dict):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = OutboxEvent(
+            event_id=next(self.storage.event_ids),
+            topic=topic,
+            payload=payload,
+            available_at=now,
+            attempts=0,
+            created_at=now,
+        )
+        self.storage.outbox_events[event.event_id] = event
+
+    async def claim_events(self, limit: int) -> list[OutboxEvent]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        due = [
+            event
+            for event in self.storage.outbox_events.values()
+            if event.available_at <= now
+        ]
+        return due[:limit]
+
+    async def delete_events(self, event_ids: list[int]):
+        for event_id in event_ids:
+            self.storage.outbox_events.pop(event_id, None)
+
+    async def postpone_events(self, event_ids: list[int], delay: datetime.timedelta):
+        available_at = datetime.datetime.now(datetime.timezone.utc) + delay
+        for event_id in event_ids:
+            event = self.storage.outbox_events[event_id]
+            event.attempts += 1
+            event.available_at = available_at
+
+    async def count_events(self) -> int:
+        return len(self.storage.outbox_events)
+
+
+@dataclass
+class MemoryRequestsRepo(RequestsRepo):
+    """
+    `RequestsRepo` on a `MemoryStorage`, never sharded.
+    """
+
+    session: MemorySession = field(default_factory=MemorySession)
+    storage: MemoryStorage = field(default_factory=MemoryStorage)
+
+    @property
+    def users(self) -> MemoryUserRepo:
+        return MemoryUserRepo(self.storage)
+
+    @property
+    def usernames(self) -> MemoryUsernameRepo:
+        return MemoryUsernameRepo(self.storage)
+
+    @property
+    def receipts(self) -> MemoryReceiptRepo:
+        return MemoryReceiptRepo(self.storage)
+
+    @property
+    def payments(self) -> MemoryPaymentsRepo:
+        return MemoryPaymentsRepo(self.storage)
+
+    @property
+    def products(self) -> MemoryProductRepo:
+        return MemoryProductRepo(self.storage)
+
+    @property
+    def analytics(self) -> MemoryAnalyticsRepo:
+        return MemoryAnalyticsRepo(self.storage)
+
+    @property
+    def outbox(self) -> MemoryOutboxRepo:
+        return MemoryOutboxRepo(self.storage)
+
+
+def as_utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    # asyncpg sends naive datetimes to timestamptz columns as UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def matches_prefixes(text: str, prefixes: list[str]) -> bool:
+    words = re.findall(r"\w+", text.lower())
+    return all(any(word.startswith(prefix) for word in words) for prefix in prefixes)
+
+
+def to_receipt_row(receipt: Receipt) -> ReceiptRow:
+    return ReceiptRow(
+        receipt_id=receipt.receipt_id,
+        products=[
+            ProductRow(
+                name=item.product.name,
+                price=item.price_per_unit,
+                quantity=item.quantity,
+                total=item.total_price,
+            )
+            for item in receipt.items
+        ],
+        payment=PaymentRow(type=receipt.payment.type, amount=receipt.payment.amount),
+        comment=receipt.comment,
+        total=receipt.total,
+        rest=receipt.rest,
+        created_at=receipt.created_at.strftime(TIMESTAMP_FORMAT),
+    )
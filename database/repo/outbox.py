@@ -0,0 +1,45 @@
+import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+
+from database.models import OutboxEvent
+from database.repo.base import BaseRepo
+
+
+class OutboxRepo(BaseRepo):
+    async def add_event(self, topic: str, payload: dict):
+        await self.session.execute(
+            insert(OutboxEvent).values(topic=topic, payload=payload)
+        )
+
+    async def claim_events(self, limit: int) -> list[OutboxEvent]:
+        """
+        Lock up to `limit` due events, oldest first, until the end of the
+        transaction. Events locked by other relays are skipped.
+        """
+        result = await self.session.scalars(
+            select(OutboxEvent)
+            .where(OutboxEvent.available_at <= func.now())
+            .order_by(OutboxEvent.event_id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return list(result)
+
+    async def delete_events(self, event_ids: list[int]):
+        await self.session.execute(
+            delete(OutboxEvent).where(OutboxEvent.event_id.in_(event_ids))
+        )
+
+    async def postpone_events(self, event_ids: list[int], delay: datetime.timedelta):
+        await self.session.execute(
+            update(OutboxEvent)
+            .where(OutboxEvent.event_id.in_(event_ids))
+            .values(
+                attempts=OutboxEvent.attempts + 1,
+                available_at=func.now() + delay,
+            )
+        )
+
+    async def count_events(self) -> int:
+        return await self.session.scalar(select(func.count()).select_from(OutboxEvent))
@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from sqlalchemy import URL, event, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database.models import Product
+from database.repo.base import MAX_BIND_PARAMETERS, BaseRepo, chunked
+
+PRODUCT_CACHE_SIZE = 100_000
+
+# Product names are never renamed or deleted, so a committed name -> id
+# mapping stays valid for the lifetime of the process. IDs differ between
+# shards, so there is a mapping per database URL.
+_product_ids: defaultdict[URL, dict[str, int]] = defaultdict(dict)
+# Session info key of the names inserted by the open transaction of a session
+CREATED_PRODUCTS = "created_products"
+
+
+def _forget_created_products(session, transaction):
+    # Committed or rolled back, the next lookup of the names is safe to cache
+    if transaction.parent is None:
+        session.info[CREATED_PRODUCTS].clear()
+
+
+class ProductRepo(BaseRepo):
+    @property
+    def _cached_ids(self) -> dict[str, int]:
+        return _product_ids[self.session.bind.url]
+
+    @property
+    def _created_names(self) -> set[str]:
+        created = self.session.info.get(CREATED_PRODUCTS)
+        if created is None:
+            created = self.session.info[CREATED_PRODUCTS] = set()
+            event.listen(
+                self.session.sync_session,
+                "after_transaction_end",
+                _forget_created_products,
+            )
+        return created
+
+    async def get_or_create_product_ids(self, names: list[str]) -> dict[str, int]:
+        cached_ids = self._cached_ids
+        product_ids = {name: cached_ids[name] for name in names if name in cached_ids}
+        missing = set(names) - product_ids.keys()
+        if not missing:
+            return product_ids
+
+        found = await self._get_product_ids(missing)
+        product_ids.update(found)
+        missing -= found.keys()
+
+        # Rows created here are not cached, also when a later lookup of the
+        # same transaction finds them: the transaction may still be rolled
+        # back, and they are cached by the first lookup after it.
+        for names_chunk in chunked(sorted(missing), MAX_BIND_PARAMETERS):
+            result = await self.session.execute(
+                insert(Product)
+                .values([dict(name=name) for name in names_chunk])
+                .on_conflict_do_nothing(index_elements=[Product.name])
+                .returning(Product.name, Product.product_id)
+            )
+            created = dict(result.tuples().all())
+            self._created_names.update(created)
+            product_ids.update(created)
+            missing -= created.keys()
+
+        if missing:
+            # Inserted concurrently by another transaction after our lookup
+            product_ids.update(await self._get_product_ids(missing))
+
+        return product_ids
+
+    async def _get_product_ids(self, names: set[str]) -> dict[str, int]:
+        found = {}
+        for names_chunk in chunked(list(names), MAX_BIND_PARAMETERS):
+            result = await self.session.execute(
+                select(Product.name, Product.product_id).where(
+                    Product.name.in_(names_chunk)
+                )
+            )
+            found.update(result.tuples().all())
+
+        # Other rows were committed before this transaction could see them
+        committed = {
+            name: product_id
+            for name, product_id in found.items()
+            if name not in self._created_names
+        }
+        cached_ids = self._cached_ids
+        if len(cached_ids) + len(committed) > PRODUCT_CACHE_SIZE:
+            cached_ids.clear()
+        cached_ids.update(committed)
+
+        return found
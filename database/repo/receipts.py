@@ -1,40 +1,245 @@
 from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
+from typing import Literal
 
-from sqlalchemy import insert, select
+from sqlalchemy import (
+    ARRAY,
+    BIGINT,
+    Integer,
+    Row,
+    Select,
+    any_,
+    bindparam,
+    case,
+    cast,
+    func,
+    insert,
+    select,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import selectinload
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
 from api.models import ProductResponse
-from database.models.receipts import Payment, PaymentType, Receipt, ReceiptItem
-from database.repo.base import BaseRepo
+from database.deadlines import is_query_canceled, limit_time
+from database.models import Product, User
+from database.models.receipts import (
+    Payment,
+    PaymentType,
+    Receipt,
+    ReceiptItem,
+    ReceiptText,
+    SpooledReceipt,
+)
+from database.repo.base import MAX_BIND_PARAMETERS, BaseRepo, chunked
+from database.repo.products import ProductRepo
+from database.repo.rows import TIMESTAMP_FORMAT, PaymentRow, ProductRow, ReceiptRow
+
+# NOTIFY channel for new receipts, see `services.feed`
+RECEIPTS_CHANNEL = "receipts"
+# Rows of 5 columns in one INSERT of receipt items
+ITEMS_PER_INSERT = MAX_BIND_PARAMETERS // 5
+
+
+# Columns selected for each field of a receipt projection, see
+# `build_receipts_statement`
+RECEIPT_FIELD_COLUMNS = {
+    "receipt_id": [Receipt.receipt_id],
+    "payment": [
+        Payment.type.label("payment_type"),
+        Payment.amount.label("payment_amount"),
+    ],
+    "comment": [Receipt.comment],
+    "total": [Receipt.total],
+    "rest": [Receipt.rest],
+    "created_at": [Receipt.created_at],
+}
+
+
+# Columns of each `sort` of a receipt listing, "-" sorts descending. Each is
+# read in order from an index on `user_id` and these columns, see `Receipt`.
+# The receipt ID breaks ties, so that pages don't overlap.
+RECEIPT_SORT_COLUMNS = {
+    "created_at": (Receipt.created_at, Receipt.receipt_id),
+    "total": (Receipt.total, Receipt.receipt_id),
+}
+ReceiptSort = Literal["created_at", "-created_at", "total", "-total"]
+
+
+class Explain(Executable, ClauseElement):
+    """
+    `EXPLAIN` of a statement, with the same bound parameters. Returns the
+    decoded JSON plan without running the statement.
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element: Explain, compiler, **kw) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+# A list of receipt IDs sent as one array, `= ANY(...)` keeps the statement the
+# same for any number of IDs
+receipt_ids_param = bindparam("receipt_ids", type_=ARRAY(BIGINT))
+
+
+def apply_receipt_filters(
+    select_stmt: Select, filters: frozenset[str], join_payment: bool = False
+) -> Select:
+    select_stmt = select_stmt.where(Receipt.user_id == bindparam("user_id"))
+
+    if "start_date" in filters:
+        select_stmt = select_stmt.where(Receipt.created_at >= bindparam("start_date"))
+
+    if "end_date" in filters:
+        select_stmt = select_stmt.where(Receipt.created_at <= bindparam("end_date"))
+
+    if "min_total" in filters:
+        select_stmt = select_stmt.where(Receipt.total >= bindparam("min_total"))
+
+    if "max_total" in filters:
+        select_stmt = select_stmt.where(Receipt.total <= bindparam("max_total"))
+
+    if join_payment or "payment_type" in filters:
+        select_stmt = select_stmt.join(Payment)
+
+    if "payment_type" in filters:
+        select_stmt = select_stmt.where(Payment.type == bindparam("payment_type"))
+
+    if "limit" in filters:
+        select_stmt = select_stmt.limit(bindparam("limit", type_=Integer))
+
+    if "offset" in filters:
+        select_stmt = select_stmt.offset(bindparam("offset", type_=Integer))
+
+    return select_stmt
+
+
+@lru_cache(maxsize=None)
+def build_receipts_statement(
+    filters: frozenset[str],
+    fields: frozenset[str] = frozenset(RECEIPT_FIELD_COLUMNS),
+    sort: ReceiptSort | None = None,
+) -> Select:
+    """
+    `get_receipt_fields` statement for one combination of applied filters,
+    selected fields and sort order.
+
+    Filter values are bound parameters, so there is a single statement object
+    per combination. SQLAlchemy's compiled cache and asyncpg's prepared
+    statements are then reused instead of rebuilding the query on every call.
+    Only plain columns are selected, the items are read by `get_receipts`.
+    """
+    columns = [
+        column
+        for field, field_columns in RECEIPT_FIELD_COLUMNS.items()
+        if field in fields
+        for column in field_columns
+    ]
+    select_stmt = select(*columns).select_from(Receipt)
+    if sort:
+        sort_columns = RECEIPT_SORT_COLUMNS[sort.removeprefix("-")]
+        if sort.startswith("-"):
+            sort_columns = [column.desc() for column in sort_columns]
+        select_stmt = select_stmt.order_by(*sort_columns)
+    return apply_receipt_filters(select_stmt, filters, join_payment="payment" in fields)
+
+
+@lru_cache(maxsize=None)
+def build_count_statement(filters: frozenset[str]) -> Select:
+    return apply_receipt_filters(select(func.count()).select_from(Receipt), filters)
+
+
+def to_receipt_row(row: Row) -> ReceiptRow:
+    values = row._asdict()
+    if "payment_type" in values:
+        values["payment"] = PaymentRow(
+            type=values.pop("payment_type"), amount=values.pop("payment_amount")
+        )
+    if "created_at" in values:
+        values["created_at"] = values["created_at"].strftime(TIMESTAMP_FORMAT)
+    return ReceiptRow(**values)
 
 
 class ReceiptRepo(BaseRepo):
     async def create_receipt(
-        self, user_id: int, total: Decimal, rest: Decimal, comment: str | None = None
+        self,
+        user_id: int,
+        total: Decimal,
+        rest: Decimal,
+        comment: str | None = None,
+        created_at: datetime | None = None,
     ):
+        values = dict(user_id=user_id, total=total, rest=rest, comment=comment)
+        if created_at is not None:
+            values["created_at"] = created_at
         result = await self.session.execute(
-            insert(Receipt)
-            .values(user_id=user_id, total=total, rest=rest, comment=comment)
-            .returning(Receipt)
+            insert(Receipt).values(**values).returning(Receipt)
         )
         return result.scalar_one()
 
+    async def add_spooled_receipt(self, spool_id: str, receipt_id: int):
+        await self.session.execute(
+            insert(SpooledReceipt).values(spool_id=spool_id, receipt_id=receipt_id)
+        )
+
+    async def get_spooled_receipt_id(self, spool_id: str) -> int | None:
+        return await self.session.scalar(
+            select(SpooledReceipt.receipt_id).where(SpooledReceipt.spool_id == spool_id)
+        )
+
+    async def notify_receipt_created(self, payload: str):
+        # Delivered to listeners when the transaction commits
+        await self.session.execute(select(func.pg_notify(RECEIPTS_CHANNEL, payload)))
+
     async def create_receipt_items(
         self, receipt_id: int, products: list[ProductResponse]
-    ):
+    ) -> dict[str, int]:
+        product_ids = await ProductRepo(self.session).get_or_create_product_ids(
+            [product.name for product in products]
+        )
+        for products_chunk in chunked(products, ITEMS_PER_INSERT):
+            await self.session.execute(
+                insert(ReceiptItem).values(
+                    [
+                        dict(
+                            receipt_id=receipt_id,
+                            product_id=product_ids[product.name],
+                            price_per_unit=product.price,
+                            quantity=product.quantity,
+                            total_price=product.total,
+                        )
+                        for product in products_chunk
+                    ]
+                )
+            )
+        return product_ids
+
+    async def set_receipt_totals(self, receipt_id: int, total: Decimal, rest: Decimal):
         await self.session.execute(
-            insert(ReceiptItem).values(
-                [
-                    dict(
-                        receipt_id=receipt_id,
-                        product_name=product.name,
-                        price_per_unit=product.price,
-                        quantity=product.quantity,
-                        total_price=product.total,
-                    )
-                    for product in products
-                ]
+            update(Receipt)
+            .where(Receipt.receipt_id == receipt_id)
+            .values(total=total, rest=rest)
+        )
+
+    async def limit_idle_time(self, seconds: float):
+        # The database ends the session when its transaction waits longer
+        milliseconds = max(1, round(seconds * 1000))
+        await self.session.execute(
+            select(
+                func.set_config(
+                    "idle_in_transaction_session_timeout", str(milliseconds), True
+                )
             )
         )
 
@@ -48,9 +253,204 @@ class ReceiptRepo(BaseRepo):
         payment_type: PaymentType | None = None,
         limit: int | None = None,
         offset: int | None = None,
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        receipts = await self.get_receipt_fields(
+            user_id=user_id,
+            fields=frozenset(RECEIPT_FIELD_COLUMNS),
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            limit=limit,
+            offset=offset,
+            sort=sort,
+        )
+        await self.add_products(receipts)
+        return receipts
+
+    async def get_receipt_fields(
+        self,
+        user_id: int,
+        fields: frozenset[str],
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        """
+        `get_receipts` with only the columns of `fields`, a subset of
+        `RECEIPT_FIELD_COLUMNS`, and without the products. Receipts are in no
+        particular order without `sort`.
+        """
+        params = dict(
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            limit=limit,
+            offset=offset,
+        )
+        params = {name: value for name, value in params.items() if value}
+        select_stmt = build_receipts_statement(frozenset(params), fields, sort)
+
+        result = await self.session.execute(select_stmt, dict(params, user_id=user_id))
+
+        return [to_receipt_row(row) for row in result]
+
+    async def estimate_receipts_count(
+        self,
+        user_id: int,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+    ) -> int:
+        """
+        The planner's estimate of the receipts matching the filters, from
+        table statistics and without running the query.
+        """
+        params = dict(
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+        )
+        params = {name: value for name, value in params.items() if value}
+        select_stmt = build_receipts_statement(
+            frozenset(params), frozenset({"receipt_id"})
+        )
+
+        plan = await self.session.scalar(
+            Explain(select_stmt), dict(params, user_id=user_id)
+        )
+        return plan[0]["Plan"]["Plan Rows"]
+
+    async def count_receipts(
+        self,
+        user_id: int,
+        timeout: float,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+    ) -> int | None:
+        """
+        Count the receipts matching the filters, None when it takes more than
+        `timeout` seconds. Raises DeadlineExceeded when the deadline of the
+        session comes first.
+
+        The count runs in a savepoint, so a cancelled count leaves the
+        transaction usable.
+        """
+        params = dict(
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+        )
+        params = {name: value for name, value in params.items() if value}
+
+        try:
+            async with self.session.begin_nested():
+                async with limit_time(self.session, timeout):
+                    return await self.session.scalar(
+                        build_count_statement(frozenset(params)),
+                        dict(params, user_id=user_id),
+                    )
+        except DBAPIError as error:
+            if is_query_canceled(error):
+                return None
+            raise
+
+    async def add_products(self, receipts: list[ReceiptRow]) -> None:
+        """
+        Read the items of all `receipts` with a single query.
+        """
+        products = {receipt.receipt_id: [] for receipt in receipts}
+        if not products:
+            return
+
+        result = await self.session.execute(
+            select(
+                ReceiptItem.receipt_id,
+                Product.name,
+                ReceiptItem.price_per_unit,
+                ReceiptItem.quantity,
+                ReceiptItem.total_price,
+            )
+            .join(Product, Product.product_id == ReceiptItem.product_id)
+            .where(ReceiptItem.receipt_id == any_(receipt_ids_param))
+            .order_by(ReceiptItem.item_id),
+            dict(receipt_ids=list(products)),
+        )
+        for receipt_id, name, price, quantity, total in result:
+            products[receipt_id].append(ProductRow(name, price, quantity, total))
+
+        for receipt in receipts:
+            receipt.products = products[receipt.receipt_id]
+
+    async def search_receipts(
+        self,
+        user_id: int,
+        query: str,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        after: tuple[float, int] | None = None,
     ):
+        """
+        Full-text search over product names and receipt comments.
+
+        `query` is a tsquery expression (see `to_tsquery`). Matches are ranked
+        by the best `ts_rank` of any item or of the comment, and paged by the
+        `(rank, receipt_id)` keyset of the last row of the previous page.
+        Returns a list of `(Receipt, rank)` rows.
+        """
+        ts_query = func.to_tsquery("simple", query)
+
+        item_matches = (
+            select(
+                ReceiptItem.receipt_id.label("receipt_id"),
+                func.ts_rank(Product.search_vector, ts_query).label("rank"),
+            )
+            .join(Product, Product.product_id == ReceiptItem.product_id)
+            .join(Receipt, Receipt.receipt_id == ReceiptItem.receipt_id)
+            .where(
+                Receipt.user_id == user_id,
+                Product.search_vector.bool_op("@@")(ts_query),
+            )
+        )
+        comment_matches = select(
+            Receipt.receipt_id.label("receipt_id"),
+            func.ts_rank(Receipt.search_vector, ts_query).label("rank"),
+        ).where(
+            Receipt.user_id == user_id,
+            Receipt.search_vector.bool_op("@@")(ts_query),
+        )
+        matches = union_all(item_matches, comment_matches).subquery()
+        ranked = (
+            select(matches.c.receipt_id, func.max(matches.c.rank).label("rank"))
+            .group_by(matches.c.receipt_id)
+            .subquery()
+        )
+
         select_stmt = (
-            select(Receipt)
+            select(Receipt, ranked.c.rank)
+            .join(ranked, ranked.c.receipt_id == Receipt.receipt_id)
             .options(selectinload(Receipt.payment))
             .options(selectinload(Receipt.items))
             .where(
@@ -73,24 +473,104 @@ class ReceiptRepo(BaseRepo):
         if payment_type:
             select_stmt = select_stmt.join(Payment).where(Payment.type == payment_type)
 
+        if after:
+            select_stmt = select_stmt.where(
+                tuple_(ranked.c.rank, Receipt.receipt_id) < tuple_(*after)
+            )
+
+        select_stmt = select_stmt.order_by(
+            ranked.c.rank.desc(), Receipt.receipt_id.desc()
+        )
+
         if limit:
             select_stmt = select_stmt.limit(limit)
 
-        if offset:
-            select_stmt = select_stmt.offset(offset)
-
-        result = await self.session.scalars(select_stmt)
+        result = await self.session.execute(select_stmt)
 
         return result.all()
 
-    async def get_receipt_by_id(self, receipt_id: int):
+    async def get_receipts_by_ids(
+        self, user_id: int, receipt_ids: list[int]
+    ) -> list[ReceiptRow]:
+        """
+        Receipts of `user_id` among `receipt_ids`, in no particular order.
+        """
         result = await self.session.execute(
-            select(Receipt)
-            .options(selectinload(Receipt.payment))
-            .options(selectinload(Receipt.items))
-            .options(selectinload(Receipt.user))
+            build_receipts_statement(frozenset()).where(
+                Receipt.receipt_id == any_(receipt_ids_param)
+            ),
+            dict(user_id=user_id, receipt_ids=receipt_ids),
+        )
+        receipts = [to_receipt_row(row) for row in result]
+        await self.add_products(receipts)
+        return receipts
+
+    async def get_receipt_columns(
+        self, user_id: int, after_id: int = 0
+    ) -> list[tuple[int, int, int, int, int]]:
+        """
+        Receipts of `user_id` with an ID above `after_id`, as integer rows for
+        `services.reports`: receipt ID, total in kopecks, creation time in Unix
+        seconds, index of the payment type in `PaymentType`, number of items.
+        """
+        items_count = (
+            select(func.count())
+            .where(ReceiptItem.receipt_id == Receipt.receipt_id)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            select(
+                Receipt.receipt_id,
+                cast(Receipt.total * 100, BIGINT),
+                cast(func.floor(func.extract("epoch", Receipt.created_at)), BIGINT),
+                case(
+                    *(
+                        (Payment.type == payment_type, index)
+                        for index, payment_type in enumerate(PaymentType)
+                    )
+                ),
+                items_count,
+            )
+            .join(Payment)
+            .where(Receipt.user_id == user_id, Receipt.receipt_id > after_id)
+        )
+        return result.tuples().all()
+
+    async def get_receipt_by_id(self, receipt_id: int) -> ReceiptRow | None:
+        columns = [
+            column
+            for field_columns in RECEIPT_FIELD_COLUMNS.values()
+            for column in field_columns
+        ]
+        result = await self.session.execute(
+            select(*columns, User.full_name.label("user_full_name"))
+            .join(Payment)
+            .join(User)
             .where(
                 Receipt.receipt_id == receipt_id,
             )
         )
-        return result.scalar_one_or_none()
+        row = result.one_or_none()
+        if row is None:
+            return None
+
+        receipt = to_receipt_row(row)
+        await self.add_products([receipt])
+        return receipt
+
+    async def create_receipt_texts(self, receipt_id: int, texts: dict[int, str]):
+        await self.session.execute(
+            insert(ReceiptText).values(
+                [
+                    dict(receipt_id=receipt_id, width=width, content=content)
+                    for width, content in texts.items()
+                ]
+            )
+        )
+
+    async def get_receipt_text(self, receipt_id: int, width: int) -> str | None:
+        return await self.session.scalar(
+            select(ReceiptText.content).where(
+                ReceiptText.receipt_id == receipt_id, ReceiptText.width == width
+            )
+        )
@@ -1,20 +1,65 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.repo.analytics import AnalyticsRepo
+from database.repo.outbox import OutboxRepo
 from database.repo.payments import PaymentsRepo
+from database.repo.products import ProductRepo
 from database.repo.receipts import ReceiptRepo
-from database.repo.users import UserRepo
+from database.repo.users import UsernameRepo, UserRepo
+from database.sharding import shard_of
 
 
 @dataclass
 class RequestsRepo:
+    """
+    Repositories on `session`, shard 0 when sharded.
+
+    `shard_sessions` holds a session per shard, see `database.sharding`. The
+    `for_*` methods return the repositories of the shard that owns a user or
+    a receipt; without shards they return this repo.
+    """
+
     session: AsyncSession
+    shard_sessions: list[AsyncSession] = field(default_factory=list)
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shard_sessions) > 1
+
+    def for_shard(self, shard: int) -> "RequestsRepo":
+        if not self.sharded:
+            return self
+        # IDs of unknown shards end up on a shard that doesn't have them
+        session = self.shard_sessions[shard % len(self.shard_sessions)]
+        return RequestsRepo(session, self.shard_sessions)
+
+    def for_user(self, user_id: int) -> "RequestsRepo":
+        return self.for_shard(shard_of(user_id))
+
+    def for_receipt(self, receipt_id: int) -> "RequestsRepo":
+        return self.for_shard(shard_of(receipt_id))
+
+    async def for_username(self, username: str) -> "RequestsRepo":
+        if not self.sharded:
+            return self
+        user_id = await self.for_shard(0).usernames.get_user_id(username)
+        # Users missing from the directory predate sharding and live on shard 0
+        return self.for_shard(0 if user_id is None else shard_of(user_id))
+
+    async def close(self) -> None:
+        for session in self.shard_sessions or [self.session]:
+            await session.close()
 
     @property
     def users(self) -> UserRepo:
         return UserRepo(self.session)
 
+    @property
+    def usernames(self) -> UsernameRepo:
+        return UsernameRepo(self.session)
+
     @property
     def receipts(self) -> ReceiptRepo:
         return ReceiptRepo(self.session)
@@ -22,3 +67,15 @@ class RequestsRepo:
     @property
     def payments(self) -> PaymentsRepo:
         return PaymentsRepo(self.session)
+
+    @property
+    def products(self) -> ProductRepo:
+        return ProductRepo(self.session)
+
+    @property
+    def analytics(self) -> AnalyticsRepo:
+        return AnalyticsRepo(self.session)
+
+    @property
+    def outbox(self) -> OutboxRepo:
+        return OutboxRepo(self.session)
@@ -0,0 +1,40 @@
+"""
+Read-only receipt rows, shaped like `api.models.CreateReceiptResponse`.
+
+Read paths fill these from Core queries instead of loading ORM entities, and
+`pydantic_core.to_json` serializes them as they are. Fields left out of a
+projection stay None and are excluded when serializing.
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+from database.models.receipts import PaymentType
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@dataclass(slots=True)
+class ProductRow:
+    name: str
+    price: Decimal
+    quantity: Decimal
+    total: Decimal
+
+
+@dataclass(slots=True)
+class PaymentRow:
+    type: PaymentType
+    amount: Decimal
+
+
+@dataclass(slots=True)
+class ReceiptRow:
+    receipt_id: int | None = None
+    products: list[ProductRow] | None = None
+    payment: PaymentRow | None = None
+    comment: str | None = None
+    total: Decimal | None = None
+    rest: Decimal | None = None
+    created_at: str | None = None
+    user_full_name: str | None = None
@@ -1,9 +1,9 @@
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.dialects.postgresql import insert
 
-from database.models import User
+from database.models import User, Username
 from database.repo.base import BaseRepo
 
 
@@ -13,6 +13,7 @@ class UserRepo(BaseRepo):
         full_name: str,
         username: str,
         password_hash: str,
+        user_id: int | None = None,
     ):
         insert_stmt = (
             insert(User)
@@ -20,6 +21,8 @@ class UserRepo(BaseRepo):
             .on_conflict_do_nothing()
             .returning(User)
         )
+        if user_id is not None:
+            insert_stmt = insert_stmt.values(user_id=user_id)
         await self.session.execute(insert_stmt)
 
     async def get_user(self, username: str) -> Optional[User]:
@@ -28,3 +31,27 @@ class UserRepo(BaseRepo):
         )
 
         return result.scalar_one_or_none()
+
+    async def allocate_user_id(self) -> int:
+        return await self.session.scalar(select(func.nextval("users_user_id_seq")))
+
+
+class UsernameRepo(BaseRepo):
+    async def get_user_id(self, username: str) -> int | None:
+        return await self.session.scalar(
+            select(Username.user_id).where(Username.username == username)
+        )
+
+    async def add_username(self, username: str, user_id: int) -> int:
+        """
+        Register `username`, returns the user ID it was registered with first.
+        """
+        registered = await self.session.scalar(
+            insert(Username)
+            .values(username=username, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[Username.username])
+            .returning(Username.user_id)
+        )
+        if registered is None:
+            registered = await self.get_user_id(username)
+        return registered
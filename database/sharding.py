@@ -0,0 +1,36 @@
+"""
+Users and their receipts are spread over shards: Postgres databases with the
+same schema, listed in `DBConfig.get_shard_hosts()`.
+
+A user lives on one shard with all of their receipts, payments and stats. User
+and receipt IDs carry their shard in the bits above `SHARD_ID_BITS`, so any ID
+is routed without a lookup. Shard 0 starts its sequences at 1 like a single
+database does, so an existing database becomes shard 0 as is; `cli.shards
+prepare` moves the sequences of the other shards to their own ID range.
+
+Usernames are resolved through the `usernames` directory on shard 0. Users
+missing from it were created before sharding and live on shard 0.
+"""
+
+import zlib
+
+# 2^44 IDs per shard, and IDs of up to 512 shards stay below 2^53, the largest
+# integer a JSON client parsing numbers as doubles reads exactly.
+SHARD_ID_BITS = 44
+
+
+def shard_of(object_id: int) -> int:
+    return object_id >> SHARD_ID_BITS
+
+
+def first_id(shard: int) -> int:
+    return (shard << SHARD_ID_BITS) + 1
+
+
+def last_id(shard: int) -> int:
+    return ((shard + 1) << SHARD_ID_BITS) - 1
+
+
+def shard_for_username(username: str, shard_count: int) -> int:
+    # Stable, so concurrent signups of one username pick the same shard
+    return zlib.crc32(username.encode()) % shard_count
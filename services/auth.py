@@ -10,6 +10,7 @@ from api.dependencies import get_config, get_repository
 from config import Config
 from database.models.users import User
 from database.repo.requests import RequestsRepo
+from database.sharding import shard_for_username
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -23,36 +24,50 @@ def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 
-async def get_current_user(
-    repo: Annotated[RequestsRepo, Depends(get_repository)],
-    config: Annotated[Config, Depends(get_config)],
-    token: Annotated[str, Depends(oauth2_scheme)],
-) -> User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+async def get_token_username(
+    config: Annotated[Config, Depends(get_config)],
+    token: Annotated[str, Depends(oauth2_scheme)],
+) -> str:
     try:
         payload = jwt.decode(
             token, config.api.secret_key, algorithms=[config.api.algorithm]
         )
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise credentials_exception()
 
     except JWTError:
-        raise credentials_exception
+        raise credentials_exception()
+
+    return username
+
 
-    user = await repo.users.get_user(username)
+async def get_user(repo: RequestsRepo, username: str) -> User:
+    user_repo = await repo.for_username(username)
+    user = await user_repo.users.get_user(username)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 
+async def get_current_user(
+    repo: Annotated[RequestsRepo, Depends(get_repository)],
+    username: Annotated[str, Depends(get_token_username)],
+) -> User:
+    return await get_user(repo, username)
+
+
 async def authenticate_user(repo: RequestsRepo, username: str, password: str):
-    user: User = await repo.users.get_user(username)
+    user_repo = await repo.for_username(username)
+    user: User = await user_repo.users.get_user(username)
     if not user:
         return False
     if not verify_password(password, user.password_hash):
@@ -61,6 +76,35 @@ async def authenticate_user(repo: RequestsRepo, username: str, password: str):
     return user
 
 
+async def create_user(
+    repo: RequestsRepo, full_name: str, username: str, password_hash: str
+):
+    if not repo.sharded:
+        await repo.users.create_user(full_name, username, password_hash)
+        await repo.session.commit()
+        return
+
+    # Register the username first: with the directory entry committed, a
+    # signup that fails halfway is completed by the next attempt.
+    directory = repo.for_shard(0)
+    user_id = await directory.usernames.get_user_id(username)
+    if user_id is None:
+        user = await directory.users.get_user(username)
+        if user is None:
+            shard = shard_for_username(username, len(repo.shard_sessions))
+            user_id = await repo.for_shard(shard).users.allocate_user_id()
+        else:
+            user_id = user.user_id
+        user_id = await directory.usernames.add_username(username, user_id)
+        await directory.session.commit()
+
+    shard_repo = repo.for_user(user_id)
+    await shard_repo.users.create_user(
+        full_name, username, password_hash, user_id=user_id
+    )
+    await shard_repo.session.commit()
+
+
 def create_access_token(
     secret_key: str, algorithm: str, data: dict, expires_delta: timedelta
 ):
@@ -0,0 +1,124 @@
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from typing import Protocol
+
+try:
+    from redis import asyncio as redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+def new_version() -> int:
+    # Versions start at a random value, so that a cache that lost its counters
+    # never hands out an ETag that was already issued for different content.
+    return random.getrandbits(48)
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+    async def get_version(self, key: str) -> int: ...
+
+    async def bump_version(self, key: str) -> int: ...
+
+
+class MemoryCacheBackend:
+    """
+    Per-process LRU cache. Invalidation is only visible to the current process,
+    so run a single worker with it or use `RedisCacheBackend`.
+    """
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_version(self, key: str) -> int:
+        return self.versions.setdefault(key, new_version())
+
+    async def bump_version(self, key: str) -> int:
+        self.versions[key] = await self.get_version(key) + 1
+        return self.versions[key]
+
+
+class RedisCacheBackend:
+    """
+    Cache shared by all workers, kept in Redis or any server speaking its protocol.
+    """
+
+    def __init__(self, client: "redis.Redis"):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        if redis is None:
+            raise RuntimeError("Install the 'redis' extra to use the Redis cache")
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def get_version(self, key: str) -> int:
+        await self.client.set(key, new_version(), nx=True)
+        return int(await self.client.get(key))
+
+    async def bump_version(self, key: str) -> int:
+        await self.client.set(key, new_version(), nx=True)
+        return await self.client.incr(key)
+
+
+class ReceiptsCache:
+    """
+    Serialized receipt listings keyed by user, filters and page.
+
+    Every key embeds the user's version counter, and creating a receipt bumps
+    it: all of the user's cached pages become unreachable at once and simply
+    expire, no scan is needed.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    async def get_version(self, user_id: int) -> int:
+        return await self.backend.get_version(f"receipts:version:{user_id}")
+
+    async def invalidate(self, user_id: int) -> None:
+        await self.backend.bump_version(f"receipts:version:{user_id}")
+
+    @staticmethod
+    def make_key(user_id: int, version: int, params: tuple) -> str:
+        digest = hashlib.blake2b(repr(params).encode(), digest_size=12).hexdigest()
+        return f"receipts:{user_id}:{version}:{digest}"
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self.backend.set(key, value, self.ttl)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from database.repo.receipts import RECEIPTS_CHANNEL
+
+log = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        # None marks the end of the stream
+        self.queue: asyncio.Queue[dict | None] = asyncio.Queue(queue_size)
+
+    def end(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class ReceiptFeed:
+    """
+    New receipt events from Postgres NOTIFY, fanned out to subscribers.
+
+    One LISTEN connection per shard serves every subscriber of the worker.
+    Each subscriber has a bounded queue: a client that falls `queue_size`
+    events behind is disconnected instead of slowing down the others or
+    growing the queue, and is expected to reload the receipt list when it
+    reconnects.
+    """
+
+    def __init__(self, dsns: list[str], queue_size: int = 100):
+        self.dsns = dsns
+        self.queue_size = queue_size
+        self.subscriptions: defaultdict[int, set[Subscription]] = defaultdict(set)
+        self.connections: dict[str, asyncpg.Connection] = {}
+        self.lock = asyncio.Lock()
+        self.dropped = 0
+
+    async def start(self) -> None:
+        async with self.lock:
+            for dsn in self.dsns:
+                connection = self.connections.get(dsn)
+                if connection is not None and not connection.is_closed():
+                    continue
+                connection = await asyncpg.connect(dsn)
+                connection.add_termination_listener(self._on_termination)
+                await connection.add_listener(RECEIPTS_CHANNEL, self._on_notification)
+                self.connections[dsn] = connection
+
+    async def close(self) -> None:
+        async with self.lock:
+            for connection in self.connections.values():
+                # Closed on purpose, not lost
+                connection.remove_termination_listener(self._on_termination)
+                await connection.close()
+            self.connections.clear()
+        # Open streams would wait for events that no longer come
+        self._end_subscriptions()
+
+    def publish(self, event: dict) -> None:
+        for subscription in list(self.subscriptions.get(event["user_id"], ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.subscriptions[event["user_id"]].discard(subscription)
+                subscription.end()
+                self.dropped += 1
+                log.warning("Dropped a slow feed subscriber of %s", event["user_id"])
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: int):
+        await self.start()
+        subscription = Subscription(self.queue_size)
+        self.subscriptions[user_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            self.subscriptions[user_id].discard(subscription)
+            if not self.subscriptions[user_id]:
+                del self.subscriptions[user_id]
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        self.publish(json.loads(payload))
+
+    def _on_termination(self, connection) -> None:
+        # Events sent while reconnecting would be lost, so end every stream and
+        # let the clients reconnect and catch up
+        log.warning("Receipt feed connection lost")
+        self._end_subscriptions()
+
+    def _end_subscriptions(self) -> None:
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.end()
+        self.subscriptions.clear()
+
+
+async def stream_events(feed: ReceiptFeed, user_id: int, keepalive: float):
+    """
+    Server-Sent Events for the receipts `user_id` creates from now on.
+    """
+    async with feed.subscribe(user_id) as subscription:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except TimeoutError:
+                # Comments keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+
+            if event is None:
+                return
+            yield (
+                f"id: {event['receipt_id']}\n"
+                "event: receipt\n"
+                f"data: {json.dumps(event)}\n\n"
+            )
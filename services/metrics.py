@@ -0,0 +1,31 @@
+from collections.abc import Callable
+from typing import Literal
+
+
+class Metrics:
+    """
+    Process metrics in the Prometheus text format.
+
+    Components keep plain counters, and every metric reads its value from a
+    callback when rendered. Values are per worker process.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, tuple[str, str, Callable[[], float]]] = {}
+
+    def register(
+        self,
+        name: str,
+        kind: Literal["counter", "gauge"],
+        description: str,
+        value: Callable[[], float],
+    ) -> None:
+        self.metrics[name] = (kind, description, value)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, description, value) in self.metrics.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value()}")
+        return "\n".join(lines) + "\n"
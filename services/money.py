@@ -0,0 +1,45 @@
+"""
+Money arithmetic in integer minor units.
+
+Receipt math runs on plain ints instead of `Decimal`:
+
+- amounts (prices, totals, payments) are kopecks, 1/100 of a hryvnia;
+- quantities are thousandths of a unit, the precision `api.models.Product`
+  accepts.
+
+Conversion from `Decimal` is exact: an amount with more than two decimal
+places (or a quantity with more than three) is rejected rather than silently
+rounded. The only rounding step is the line total: `price * quantity` is
+computed exactly in 1/100000 of a hryvnia and rounded half-up to the nearest
+kopeck. Receipt totals are the sum of the rounded line totals, so a receipt
+always adds up to the lines printed on it.
+"""
+
+from decimal import Decimal
+
+QUANTITY_SCALE = 1000
+
+
+def to_kopecks(amount: Decimal) -> int:
+    kopecks = amount.scaleb(2)
+    if kopecks % 1:
+        raise ValueError(f"{amount} has more than two decimal places")
+    return int(kopecks)
+
+
+def to_milli(quantity: Decimal) -> int:
+    milli = quantity.scaleb(3)
+    if milli % 1:
+        raise ValueError(f"{quantity} has more than three decimal places")
+    return int(milli)
+
+
+def from_kopecks(kopecks: int) -> Decimal:
+    return Decimal(kopecks).scaleb(-2)
+
+
+def line_total(price: int, quantity: int) -> int:
+    """
+    Total of `quantity` thousandths at `price` kopecks, rounded half-up.
+    """
+    return (price * quantity + QUANTITY_SCALE // 2) // QUANTITY_SCALE
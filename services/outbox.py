@@ -0,0 +1,224 @@
+"""
+Publishing of the transactional outbox.
+
+Events are written to the `outboxevents` table by the transaction of the
+change they describe, so they exist exactly when the change was committed. A
+relay claims a batch of due events with `FOR UPDATE SKIP LOCKED`, hands it to
+a sink and deletes it in the same transaction: relays running side by side
+never claim the same events, and an event is only gone once a sink has it.
+
+Delivery is at least once. A relay that stops after publishing and before its
+commit leaves the batch to the next claim, so consumers drop events they have
+seen by `event_id`. Batches of different relays may arrive out of order.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+import time
+import urllib.request
+from pathlib import Path
+from typing import BinaryIO, Protocol
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import OutboxEvent
+from database.repo.requests import RequestsRepo
+
+log = logging.getLogger(__name__)
+
+RECEIPT_CREATED = "receipt.created"
+# Items of a streamed receipt, a chunk per event, see
+# `ReceiptService.create_streamed_receipt`
+RECEIPT_ITEMS = "receipt.items"
+
+
+def to_message(event: OutboxEvent) -> dict:
+    return {
+        "event_id": event.event_id,
+        "topic": event.topic,
+        "created_at": event.created_at.isoformat(),
+        "payload": event.payload,
+    }
+
+
+def encode_ndjson(messages: list[dict]) -> bytes:
+    return b"".join(
+        json.dumps(message, separators=(",", ":")).encode() + b"\n"
+        for message in messages
+    )
+
+
+class Sink(Protocol):
+    async def publish(self, messages: list[dict]) -> None:
+        """
+        Deliver a batch durably, or raise. Nothing is retried after a return.
+        """
+
+    async def close(self) -> None: ...
+
+
+class NdjsonSink:
+    """
+    Appends batches to NDJSON files in `directory`, one message per line.
+
+    A new file is started once the current one reaches `max_bytes`, the names
+    carry the host, the process and the time they were started, so relays can
+    share a directory. Every batch is on disk, fsynced, before it counts as
+    published; the newest file of a relay is still being written to.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prefix = f"events-{socket.gethostname()}-{os.getpid()}"
+        self.file: BinaryIO | None = None
+
+    async def publish(self, messages: list[dict]) -> None:
+        await asyncio.to_thread(self._write, encode_ndjson(messages))
+
+    def _write(self, data: bytes) -> None:
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _rotate(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        started = datetime.datetime.now(datetime.timezone.utc)
+        self.file = open(
+            self.directory / f"{self.prefix}-{started:%Y%m%dT%H%M%S%f}.ndjson", "ab"
+        )
+
+    async def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class HttpSink:
+    """
+    POSTs every batch to `url` as an NDJSON body; any 2xx answer acknowledges
+    it, anything else fails the batch.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+
+    async def publish(self, messages: list[dict]) -> None:
+        await asyncio.to_thread(self._post, encode_ndjson(messages))
+
+    def _post(self, body: bytes) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            method="POST",
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        # Raises on 4xx and 5xx answers
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def close(self) -> None:
+        pass
+
+
+class OutboxRelay:
+    """
+    Moves due outbox events of every shard in `session_pools` to `sink`, in
+    batches of up to `batch_size`. Batches the sink fails on are retried after
+    `retry_delay`.
+
+    Counters are kept for the metrics of the relay process.
+    """
+
+    def __init__(
+        self,
+        session_pools: list[async_sessionmaker],
+        sink: Sink,
+        batch_size: int = 500,
+        retry_delay: datetime.timedelta = datetime.timedelta(seconds=30),
+    ):
+        self.session_pools = session_pools
+        self.sink = sink
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self.batches = 0
+        self.published = 0
+        self.failures = 0
+        self.last_batch_size = 0
+        # Seconds from the commit of an event until it was published
+        self.latency_sum = 0.0
+        self.last_latency = 0.0
+        self.publish_seconds = 0.0
+
+    async def relay_batch(self, session_pool: async_sessionmaker) -> int:
+        """
+        Publish one batch of the shard, return the number of events published.
+        """
+        async with session_pool() as session:
+            repo = RequestsRepo(session)
+            events = await repo.outbox.claim_events(self.batch_size)
+            if not events:
+                return 0
+
+            event_ids = [event.event_id for event in events]
+            started = time.monotonic()
+            try:
+                await self.sink.publish([to_message(event) for event in events])
+            except Exception:
+                log.exception("Publishing %s outbox events failed", len(events))
+                self.failures += 1
+                await repo.outbox.postpone_events(event_ids, self.retry_delay)
+                await session.commit()
+                return 0
+
+            await repo.outbox.delete_events(event_ids)
+            await session.commit()
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        latencies = [(now - event.created_at).total_seconds() for event in events]
+        self.batches += 1
+        self.published += len(events)
+        self.last_batch_size = len(events)
+        self.latency_sum += sum(latencies)
+        self.last_latency = max(latencies)
+        self.publish_seconds += time.monotonic() - started
+        return len(events)
+
+    async def run(self, poll_interval: float, stop: asyncio.Event) -> None:
+        await asyncio.gather(
+            *(
+                self.run_shard(session_pool, poll_interval, stop)
+                for session_pool in self.session_pools
+            )
+        )
+
+    async def run_shard(
+        self,
+        session_pool: async_sessionmaker,
+        poll_interval: float,
+        stop: asyncio.Event,
+    ) -> None:
+        while not stop.is_set():
+            try:
+                published = await self.relay_batch(session_pool)
+            except Exception:
+                # The database is unavailable, the events wait for it
+                log.exception("Claiming outbox events failed")
+                published = 0
+
+            # A full batch means there are probably more events due
+            if published < self.batch_size:
+                try:
+                    await asyncio.wait_for(stop.wait(), poll_interval)
+                except TimeoutError:
+                    pass
@@ -1,60 +1,281 @@
-from datetime import datetime
+import asyncio
+import base64
+import binascii
+import json
+import re
+from collections.abc import AsyncIterable, AsyncIterator, Sequence
+from datetime import date, datetime, timezone
 from decimal import Decimal
 
-from api.exceptions import NotEnoughMoney
+from pydantic import BaseModel, ValidationError
+from pydantic_core import to_json
+
+from api.exceptions import (
+    InvalidCursor,
+    InvalidFields,
+    InvalidReceiptStream,
+    NotEnoughMoney,
+    ReceiptStreamTimeout,
+)
 from api.models import (
     CreateReceiptRequest,
     CreateReceiptResponse,
     Payment,
+    Product,
     ProductResponse,
+    ProductStatsResponse,
+    SearchReceiptsResponse,
+    StreamedReceiptHeader,
+    StreamedReceiptResponse,
 )
-from database.models.receipts import PaymentType
+from database.models.receipts import PaymentType, Receipt
+from database.repo.receipts import ReceiptSort
 from database.repo.requests import RequestsRepo
+from database.repo.rows import ReceiptRow
+from services import money
+from services.cache import ReceiptsCache
+from services.outbox import RECEIPT_CREATED, RECEIPT_ITEMS
+
+# Fields a receipt listing can be projected to
+RECEIPT_FIELDS = (
+    "receipt_id",
+    "products",
+    "payment",
+    "comment",
+    "total",
+    "rest",
+    "created_at",
+)
+# `view=summary`: everything but the products, read without the items query
+SUMMARY_FIELDS = frozenset(RECEIPT_FIELDS) - {"products"}
+# Products of a streamed receipt priced and stored at a time
+STREAM_CHUNK_SIZE = 1_000
 
 
 class ReceiptService:
-    def __init__(self, repo: RequestsRepo) -> None:
+    def __init__(self, repo: RequestsRepo, cache: ReceiptsCache | None = None) -> None:
         self.repo = repo
+        self.cache = cache
 
-    async def create_receipt(self, user_id: int, receipt_data: CreateReceiptRequest):
-        products_response = [
-            ProductResponse(
-                name=product.name,
-                price=product.price,
-                quantity=product.quantity,
-                total=product.price * product.quantity,
-            )
-            for product in receipt_data.products
-        ]
-
-        total: Decimal = sum(product.total for product in products_response)
-        rest = receipt_data.payment.amount - total
-        if rest < 0:
-            raise NotEnoughMoney()
+    async def create_receipt(
+        self,
+        user_id: int,
+        receipt_data: CreateReceiptRequest,
+        user_full_name: str | None = None,
+        text_widths: Sequence[int] = (),
+        created_at: datetime | None = None,
+        spool_id: str | None = None,
+        commit: bool = True,
+    ):
+        """
+        Store the receipt. With `user_full_name` given, its text is also rendered
+        for every width in `text_widths`, so reprints don't render it again.
 
+        Receipts replayed from the spool keep the time they were accepted at and
+        record their provisional `spool_id`; the replayer commits them in bulk
+        with `commit=False`, see `services.spool`.
+        """
+        products_response, total, rest = price_receipt(receipt_data)
         receipt = await self.repo.receipts.create_receipt(
-            user_id=user_id, total=total, rest=rest, comment=receipt_data.comment
+            user_id=user_id,
+            total=money.from_kopecks(total),
+            rest=money.from_kopecks(rest),
+            comment=receipt_data.comment,
+            created_at=created_at,
         )
+        if spool_id is not None:
+            await self.repo.receipts.add_spooled_receipt(spool_id, receipt.receipt_id)
 
-        await self.repo.receipts.create_receipt_items(
+        product_ids = await self.repo.receipts.create_receipt_items(
             receipt_id=receipt.receipt_id, products=products_response
         )
+        await self.repo.analytics.add_product_sales(
+            user_id=user_id,
+            day=receipt.created_at.astimezone(timezone.utc).date(),
+            sales=[
+                (product_ids[product.name], product.quantity, product.total)
+                for product in products_response
+            ],
+        )
         await self.repo.payments.create_payment(
             receipt_id=receipt.receipt_id,
             payment_type=receipt_data.payment.type,
             amount=receipt_data.payment.amount,
         )
-        await self.repo.session.commit()
 
-        return CreateReceiptResponse(
+        response = CreateReceiptResponse(
             receipt_id=receipt.receipt_id,
             products=products_response,
             payment=receipt_data.payment,
             comment=receipt_data.comment,
-            total=total,
-            rest=rest,
+            total=money.from_kopecks(total),
+            rest=money.from_kopecks(rest),
             created_at=receipt.created_at.strftime("%Y-%m-%d %H:%M:%S"),
         )
+        if user_full_name is not None and text_widths:
+            printed = response.model_copy(update={"user_full_name": user_full_name})
+            await self.repo.receipts.create_receipt_texts(
+                receipt_id=receipt.receipt_id,
+                texts={
+                    width: generate_receipt_text(printed, width)
+                    for width in set(text_widths)
+                },
+            )
+
+        event = {
+            "user_id": user_id,
+            "receipt_id": receipt.receipt_id,
+            "total": str(response.total),
+            "rest": str(response.rest),
+            "payment_type": receipt_data.payment.type.value,
+            "created_at": response.created_at,
+        }
+        await self.repo.receipts.notify_receipt_created(json.dumps(event))
+        # Published by `cli.outbox_relay` once committed, with the items that
+        # don't fit in a notification
+        await self.repo.outbox.add_event(
+            RECEIPT_CREATED,
+            {
+                **event,
+                "payment_amount": str(receipt_data.payment.amount),
+                "products": [
+                    to_event_product(product) for product in products_response
+                ],
+            },
+        )
+
+        # Last, as the user's counter row stays locked until the commit
+        await self.repo.analytics.add_receipts(user_id)
+
+        if commit:
+            await self.repo.session.commit()
+            if self.cache:
+                await self.cache.invalidate(user_id)
+
+        return response
+
+    async def create_streamed_receipt(
+        self,
+        user_id: int,
+        header: StreamedReceiptHeader,
+        products: AsyncIterable[Product],
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        idle_timeout: float | None = None,
+    ) -> StreamedReceiptResponse:
+        """
+        Store a receipt with more products than are worth holding at once,
+        read from `products` and stored `chunk_size` at a time in one
+        transaction. Memory holds a chunk of products and a sales counter per
+        distinct product.
+
+        The first chunk is read before the transaction starts, so a receipt of
+        up to `chunk_size` products never keeps it open while the client
+        sends. Later chunks are waited for in the transaction, which the
+        database ends after `idle_timeout` seconds of waiting.
+
+        The totals are added up while the items are stored and written last.
+        Instead of a `products` list, the outbox event has an `items_count`,
+        and the items go in a `receipt.items` event per chunk. No text is
+        rendered in advance.
+        """
+        chunks = read_chunks(products, chunk_size)
+        first_chunk = await anext(chunks, None)
+        if idle_timeout is not None:
+            await self.repo.receipts.limit_idle_time(idle_timeout)
+        receipt = await self.repo.receipts.create_receipt(
+            user_id=user_id,
+            total=Decimal(0),
+            rest=Decimal(0),
+            comment=header.comment,
+        )
+        amount = money.to_kopecks(header.payment.amount)
+        total = 0
+        items_count = 0
+        # product_id -> (quantity, revenue), a row per product in the counters
+        sales: dict[int, tuple[Decimal, Decimal]] = {}
+
+        async for chunk in prepend(first_chunk, chunks):
+            products_response = []
+            for product in chunk:
+                product_response, product_total = price_product(product)
+                products_response.append(product_response)
+                total += product_total
+            if total > amount:
+                raise NotEnoughMoney()
+
+            product_ids = await self.repo.receipts.create_receipt_items(
+                receipt_id=receipt.receipt_id, products=products_response
+            )
+            for product in products_response:
+                product_id = product_ids[product.name]
+                quantity, revenue = sales.get(product_id, (0, 0))
+                sales[product_id] = (
+                    quantity + product.quantity,
+                    revenue + product.total,
+                )
+            await self.repo.outbox.add_event(
+                RECEIPT_ITEMS,
+                {
+                    "receipt_id": receipt.receipt_id,
+                    "offset": items_count,
+                    "products": [
+                        to_event_product(product) for product in products_response
+                    ],
+                },
+            )
+            items_count += len(products_response)
+
+        rest = amount - total
+        await self.repo.receipts.set_receipt_totals(
+            receipt.receipt_id, money.from_kopecks(total), money.from_kopecks(rest)
+        )
+        await self.repo.analytics.add_product_sales(
+            user_id=user_id,
+            day=receipt.created_at.astimezone(timezone.utc).date(),
+            sales=[
+                (product_id, quantity, revenue)
+                for product_id, (quantity, revenue) in sales.items()
+            ],
+        )
+        await self.repo.payments.create_payment(
+            receipt_id=receipt.receipt_id,
+            payment_type=header.payment.type,
+            amount=header.payment.amount,
+        )
+
+        response = StreamedReceiptResponse(
+            receipt_id=receipt.receipt_id,
+            items_count=items_count,
+            payment=header.payment,
+            comment=header.comment,
+            total=money.from_kopecks(total),
+            rest=money.from_kopecks(rest),
+            created_at=receipt.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        event = {
+            "user_id": user_id,
+            "receipt_id": receipt.receipt_id,
+            "total": str(response.total),
+            "rest": str(response.rest),
+            "payment_type": header.payment.type.value,
+            "created_at": response.created_at,
+        }
+        await self.repo.receipts.notify_receipt_created(json.dumps(event))
+        await self.repo.outbox.add_event(
+            RECEIPT_CREATED,
+            {
+                **event,
+                "payment_amount": str(header.payment.amount),
+                "items_count": items_count,
+            },
+        )
+
+        await self.repo.analytics.add_receipts(user_id)
+        await self.repo.session.commit()
+        if self.cache:
+            await self.cache.invalidate(user_id)
+
+        return response
 
     async def get_receipts(
         self,
@@ -66,8 +287,40 @@ class ReceiptService:
         payment_type: PaymentType | None = None,
         limit: int | None = None,
         offset: int | None = None,
-    ) -> list[CreateReceiptResponse]:
-        results = await self.repo.receipts.get_receipts(
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        return await self.repo.receipts.get_receipts(
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            limit=limit,
+            offset=offset,
+            sort=sort,
+        )
+
+    async def get_receipt_fields(
+        self,
+        user_id: int,
+        fields: frozenset[str],
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        sort: ReceiptSort | None = None,
+    ) -> list[ReceiptRow]:
+        """
+        `get_receipts` for serializing with `include=fields`.
+
+        Without products only the needed columns are selected and the items
+        are not read at all.
+        """
+        filters = dict(
             user_id=user_id,
             start_date=start_date,
             end_date=end_date,
@@ -76,41 +329,216 @@ class ReceiptService:
             payment_type=payment_type,
             limit=limit,
             offset=offset,
+            sort=sort,
+        )
+        if "products" in fields:
+            return await self.get_receipts(**filters)
+
+        return await self.repo.receipts.get_receipt_fields(fields=fields, **filters)
+
+    async def get_receipts_page(
+        self,
+        user_id: int,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        fields: frozenset[str] | None = None,
+        sort: ReceiptSort | None = None,
+        if_none_match: str | None = None,
+    ) -> tuple[str, bytes | None]:
+        """
+        Serialized `get_receipts` page and its ETag, served from the cache.
+
+        With `fields` given, receipts only contain these fields, see
+        `get_receipt_fields`. The body is None when the client's
+        `if_none_match` ETag is still current.
+        """
+        params = (start_date, end_date, min_total, max_total, payment_type)
+        params += (limit, offset, fields and sorted(fields), sort)
+        version = await self.cache.get_version(user_id)
+        key = self.cache.make_key(user_id, version, params)
+        etag = f'"{key}"'
+        if if_none_match == etag:
+            return etag, None
+
+        body = await self.cache.get(key)
+        if body is None:
+            filters = dict(
+                user_id=user_id,
+                start_date=start_date,
+                end_date=end_date,
+                min_total=min_total,
+                max_total=max_total,
+                payment_type=payment_type,
+                limit=limit,
+                offset=offset,
+                sort=sort,
+            )
+            if fields is None:
+                body = to_json(await self.get_receipts(**filters))
+            else:
+                receipts = await self.get_receipt_fields(fields=fields, **filters)
+                body = to_json(receipts, include={"__all__": fields})
+            await self.cache.set(key, body)
+
+        return etag, body
+
+    async def count_receipts(
+        self,
+        user_id: int,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        exact: bool = False,
+        timeout: float = 1.0,
+    ) -> tuple[int, bool]:
+        """
+        Number of the user's receipts matching the filters, and whether it is
+        exact.
+
+        Without filters it is read from the user's receipts counter. Otherwise
+        it is the planner's estimate, at most the user's total, or with
+        `exact` the receipts are counted, falling back to the estimate after
+        `timeout` seconds.
+        """
+        total = await self.repo.analytics.get_receipts_count(user_id)
+        filters = dict(
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+        )
+        if not any(filters.values()) or not total:
+            return total, True
+
+        if exact:
+            count = await self.repo.receipts.count_receipts(
+                user_id, timeout=timeout, **filters
+            )
+            if count is not None:
+                return count, True
+
+        estimate = await self.repo.receipts.estimate_receipts_count(user_id, **filters)
+        return min(estimate, total), False
+
+    async def search_receipts(
+        self,
+        user_id: int,
+        text: str,
+        start_date: datetime | None = None,
+        end_date: datetime | None = None,
+        min_total: Decimal | None = None,
+        max_total: Decimal | None = None,
+        payment_type: PaymentType | None = None,
+        limit: int | None = None,
+        cursor: str | None = None,
+    ) -> SearchReceiptsResponse:
+        query = build_search_query(text)
+        if not query:
+            return SearchReceiptsResponse(receipts=[])
+
+        results = await self.repo.receipts.search_receipts(
+            user_id=user_id,
+            query=query,
+            start_date=start_date,
+            end_date=end_date,
+            min_total=min_total,
+            max_total=max_total,
+            payment_type=payment_type,
+            limit=limit,
+            after=decode_search_cursor(cursor) if cursor else None,
+        )
+
+        next_cursor = None
+        if limit and len(results) == limit:
+            last_receipt, last_rank = results[-1]
+            next_cursor = encode_search_cursor(last_rank, last_receipt.receipt_id)
+
+        return SearchReceiptsResponse(
+            receipts=[self._to_response(receipt) for receipt, _ in results],
+            next_cursor=next_cursor,
+        )
+
+    async def get_top_products(
+        self,
+        user_id: int,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        order_by: str = "revenue",
+        limit: int | None = None,
+    ) -> list[ProductStatsResponse]:
+        results = await self.repo.analytics.get_top_products(
+            user_id=user_id,
+            start_date=start_date,
+            end_date=end_date,
+            order_by=order_by,
+            limit=limit,
         )
         return [
-            CreateReceiptResponse(
-                receipt_id=receipt.receipt_id,
-                products=[
-                    ProductResponse(
-                        name=item.product_name,
-                        price=item.price_per_unit,
-                        quantity=item.quantity,
-                        total=item.total_price,
-                    )
-                    for item in receipt.items
-                ],
-                payment=Payment(
-                    type=receipt.payment.type,
-                    amount=receipt.payment.amount,
-                ),
-                total=receipt.total,
-                rest=receipt.rest,
-                comment=receipt.comment,
-                created_at=receipt.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            ProductStatsResponse(
+                name=row.name,
+                quantity=row.quantity,
+                revenue=row.revenue,
+                receipts_count=row.receipts_count,
             )
-            for receipt in results
+            for row in results
         ]
 
-    async def get_receipt_by_id(self, receipt_id: int):
-        receipt = await self.repo.receipts.get_receipt_by_id(receipt_id=receipt_id)
+    async def get_receipts_by_ids(
+        self, user_id: int, receipt_ids: list[int], user_full_name: str | None = None
+    ) -> tuple[list[ReceiptRow], list[int]]:
+        """
+        Receipts of `user_id` in the order of `receipt_ids`, and the IDs that
+        don't exist or belong to another user. Repeated IDs are returned once.
+        """
+        receipt_ids = list(dict.fromkeys(receipt_ids))
+        found = {
+            receipt.receipt_id: receipt
+            for receipt in await self.repo.receipts.get_receipts_by_ids(
+                user_id=user_id, receipt_ids=receipt_ids
+            )
+        }
+
+        receipts, missing = [], []
+        for receipt_id in receipt_ids:
+            receipt = found.get(receipt_id)
+            if receipt is None:
+                missing.append(receipt_id)
+            else:
+                receipt.user_full_name = user_full_name
+                receipts.append(receipt)
+        return receipts, missing
+
+    async def get_receipt_by_id(self, receipt_id: int) -> ReceiptRow | None:
+        return await self.repo.receipts.get_receipt_by_id(receipt_id=receipt_id)
+
+    async def get_receipt_text(self, receipt_id: int, width: int) -> str | None:
+        text = await self.repo.receipts.get_receipt_text(receipt_id, width)
+        if text is not None:
+            return text
+
+        # Not rendered at creation time: other width, or an older receipt
+        receipt = await self.get_receipt_by_id(receipt_id)
         if not receipt:
             return None
+        return generate_receipt_text(
+            CreateReceiptResponse.model_validate(receipt, from_attributes=True), width
+        )
 
+    @staticmethod
+    def _to_response(receipt: Receipt) -> CreateReceiptResponse:
         return CreateReceiptResponse(
             receipt_id=receipt.receipt_id,
             products=[
                 ProductResponse(
-                    name=item.product_name,
+                    name=item.product.name,
                     price=item.price_per_unit,
                     quantity=item.quantity,
                     total=item.total_price,
@@ -122,13 +550,184 @@ class ReceiptService:
                 amount=receipt.payment.amount,
             ),
             total=receipt.total,
-            comment=receipt.comment,
             rest=receipt.rest,
-            user_full_name=receipt.user.full_name,
+            comment=receipt.comment,
             created_at=receipt.created_at.strftime("%Y-%m-%d %H:%M:%S"),
         )
 
 
+def price_product(product: Product) -> tuple[ProductResponse, int]:
+    """
+    The priced product and its total in kopecks.
+    """
+    product_total = money.line_total(
+        money.to_kopecks(product.price), money.to_milli(product.quantity)
+    )
+    product_response = ProductResponse(
+        name=product.name,
+        price=product.price,
+        quantity=product.quantity,
+        total=money.from_kopecks(product_total),
+    )
+    return product_response, product_total
+
+
+def price_receipt(
+    receipt_data: CreateReceiptRequest,
+) -> tuple[list[ProductResponse], int, int]:
+    """
+    The priced products of a receipt, its total and the rest, in kopecks.
+    """
+    products_response = []
+    total = 0
+    for product in receipt_data.products:
+        product_response, product_total = price_product(product)
+        products_response.append(product_response)
+        total += product_total
+
+    rest = money.to_kopecks(receipt_data.payment.amount) - total
+    if rest < 0:
+        raise NotEnoughMoney()
+    return products_response, total, rest
+
+
+def to_event_product(product: ProductResponse) -> dict:
+    return {
+        "name": product.name,
+        "price": str(product.price),
+        "quantity": str(product.quantity),
+        "total": str(product.total),
+    }
+
+
+async def read_with_timeout(
+    chunks: AsyncIterable[bytes], timeout: float
+) -> AsyncIterator[bytes]:
+    """
+    `chunks` of a body, raising ReceiptStreamTimeout when the next one takes
+    more than `timeout` seconds to arrive.
+    """
+    iterator = aiter(chunks)
+    while True:
+        try:
+            chunk = await asyncio.wait_for(anext(iterator), timeout)
+        except StopAsyncIteration:
+            return
+        except TimeoutError:
+            raise ReceiptStreamTimeout()
+        yield chunk
+
+
+async def read_lines(
+    chunks: AsyncIterable[bytes], max_line_bytes: int
+) -> AsyncIterator[bytes]:
+    """
+    Non-empty lines of a body read in `chunks`, holding one line at a time.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        # A chunk may hold whole lines of any length
+        for line in [*lines, buffer]:
+            if len(line) > max_line_bytes:
+                raise InvalidReceiptStream(f"Line longer than {max_line_bytes} bytes")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def parse_line(model: type[BaseModel], line: bytes, number: int):
+    try:
+        return model.model_validate_json(line)
+    except ValidationError as error:
+        details = "; ".join(
+            ": ".join(filter(None, [".".join(map(str, detail["loc"])), detail["msg"]]))
+            for detail in error.errors(include_url=False)
+        )
+        raise InvalidReceiptStream(f"Line {number}: {details}")
+
+
+async def parse_streamed_receipt(
+    lines: AsyncIterator[bytes],
+) -> tuple[StreamedReceiptHeader, AsyncIterator[Product]]:
+    """
+    The header of an NDJSON receipt and its products, parsed as they are read.
+    """
+    first = await anext(lines, None)
+    if first is None:
+        raise InvalidReceiptStream("Empty receipt")
+    header = parse_line(StreamedReceiptHeader, first, 1)
+
+    async def products() -> AsyncIterator[Product]:
+        number = 1
+        async for line in lines:
+            number += 1
+            yield parse_line(Product, line, number)
+        if number == 1:
+            raise InvalidReceiptStream("No products")
+
+    return header, products()
+
+
+async def prepend(first, items: AsyncIterable) -> AsyncIterator:
+    """
+    `first`, unless None, then `items`.
+    """
+    if first is not None:
+        yield first
+    async for item in items:
+        yield item
+
+
+async def read_chunks(items: AsyncIterable, size: int) -> AsyncIterator[list]:
+    chunk = []
+    async for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_fields(fields: str | None, view: str = "full") -> frozenset[str] | None:
+    """
+    Receipt fields requested with a comma separated `fields` list or a `view`,
+    None for the full receipts.
+    """
+    if fields is not None:
+        requested = frozenset(filter(None, map(str.strip, fields.split(","))))
+        if not requested:
+            raise InvalidFields("No fields given")
+        unknown = requested - set(RECEIPT_FIELDS)
+        if unknown:
+            raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return requested
+    if view == "summary":
+        return SUMMARY_FIELDS
+    return None
+
+
+def build_search_query(text: str) -> str:
+    # Every word becomes a prefix match, so "milk cho" finds "Milk Chocolate"
+    words = re.findall(r"\w+", text.lower())
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def encode_search_cursor(rank: float, receipt_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{rank!r}:{receipt_id}".encode()).decode()
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, receipt_id = base64.urlsafe_b64decode(cursor).decode().split(":")
+        return float(rank), int(receipt_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor()
+
+
 def generate_receipt_text(receipt: CreateReceiptResponse, max_characters: int) -> str:
     block_divider = "=" * max_characters + "\n"
     items_divider = "-" * max_characters + "\n"
@@ -0,0 +1,206 @@
+"""
+Distribution reports over a per-user columnar snapshot of the receipts.
+
+A user's receipts are read once into NumPy arrays, one integer column per
+value, and later refreshes only read receipts above the snapshot's
+`receipt_id` watermark. Receipts are never changed after they are created, so
+appending is enough. Reports are computed with vectorized operations on the
+columns.
+
+Receipt IDs are taken from a sequence before the receipt commits, so a
+receipt can become visible after one with a higher ID. The watermark stays
+below the receipts created within the last `settle` seconds, and these are
+read again, and skipped, until they settle. A receipt that commits more than
+`settle` seconds after its creation is only seen after the snapshot is
+rebuilt, at the latest after `max_age` seconds.
+"""
+
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+from database.models.receipts import PaymentType
+from database.repo.requests import RequestsRepo
+from services import money
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+PERCENTILES = (50, 90, 95, 99)
+REPORT_STATS = ("totals", "basket_size", "hours", "payments")
+COLUMNS = ("receipt_id", "total", "created_at", "payment_type", "items")
+# 1970-01-01 was a Thursday, weekdays count from Monday
+EPOCH_WEEKDAY = 3
+
+
+class ReceiptSnapshot:
+    def __init__(self) -> None:
+        # One row per column, so that every column is contiguous
+        self.data = np.empty((len(COLUMNS), 1024), dtype=np.int64)
+        self.size = 0
+        # Every receipt up to the watermark is in the snapshot
+        self.watermark = 0
+        # Receipts above the watermark that are in the snapshot already
+        self.pending: set[int] = set()
+        self.created = time.monotonic()
+
+    def view(self) -> "np.ndarray":
+        """
+        The receipts so far, one row per column. Appending never changes them,
+        so the view can be read in another thread.
+        """
+        return self.data[:, : self.size]
+
+    def append(self, rows: Sequence[tuple[int, ...]], settled_before: int) -> None:
+        """
+        Add the `ReceiptRepo.get_receipt_columns` rows above the watermark.
+        """
+        if not rows:
+            return
+        block = np.array(rows, dtype=np.int64).T
+        receipt_ids = block[COLUMNS.index("receipt_id")]
+        created_at = block[COLUMNS.index("created_at")]
+
+        new = block
+        if self.pending:
+            new = block[:, ~np.isin(receipt_ids, list(self.pending))]
+        size = self.size + new.shape[1]
+        if size > self.data.shape[1]:
+            data = np.empty((len(COLUMNS), max(size, 2 * self.data.shape[1])), np.int64)
+            data[:, : self.size] = self.data[:, : self.size]
+            self.data = data
+        self.data[:, self.size : size] = new
+        self.size = size
+
+        recent = receipt_ids[created_at >= settled_before]
+        if recent.size:
+            self.watermark = int(recent.min()) - 1
+        else:
+            self.watermark = max(self.watermark, int(receipt_ids.max()))
+        self.pending = set(receipt_ids[receipt_ids > self.watermark].tolist())
+
+
+class ReceiptSnapshots:
+    """
+    Snapshots of the `max_users` users that asked for a report most recently.
+    """
+
+    def __init__(self, max_users: int = 100, max_age: float = 3600, settle: int = 60):
+        self.max_users = max_users
+        self.max_age = max_age
+        self.settle = settle
+        self.snapshots: OrderedDict[int, ReceiptSnapshot] = OrderedDict()
+        self.locks: weakref.WeakValueDictionary[int, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+
+    async def get(self, repo: RequestsRepo, user_id: int) -> ReceiptSnapshot:
+        if np is None:
+            raise RuntimeError("Install the 'reports' extra to use receipt reports")
+
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            snapshot = self.snapshots.get(user_id)
+            if snapshot is None or snapshot.created < time.monotonic() - self.max_age:
+                snapshot = ReceiptSnapshot()
+
+            rows = await repo.receipts.get_receipt_columns(
+                user_id, after_id=snapshot.watermark
+            )
+            snapshot.append(rows, settled_before=int(time.time()) - self.settle)
+
+            self.snapshots[user_id] = snapshot
+            self.snapshots.move_to_end(user_id)
+            while len(self.snapshots) > self.max_users:
+                self.snapshots.popitem(last=False)
+        return snapshot
+
+
+def build_report(
+    view: "np.ndarray",
+    stats: Sequence[str] = REPORT_STATS,
+    start_date: datetime | None = None,
+    end_date: datetime | None = None,
+    bins: int = 10,
+    utc_offset: int = 0,
+) -> dict:
+    """
+    `stats` of the receipts in a `ReceiptSnapshot.view` created between
+    `start_date` and `end_date`.
+
+    Hours are counted in the time zone `utc_offset` minutes from UTC.
+    """
+    column = dict(zip(COLUMNS, view))
+    created_at = column["created_at"]
+    selected = np.ones(created_at.size, dtype=bool)
+    if start_date:
+        selected &= created_at >= int(as_utc(start_date).timestamp())
+    if end_date:
+        selected &= created_at <= int(as_utc(end_date).timestamp())
+
+    totals = column["total"][selected]
+    report: dict = {"receipts_count": int(totals.size)}
+
+    if "totals" in stats:
+        report["totals"] = describe(totals, bins, to_value=money.from_kopecks)
+
+    if "basket_size" in stats:
+        report["basket_size"] = describe(column["items"][selected], bins)
+
+    if "hours" in stats:
+        local = created_at[selected] + utc_offset * 60
+        hours = local // 3600 % 24
+        weekdays = (local // 86400 + EPOCH_WEEKDAY) % 7
+        heatmap = np.bincount(weekdays * 24 + hours, minlength=7 * 24)
+        report["hours"] = heatmap.reshape(7, 24).tolist()
+
+    if "payments" in stats:
+        payment_types = column["payment_type"][selected]
+        report["payments"] = {
+            payment_type: {
+                "count": int(np.count_nonzero(payment_types == index)),
+                "total": money.from_kopecks(int(totals[payment_types == index].sum())),
+            }
+            for index, payment_type in enumerate(PaymentType)
+        }
+
+    return report
+
+
+def describe(values: "np.ndarray", bins: int, to_value=int) -> dict | None:
+    """
+    Mean, percentiles and histogram of integer `values`, converted with
+    `to_value`.
+    """
+    if not values.size:
+        return None
+
+    # Integer bin edges, so that every bin holds whole values
+    edges = np.unique(
+        np.ceil(np.linspace(values.min(), values.max() + 1, bins + 1))
+    ).astype(np.int64)
+    counts, _ = np.histogram(values, bins=edges)
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "mean": to_value(round(float(values.mean()))),
+        "percentiles": {
+            str(percentile): to_value(round(float(value)))
+            for percentile, value in zip(PERCENTILES, percentiles)
+        },
+        "histogram": {
+            "edges": [to_value(int(edge)) for edge in edges],
+            "counts": counts.tolist(),
+        },
+    }
+
+
+def as_utc(value: datetime) -> datetime:
+    # Naive datetimes are UTC, as for the receipt filters
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one run of the function.
+
+    The first caller starts `fn` in its own task and later callers wait for
+    the same result or exception, until the task is done. Waiters are shielded
+    from each other: a cancelled caller, even the one that started the run,
+    stops waiting without cancelling the run for the others. So `fn` must not
+    use resources of the caller's request, such as its database session.
+    """
+
+    def __init__(self) -> None:
+        self.flights: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self.flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.flights[key] = task
+            task.add_done_callback(lambda task: self._done(key, task))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        # Also marks the exception as retrieved when every waiter is gone
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
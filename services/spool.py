@@ -0,0 +1,360 @@
+"""
+Local durable spool for receipts accepted while the database is unreachable.
+
+Records are appended to segment files as a 4-byte length, the CRC32 of the
+payload and the JSON payload, and fsynced before the receipt is acknowledged.
+Segments are only ever appended to by the process that started them: a record
+torn by a crash ends its segment, and a restarted process starts a new one.
+Pending records are read through `mmap`, from a checkpoint of the last segment
+and offset that was replayed, and segments are deleted once replayed.
+
+Every worker process takes a slot directory of its own under the spool
+directory, locked with `flock`, so workers never share segments and a slot left
+by a stopped worker is drained by the next one to take it.
+
+Replayed receipts are stored with their provisional ID in the same transaction,
+so a record replayed again after a crash is skipped. Records that can never be
+stored are appended to the `dead-letters` file of the slot, in the segment
+format, with the reason, to be inspected and replayed by hand.
+"""
+
+import asyncio
+import datetime
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import suppress
+from pathlib import Path
+from typing import BinaryIO
+
+from sqlalchemy.exc import DBAPIError
+
+from api.models import CreateReceiptRequest
+from database.deadlines import QUERY_CANCELED
+from database.repo.requests import RequestsRepo
+from services.cache import ReceiptsCache
+from services.receipts import ReceiptService
+
+log = logging.getLogger(__name__)
+
+# Length and CRC32 of the payload
+RECORD_HEADER = struct.Struct(">II")
+CHECKPOINT = "checkpoint"
+DEAD_LETTERS = "dead-letters"
+
+
+def is_database_unavailable(error: Exception) -> bool:
+    """
+    Whether `error` means the database can't be reached, rather than a failed
+    query: refused or lost connections and servers starting or shutting down.
+    """
+    if isinstance(error, OSError):
+        return True
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None) or ""
+    return isinstance(error, DBAPIError) and sqlstate.startswith(("08", "57P"))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether storing a record may succeed when tried again: the database is
+    unavailable, or the transaction lost a serialization conflict or deadlock,
+    ran out of resources or was cancelled.
+    """
+    if is_database_unavailable(error):
+        return True
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None) or ""
+    return isinstance(error, DBAPIError) and (
+        sqlstate.startswith(("40", "53")) or sqlstate == QUERY_CANCELED
+    )
+
+
+def segment_path(directory: Path, number: int) -> Path:
+    return directory / f"{number:08d}.log"
+
+
+def scan_segment(path: Path, offset: int) -> Iterator[tuple[int, bytes]]:
+    """
+    `(end offset, payload)` of the complete records of a segment after
+    `offset`, up to the first torn one.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            while offset + RECORD_HEADER.size <= size:
+                length, checksum = RECORD_HEADER.unpack_from(view, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > size:
+                    return
+                payload = view[start : start + length]
+                if zlib.crc32(payload) != checksum:
+                    return
+                offset = start + length
+                yield offset, payload
+
+
+class ReceiptSpool:
+    """
+    Append-only log of receipts in a slot of `directory`, drained by `replay`
+    in batches of up to `batch_size` once the database is back.
+
+    `replay` gets the records of a batch and returns the `(record, reason)` of
+    the records it dropped once the others are stored, which go to the dead
+    letters. It raises while storing may succeed later, and the batch is tried
+    again after `retry_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        replay: Callable[[list[dict]], Awaitable[list[tuple[dict, str]]]],
+        segment_bytes: int = 16 * 1024 * 1024,
+        batch_size: int = 200,
+        retry_interval: float = 5.0,
+    ):
+        self.replay = replay
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+
+        self.directory, self.lock_file = self._take_slot(directory)
+        self.checkpoint = self._read_checkpoint()
+        self.segments = sorted(int(path.stem) for path in self.directory.glob("*.log"))
+        for number in self.segments:
+            if number < self.checkpoint[0]:
+                segment_path(self.directory, number).unlink()
+        self.segments = [n for n in self.segments if n >= self.checkpoint[0]]
+
+        # Left by a previous process, possibly with a torn tail
+        self.depth = sum(1 for _ in self._pending())
+        self.writer: BinaryIO | None = None
+        self.writer_number = max(self.segments, default=self.checkpoint[0]) + 1
+        self.append_lock = asyncio.Lock()
+        self.appended = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.replay_failures = 0
+        # Receipts per second of the last replayed batch
+        self.drain_rate = 0.0
+
+    @staticmethod
+    def _take_slot(directory: Path) -> tuple[Path, BinaryIO]:
+        slot = 0
+        while True:
+            path = directory / str(slot)
+            path.mkdir(parents=True, exist_ok=True)
+            lock_file = open(path / "lock", "ab")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                slot += 1
+                continue
+            return path, lock_file
+
+    def _read_checkpoint(self) -> tuple[int, int]:
+        try:
+            number, offset = (self.directory / CHECKPOINT).read_text().split()
+        except FileNotFoundError:
+            return 0, 0
+        return int(number), int(offset)
+
+    def _write_checkpoint(self, number: int, offset: int) -> None:
+        path = self.directory / CHECKPOINT
+        temporary = path.with_suffix(".tmp")
+        with open(temporary, "w") as file:
+            file.write(f"{number} {offset}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+
+    def _pending(self) -> Iterator[tuple[int, int, bytes]]:
+        """
+        `(segment, end offset, payload)` of the records after the checkpoint.
+        """
+        checkpoint_number, checkpoint_offset = self.checkpoint
+        for number in list(self.segments):
+            offset = checkpoint_offset if number == checkpoint_number else 0
+            for end, payload in scan_segment(
+                segment_path(self.directory, number), offset
+            ):
+                yield number, end, payload
+
+    async def append(self, record: dict) -> None:
+        """
+        Store `record` durably, returns once it is on disk.
+        """
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        async with self.append_lock:
+            await asyncio.to_thread(self._append, payload)
+        self.spooled += 1
+        self.depth += 1
+        self.appended.set()
+
+    def _append(self, payload: bytes) -> None:
+        if self.writer is not None and self.writer.tell() >= self.segment_bytes:
+            self.writer.close()
+            self.writer = None
+            self.writer_number += 1
+        if self.writer is None:
+            self.writer = open(segment_path(self.directory, self.writer_number), "ab")
+            self.segments.append(self.writer_number)
+        try:
+            self.writer.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self.writer.write(payload)
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+        except OSError:
+            # The record may be torn, nothing can follow it in the segment
+            with suppress(OSError):
+                self.writer.close()
+            self.writer = None
+            self.writer_number += 1
+            raise
+
+    def _write_dead_letters(self, dropped: list[tuple[dict, str]]) -> None:
+        with open(self.directory / DEAD_LETTERS, "ab") as file:
+            for record, reason in dropped:
+                payload = json.dumps(
+                    {"record": record, "reason": reason}, separators=(",", ":")
+                ).encode()
+                file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _read_batch(self) -> list[tuple[int, int, bytes]]:
+        batch = []
+        for record in self._pending():
+            batch.append(record)
+            if len(batch) == self.batch_size:
+                break
+        return batch
+
+    def _acknowledge(self, number: int, offset: int) -> None:
+        self._write_checkpoint(number, offset)
+        self.checkpoint = (number, offset)
+        for done in [n for n in self.segments if n < number]:
+            segment_path(self.directory, done).unlink()
+            self.segments.remove(done)
+
+    async def drain(self) -> int:
+        """
+        Replay one batch, return the number of receipts replayed.
+        """
+        batch = await asyncio.to_thread(self._read_batch)
+        if not batch:
+            return 0
+
+        started = time.monotonic()
+        dropped = await self.replay([json.loads(payload) for _, _, payload in batch])
+        # Before the checkpoint, so a crash can only write a dead letter twice
+        if dropped:
+            await asyncio.to_thread(self._write_dead_letters, dropped)
+            self.dropped += len(dropped)
+        number, offset, _ = batch[-1]
+        await asyncio.to_thread(self._acknowledge, number, offset)
+
+        self.replayed += len(batch)
+        self.depth -= len(batch)
+        self.drain_rate = len(batch) / max(time.monotonic() - started, 1e-6)
+        return len(batch)
+
+    async def run(self) -> None:
+        while True:
+            if self.depth <= 0:
+                self.appended.clear()
+                await self.appended.wait()
+            try:
+                await self.drain()
+            except Exception as error:
+                self.replay_failures += 1
+                if not is_database_unavailable(error):
+                    log.exception("Replaying spooled receipts failed")
+                await asyncio.sleep(self.retry_interval)
+
+    def start(self) -> None:
+        if self.task is None:
+            # Bound to the running event loop
+            self.append_lock = asyncio.Lock()
+            self.appended = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        # Leaves the slot to the next process
+        self.lock_file.close()
+
+
+async def replay_receipts(
+    open_repository: Callable,
+    cache: ReceiptsCache | None,
+    text_widths: list[int],
+    records: list[dict],
+) -> list[tuple[dict, str]]:
+    """
+    Store spooled receipts, committed together per shard, and return the
+    records dropped with the reason. Receipts stored before are skipped;
+    receipts of users that no longer exist, or that are rejected by the
+    database, are dropped. Errors that may pass, see `is_transient_error`, are
+    raised, and the batch stays in the spool.
+    """
+    dropped = []
+    users = set()
+    async with open_repository() as repo:
+        for record in records:
+            user_repo: RequestsRepo = await repo.for_username(record["username"])
+            if await user_repo.receipts.get_spooled_receipt_id(record["spool_id"]):
+                continue
+            user = await user_repo.users.get_user(record["username"])
+            if user is None:
+                log.error("Dropping spooled receipt %s of a missing user", record)
+                dropped.append((record, "User does not exist"))
+                continue
+
+            receipt_service = ReceiptService(user_repo.for_user(user.user_id))
+            try:
+                async with receipt_service.repo.session.begin_nested():
+                    await receipt_service.create_receipt(
+                        user.user_id,
+                        CreateReceiptRequest.model_validate(record["request"]),
+                        user_full_name=user.full_name,
+                        text_widths=text_widths,
+                        created_at=datetime.datetime.fromisoformat(
+                            record["created_at"]
+                        ),
+                        spool_id=record["spool_id"],
+                        commit=False,
+                    )
+            except Exception as error:
+                if is_transient_error(error):
+                    raise
+                log.exception("Dropping spooled receipt %s", record)
+                dropped.append((record, repr(error)))
+                continue
+            users.add(user.user_id)
+
+        for session in repo.shard_sessions or [repo.session]:
+            await session.commit()
+
+    if cache:
+        for user_id in users:
+            await cache.invalidate(user_id)
+    return dropped
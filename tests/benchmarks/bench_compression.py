@@ -0,0 +1,92 @@
+"""
+Bandwidth vs CPU trade-off of response compression on receipt list pages.
+
+    python -m tests.benchmarks.bench_compression
+"""
+
+import random
+import timeit
+from decimal import Decimal
+
+from pydantic import TypeAdapter
+
+from api.compression import available_encodings
+from api.models import CreateReceiptResponse, Payment, ProductResponse
+from database.models.receipts import PaymentType
+
+LEVELS = {
+    "gzip": [1, 6, 9],
+    "br": [1, 4, 11],
+    "zstd": [1, 3, 19],
+}
+PRODUCT_NAMES = [
+    f"{kind} {brand} {size}"
+    for kind in ["Молоко", "Хліб", "Кава", "Сир", "Вода", "Cookies", "Juice"]
+    for brand in ["Галичина", "Київхліб", "Lavazza", "Моршинська", "Premium"]
+    for size in ["0.5 л", "1 л", "500 г", "1 кг"]
+]
+
+
+def make_page(receipts: int, items: int) -> bytes:
+    rng = random.Random(receipts * items)
+    page = []
+    for receipt_id in range(receipts):
+        products = [
+            ProductResponse(
+                name=rng.choice(PRODUCT_NAMES),
+                price=Decimal(rng.randint(100, 50_000)).scaleb(-2),
+                quantity=Decimal(rng.randint(1, 5_000)).scaleb(-3),
+                total=Decimal(rng.randint(1, 100_000)).scaleb(-2),
+            )
+            for _ in range(items)
+        ]
+        page.append(
+            CreateReceiptResponse(
+                receipt_id=receipt_id,
+                products=products,
+                payment=Payment(
+                    type=rng.choice(list(PaymentType)), amount=Decimal("5000.00")
+                ),
+                comment=rng.choice([None, "Доставка", "Знижка постійного клієнта"]),
+                total=sum(product.total for product in products),
+                rest=Decimal("0.00"),
+                created_at="2024-05-01 12:00:00",
+            )
+        )
+    return TypeAdapter(list[CreateReceiptResponse]).dump_json(page)
+
+
+def main():
+    encoders = available_encodings()
+    for receipts, items in [(10, 5), (100, 20), (500, 50)]:
+        body = make_page(receipts, items)
+        print(f"\n{receipts} receipts x {items} items: {len(body) / 1024:.1f} KiB")
+        print(
+            f"{'encoding':>10} {'level':>6} {'KiB':>9} {'ratio':>7} {'ms':>9} {'MiB/s':>8}"
+        )
+        for encoding, levels in LEVELS.items():
+            if encoding not in encoders:
+                print(f"{encoding:>10} not installed")
+                continue
+            for level in levels:
+                compressed = encoders[encoding](level).compress(body, True)
+                number = max(1, 2_000_000 // len(body))
+                seconds = (
+                    min(
+                        timeit.repeat(
+                            lambda: encoders[encoding](level).compress(body, True),
+                            number=number,
+                            repeat=3,
+                        )
+                    )
+                    / number
+                )
+                print(
+                    f"{encoding:>10} {level:>6} {len(compressed) / 1024:>9.1f}"
+                    f" {len(body) / len(compressed):>7.1f} {seconds * 1000:>9.3f}"
+                    f" {len(body) / seconds / 2**20:>8.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Decimal vs integer minor-unit receipt arithmetic.
+
+    python -m tests.benchmarks.bench_money
+"""
+
+import random
+import sys
+import timeit
+from decimal import Decimal
+
+from services import money
+
+
+def make_products(count: int) -> list[tuple[Decimal, Decimal]]:
+    rng = random.Random(count)
+    return [
+        (
+            Decimal(rng.randint(1, 1_000_000)).scaleb(-2),
+            Decimal(rng.randint(1, 100_000)).scaleb(-3),
+        )
+        for _ in range(count)
+    ]
+
+
+def decimal_total(products: list[tuple[Decimal, Decimal]]) -> Decimal:
+    return sum(price * quantity for price, quantity in products)
+
+
+def minor_units_total(products: list[tuple[Decimal, Decimal]]) -> int:
+    return sum(
+        money.line_total(money.to_kopecks(price), money.to_milli(quantity))
+        for price, quantity in products
+    )
+
+
+def minor_units_total_preconverted(products: list[tuple[int, int]]) -> int:
+    return sum(money.line_total(price, quantity) for price, quantity in products)
+
+
+def main():
+    print(f"{'items':>8} {'decimal':>12} {'minor':>12} {'minor (ints)':>14}")
+    for count in (10, 100, 1_000, 10_000):
+        products = make_products(count)
+        converted = [
+            (money.to_kopecks(price), money.to_milli(quantity))
+            for price, quantity in products
+        ]
+        number = max(1, 100_000 // count)
+        timings = [
+            min(timeit.repeat(lambda: func(data), number=number, repeat=5)) / number
+            for func, data in (
+                (decimal_total, products),
+                (minor_units_total, products),
+                (minor_units_total_preconverted, converted),
+            )
+        ]
+        print(
+            f"{count:>8} "
+            + " ".join(f"{timing * 1e6:>11.1f}us" for timing in timings[:2])
+            + f" {timings[2] * 1e6:>13.1f}us"
+        )
+
+    price, quantity = make_products(1)[0]
+    print(
+        f"\nbytes per amount: Decimal {sys.getsizeof(price * quantity)}, "
+        f"int {sys.getsizeof(money.line_total(money.to_kopecks(price), money.to_milli(quantity)))}"
+    )
+
+
+if __name__ == "__main__":
+    main()
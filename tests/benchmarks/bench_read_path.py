@@ -0,0 +1,123 @@
+"""
+Memory and time of reading a receipt page: ORM entities converted to Pydantic
+models (the previous approach) vs Core rows in slotted dataclasses.
+
+Needs the database from DB_HOST. The first run creates a user with 100
+receipts of 50 items each.
+
+    python -m tests.benchmarks.bench_read_path
+"""
+
+import asyncio
+import time
+import tracemalloc
+from decimal import Decimal
+
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from api.models import CreateReceiptRequest, CreateReceiptResponse
+from config import load_config
+from database.models.receipts import PaymentType, Receipt
+from database.repo.requests import RequestsRepo
+from services.receipts import ReceiptService
+
+USERNAME = "bench-read-path"
+RECEIPTS = 100
+ITEMS = 50
+
+receipts_adapter = TypeAdapter(list[CreateReceiptResponse])
+
+
+async def prepare_user(repo: RequestsRepo) -> int:
+    user = await repo.users.get_user(USERNAME)
+    if user is None:
+        await repo.users.create_user(USERNAME, USERNAME, "-")
+        await repo.session.commit()
+        user = await repo.users.get_user(USERNAME)
+
+    count = await repo.session.scalar(
+        select(func.count()).where(Receipt.user_id == user.user_id)
+    )
+    request = CreateReceiptRequest(
+        products=[
+            dict(name=f"Bench product {n}", price=Decimal("12.34"), quantity=2)
+            for n in range(ITEMS)
+        ],
+        payment=dict(type=PaymentType.CARD, amount=Decimal("10000")),
+        comment="Read path benchmark",
+    )
+    for _ in range(count, RECEIPTS):
+        await ReceiptService(repo).create_receipt(user.user_id, request)
+    return user.user_id
+
+
+async def read_entities(repo: RequestsRepo, user_id: int) -> bytes:
+    result = await repo.session.scalars(
+        select(Receipt)
+        .options(selectinload(Receipt.payment))
+        .options(selectinload(Receipt.items))
+        .where(Receipt.user_id == user_id)
+        .limit(RECEIPTS)
+    )
+    receipts = [ReceiptService._to_response(receipt) for receipt in result]
+    return receipts_adapter.dump_json(receipts)
+
+
+async def read_rows(repo: RequestsRepo, user_id: int) -> bytes:
+    receipts = await repo.receipts.get_receipts(user_id, limit=RECEIPTS)
+    return to_json(receipts)
+
+
+async def measure(session_pool: async_sessionmaker, read, user_id: int):
+    # Fresh session, so that no entities are reused from the identity map
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        await read(repo, user_id)
+
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        tracemalloc.start()
+        start = time.perf_counter()
+        body = await read(repo, user_id)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        timings = []
+        for _ in range(10):
+            start = time.perf_counter()
+            await read(repo, user_id)
+            timings.append(time.perf_counter() - start)
+            session.expunge_all()
+
+    return len(body), peak, elapsed, min(timings)
+
+
+async def main():
+    config = load_config()
+    engine = create_async_engine(config.db.get_connection_string())
+    session_pool = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_pool() as session:
+        user_id = await prepare_user(RequestsRepo(session))
+
+    print(f"{RECEIPTS} receipts x {ITEMS} items")
+    print(f"{'path':>9} {'body':>10} {'peak':>10} {'traced':>10} {'time':>10}")
+    for name, read in [("entities", read_entities), ("rows", read_rows)]:
+        size, peak, traced, elapsed = await measure(session_pool, read, user_id)
+        print(
+            f"{name:>9} {size / 1024:>7.0f}KiB {peak / 1024:>7.0f}KiB"
+            f" {traced * 1000:>8.1f}ms {elapsed * 1000:>8.1f}ms"
+        )
+    print("\npeak: allocated while reading and serializing, traced: under tracemalloc")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Receipt distribution reports: a loop over row tuples, as the report would be
+computed from query results, vs vectorized over a `ReceiptSnapshot`, and
+refreshing a snapshot by appending vs reading it again.
+
+    python -m tests.benchmarks.bench_reports
+"""
+
+import random
+import statistics
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from database.models.receipts import PaymentType
+from services.reports import PERCENTILES, ReceiptSnapshot, build_report
+
+RECEIPTS = 1_000_000
+APPENDED = 1_000
+START = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def make_rows(count: int, first_id: int = 1) -> list[tuple[int, ...]]:
+    rng = random.Random(count)
+    return [
+        (
+            receipt_id,
+            rng.randint(100, 500_000),
+            START + rng.randint(0, 365 * 86400),
+            rng.randrange(len(PaymentType)),
+            rng.randint(1, 30),
+        )
+        for receipt_id in range(first_id, first_id + count)
+    ]
+
+
+def python_report(rows: list[tuple[int, ...]], bins: int = 10) -> dict:
+    totals = [row[1] for row in rows]
+    low, high = min(totals), max(totals) + 1
+    width = (high - low) / bins
+    histogram = Counter(min(int((total - low) / width), bins - 1) for total in totals)
+    quantiles = statistics.quantiles(totals, n=100, method="inclusive")
+    hours = Counter()
+    payments = Counter()
+    for _, total, created_at, payment_type, _ in rows:
+        hours[(created_at // 86400 + 3) % 7, created_at // 3600 % 24] += 1
+        payments[payment_type] += total
+    return {
+        "mean": statistics.mean(totals),
+        "percentiles": [quantiles[percentile - 1] for percentile in PERCENTILES],
+        "histogram": [histogram[index] for index in range(bins)],
+        "basket_size": statistics.mean(row[4] for row in rows),
+        "hours": hours,
+        "payments": payments,
+    }
+
+
+def best_of(fn, number: int = 5) -> float:
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    rows = make_rows(RECEIPTS)
+    snapshot = ReceiptSnapshot()
+    snapshot.append(rows, settled_before=2**62)
+
+    print(f"{RECEIPTS} receipts, snapshot {snapshot.view().nbytes / 2**20:.0f}MiB")
+    python = best_of(lambda: python_report(rows), number=1)
+    vectorized = best_of(lambda: build_report(snapshot.view()))
+    print(f"{'report':>8} {'python':>10} {'numpy':>10}")
+    print(f"{'':>8} {python * 1000:>8.0f}ms {vectorized * 1000:>8.1f}ms")
+
+    appended = make_rows(APPENDED, first_id=RECEIPTS + 1)
+
+    def refresh():
+        copy = ReceiptSnapshot()
+        copy.data, copy.size = snapshot.data.copy(), snapshot.size
+        copy.watermark = RECEIPTS
+        start = time.perf_counter()
+        copy.append(appended, settled_before=2**62)
+        return time.perf_counter() - start
+
+    def rebuild():
+        ReceiptSnapshot().append(rows + appended, settled_before=2**62)
+
+    print(f"\n{'refresh':>8} {'append':>10} {'rebuild':>10}")
+    print(
+        f"{APPENDED:>8} {min(refresh() for _ in range(5)) * 1000:>8.2f}ms"
+        f" {best_of(rebuild, number=1) * 1000:>8.0f}ms"
+    )
+    print("\nrebuild: converting the rows only, without reading them again")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Per-request statement construction cost of `ReceiptRepo.get_receipts`.
+
+Compares building a fresh `select()` for every call (the previous approach)
+with reusing the per filter combination template. Both include the cache key
+generation SQLAlchemy performs on execute to find the compiled statement.
+
+    python -m tests.benchmarks.bench_statements
+"""
+
+import timeit
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from database.models.receipts import Payment, PaymentType, Receipt
+from database.repo.receipts import RECEIPT_FIELD_COLUMNS, build_receipts_statement
+
+FILTERS = {
+    "none": {},
+    "dates": dict(start_date=datetime(2024, 1, 1), end_date=datetime(2024, 2, 1)),
+    "all": dict(
+        start_date=datetime(2024, 1, 1),
+        end_date=datetime(2024, 2, 1),
+        min_total=Decimal("10"),
+        max_total=Decimal("100"),
+        payment_type=PaymentType.CARD,
+    ),
+}
+
+
+def build_fresh(user_id, filters, limit=10, offset=20):
+    columns = [
+        column
+        for field_columns in RECEIPT_FIELD_COLUMNS.values()
+        for column in field_columns
+    ]
+    select_stmt = (
+        select(*columns)
+        .select_from(Receipt)
+        .join(Payment)
+        .where(Receipt.user_id == user_id)
+    )
+    if "start_date" in filters:
+        select_stmt = select_stmt.where(Receipt.created_at >= filters["start_date"])
+    if "end_date" in filters:
+        select_stmt = select_stmt.where(Receipt.created_at <= filters["end_date"])
+    if "min_total" in filters:
+        select_stmt = select_stmt.where(Receipt.total >= filters["min_total"])
+    if "max_total" in filters:
+        select_stmt = select_stmt.where(Receipt.total <= filters["max_total"])
+    if "payment_type" in filters:
+        select_stmt = select_stmt.where(Payment.type == filters["payment_type"])
+    select_stmt = select_stmt.limit(limit).offset(offset)
+    select_stmt._generate_cache_key()
+    return select_stmt
+
+
+def build_template(user_id, filters, limit=10, offset=20):
+    params = dict(filters, limit=limit, offset=offset)
+    select_stmt = build_receipts_statement(frozenset(params))
+    select_stmt._generate_cache_key()
+    return select_stmt, dict(params, user_id=user_id)
+
+
+def main():
+    dialect = postgresql.asyncpg.dialect()
+    print(f"{'filters':>8} {'fresh':>10} {'template':>10} {'compile':>10}")
+    for name, filters in FILTERS.items():
+        number = 5_000
+        fresh, template = (
+            min(timeit.repeat(lambda: build(1, filters), number=number, repeat=5))
+            / number
+            for build in (build_fresh, build_template)
+        )
+        compile_once = (
+            min(
+                timeit.repeat(
+                    lambda: build_fresh(1, filters).compile(dialect=dialect),
+                    number=500,
+                    repeat=3,
+                )
+            )
+            / 500
+        )
+        print(
+            f"{name:>8} {fresh * 1e6:>8.1f}us {template * 1e6:>8.1f}us"
+            f" {compile_once * 1e6:>8.1f}us"
+        )
+    print("\ncompile: uncached compilation, paid once per template")
+
+
+if __name__ == "__main__":
+    main()
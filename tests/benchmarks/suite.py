@@ -0,0 +1,308 @@
+"""
+Microbenchmarks of the service hot paths, compared against a stored baseline.
+
+    python -m tests.benchmarks.suite run [--filter TEXT] [--output FILE]
+    python -m tests.benchmarks.suite compare [--threshold 0.25] [--absolute]
+    python -m tests.benchmarks.suite save
+
+Every case is timed with `timeit` as the best of several repeats, so noise from
+other processes inflates fewer samples. Times are also stored relative to a
+calibration loop of plain Python timed right before each case, and `compare`
+uses those by default, so a baseline saved on one machine still holds on
+another of a similar kind, or on a busier one; `--absolute` compares
+nanoseconds.
+
+`compare` runs the suite and exits with 1 when a case is slower than in the
+baseline by more than the threshold. After an intended change, `save` stores
+the new baseline in `baseline.json` next to this file.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+from collections.abc import Callable
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from jose import jwt
+from pydantic_core import to_json
+
+from api.models import CreateReceiptRequest, CreateReceiptResponse
+from database.models.receipts import PaymentType
+from database.repo.receipts import (
+    RECEIPT_FIELD_COLUMNS,
+    build_count_statement,
+    build_receipts_statement,
+)
+from services import money
+from services.auth import create_access_token
+from services.receipts import (
+    format_number,
+    format_text,
+    generate_receipt_text,
+    price_receipt,
+)
+
+BASELINE = Path(__file__).with_name("baseline.json")
+# Seconds a repeat of a case runs for at least, and repeats per case
+MIN_SECONDS = 0.05
+REPEAT = 5
+# Runs of the cases that regressed, to tell regressions from noise
+RETRIES = 2
+
+SECRET_KEY = "bench-secret"
+ALGORITHM = "HS256"
+WIDTHS = [20, 30, 60]
+SIZES = [1, 10, 100]
+FILTERS = {
+    "none": frozenset({"limit", "offset"}),
+    "all": frozenset(
+        {
+            "start_date",
+            "end_date",
+            "min_total",
+            "max_total",
+            "payment_type",
+            "limit",
+            "offset",
+        }
+    ),
+}
+PRODUCT_NAMES = [
+    "Молоко Галичина 2.5% 0.9 л",
+    "Хліб Київхліб нарізний",
+    "Кава Lavazza Qualità Oro в зернах 1 кг",
+    "Вода Моршинська негазована 1.5 л",
+    "Cookies",
+]
+LONG_TEXT = " ".join(["Знижка постійного клієнта за картою лояльності"] * 5)
+
+
+def make_request(items: int) -> CreateReceiptRequest:
+    rng = random.Random(items)
+    return CreateReceiptRequest(
+        products=[
+            dict(
+                name=rng.choice(PRODUCT_NAMES),
+                price=Decimal(rng.randint(100, 50_000)).scaleb(-2),
+                quantity=Decimal(rng.randint(1, 5_000)).scaleb(-3),
+            )
+            for _ in range(items)
+        ],
+        payment=dict(type=PaymentType.CARD, amount=Decimal("100000.00")),
+        comment="Доставка",
+    )
+
+
+def make_response(request: CreateReceiptRequest) -> CreateReceiptResponse:
+    products, total, rest = price_receipt(request)
+    return CreateReceiptResponse(
+        receipt_id=17592186044417,
+        products=products,
+        payment=request.payment,
+        comment=request.comment,
+        total=money.from_kopecks(total),
+        rest=money.from_kopecks(rest),
+        created_at="2024-05-01 12:00:00",
+        user_full_name="Latand",
+    )
+
+
+def build_statement_uncached(filters: frozenset[str]):
+    statement = build_receipts_statement.__wrapped__(
+        filters, frozenset(RECEIPT_FIELD_COLUMNS)
+    )
+    # Paid on every execute to find the compiled statement
+    statement._generate_cache_key()
+
+
+def build_statement_cached(filters: frozenset[str]):
+    statement = build_receipts_statement(filters, frozenset(RECEIPT_FIELD_COLUMNS))
+    statement._generate_cache_key()
+
+
+def calibration() -> int:
+    total = 0
+    for number in range(1000):
+        total += number * number
+    return total
+
+
+def make_cases() -> dict[str, Callable[[], object]]:
+    cases: dict[str, Callable[[], object]] = {}
+
+    numbers = [
+        Decimal(random.Random(n).randint(1, 10**8)).scaleb(-2) for n in range(100)
+    ]
+    cases["format_number[100 values]"] = lambda: [format_number(n) for n in numbers]
+    for width in WIDTHS:
+        cases[f"format_text[w={width},short]"] = lambda width=width: format_text(
+            PRODUCT_NAMES[0], width, "1 234.56"
+        )
+        cases[f"format_text[w={width},long]"] = lambda width=width: format_text(
+            LONG_TEXT, width
+        )
+
+    for items in SIZES:
+        request = make_request(items)
+        response = make_response(request)
+        for width in WIDTHS:
+            cases[f"generate_receipt_text[items={items},w={width}]"] = (
+                lambda response=response, width=width: generate_receipt_text(
+                    response, width
+                )
+            )
+        cases[f"price_receipt[items={items}]"] = lambda request=request: (
+            price_receipt(request)
+        )
+        cases[f"CreateReceiptResponse[items={items}]"] = (
+            lambda request=request: make_response(request)
+        )
+        cases[f"model_dump_json[items={items}]"] = response.model_dump_json
+        cases[f"to_json[items={items}]"] = lambda response=response: to_json(response)
+
+    token = create_access_token(
+        SECRET_KEY, ALGORITHM, {"sub": "latand"}, timedelta(days=30)
+    )
+    cases["jwt_encode"] = lambda: create_access_token(
+        SECRET_KEY, ALGORITHM, {"sub": "latand"}, timedelta(days=30)
+    )
+    cases["jwt_decode"] = lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    for name, filters in FILTERS.items():
+        cases[f"receipts_statement[{name},uncached]"] = (
+            lambda filters=filters: build_statement_uncached(filters)
+        )
+        cases[f"receipts_statement[{name},cached]"] = (
+            lambda filters=filters: build_statement_cached(filters)
+        )
+        cases[f"count_statement[{name},uncached]"] = (
+            lambda filters=filters: build_count_statement.__wrapped__(filters)
+        )
+    return cases
+
+
+def measure(fn: Callable[[], object]) -> float:
+    """
+    Seconds per call of `fn`, the best of `REPEAT` runs of at least
+    `MIN_SECONDS`.
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < MIN_SECONDS:
+        number *= 2
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def run(select: Callable[[str], bool]) -> dict:
+    results = {}
+    calibrations = []
+    for name, fn in make_cases().items():
+        if not select(name):
+            continue
+        calibration_seconds = measure(calibration)
+        calibrations.append(calibration_seconds)
+        seconds = measure(fn)
+        results[name] = {
+            "ns": round(seconds * 1e9, 1),
+            "relative": round(seconds / calibration_seconds, 5),
+        }
+        print(f"{name:<45} {seconds * 1e6:>12.2f}us", file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration_ns": round(min(calibrations, default=0) * 1e9, 1),
+        "cases": results,
+    }
+
+
+def keep_best(results: dict, rerun: dict) -> None:
+    for name, result in rerun["cases"].items():
+        if result["relative"] < results["cases"][name]["relative"]:
+            results["cases"][name] = result
+
+
+def find_regressions(
+    baseline: dict, current: dict, threshold: float, key: str = "relative"
+) -> dict[str, float]:
+    """
+    Change of the cases slower than in `baseline` by more than `threshold`.
+    """
+    regressions = {}
+    for name, result in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is not None and result[key] / before[key] - 1 > threshold:
+            regressions[name] = result[key] / before[key] - 1
+    return regressions
+
+
+def print_comparison(baseline: dict, current: dict, key: str, regressions: dict):
+    if baseline["python"] != current["python"]:
+        print(f"Baseline of Python {baseline['python']}, running {current['python']}")
+    print(f"{'case':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if before is None:
+            print(f"{name:<45} {'-':>12} {result['ns'] / 1000:>10.2f}us  new")
+            continue
+        change = result[key] / before[key] - 1
+        print(
+            f"{name:<45} {before['ns'] / 1000:>10.2f}us"
+            f" {result['ns'] / 1000:>10.2f}us {change:>+8.0%}"
+            + ("  REGRESSED" if name in regressions else "")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ["run", "compare", "save"]:
+        command_parser = commands.add_parser(command)
+        command_parser.add_argument("--filter", help="only cases with this in the name")
+    commands.choices["run"].add_argument("--output", type=Path)
+    commands.choices["compare"].add_argument("--baseline", type=Path, default=BASELINE)
+    commands.choices["compare"].add_argument(
+        "--threshold", type=float, default=0.25, help="slowdown that fails, 0.25 = 25%%"
+    )
+    commands.choices["compare"].add_argument(
+        "--absolute", action="store_true", help="compare nanoseconds"
+    )
+    args = parser.parse_args()
+
+    results = run(lambda name: not args.filter or args.filter in name)
+    if args.command == "run":
+        output = json.dumps(results, indent=2, ensure_ascii=False) + "\n"
+        if args.output:
+            args.output.write_text(output)
+        else:
+            print(output, end="")
+    elif args.command == "save":
+        # A baseline too fast by chance would fail every later comparison
+        keep_best(results, run(results["cases"].__contains__))
+        if args.filter:
+            # Keep the baseline of the other cases
+            baseline = json.loads(BASELINE.read_text())
+            baseline["cases"].update(results["cases"])
+            results["cases"] = baseline["cases"]
+        BASELINE.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+    else:
+        baseline = json.loads(args.baseline.read_text())
+        key = "ns" if args.absolute else "relative"
+        regressions = find_regressions(baseline, results, args.threshold, key)
+        # Slowdowns from noise rarely repeat, regressions do
+        for _ in range(RETRIES):
+            if not regressions:
+                break
+            keep_best(results, run(regressions.__contains__))
+            regressions = find_regressions(baseline, results, args.threshold, key)
+        print_comparison(baseline, results, key, regressions)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from tests.benchmarks.suite import find_regressions, keep_best
+
+
+def results(**relative):
+    return {
+        "python": "3.11.7",
+        "cases": {
+            name: {"ns": value * 1000, "relative": value}
+            for name, value in relative.items()
+        },
+    }
+
+
+def test_find_regressions_beyond_threshold():
+    baseline = results(format_text=1.0, jwt_decode=2.0)
+    current = results(format_text=1.2, jwt_decode=3.0, new_case=5.0)
+    assert find_regressions(baseline, current, threshold=0.25) == {"jwt_decode": 0.5}
+    assert set(find_regressions(baseline, current, threshold=0.1)) == {
+        "format_text",
+        "jwt_decode",
+    }
+
+
+def test_reruns_keep_the_fastest_timing():
+    current = results(format_text=1.5, jwt_decode=2.0)
+    keep_best(current, results(format_text=1.1, jwt_decode=2.5))
+    assert current == results(format_text=1.1, jwt_decode=2.0)
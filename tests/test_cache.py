@@ -0,0 +1,58 @@
+import fakeredis
+import pytest
+
+from services.cache import MemoryCacheBackend, ReceiptsCache, RedisCacheBackend
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request):
+    if request.param == "redis":
+        backend = RedisCacheBackend(fakeredis.FakeAsyncRedis())
+    else:
+        backend = MemoryCacheBackend(max_entries=2)
+    return ReceiptsCache(backend, ttl=60)
+
+
+@pytest.mark.anyio
+async def test_invalidate_changes_keys(cache):
+    version = await cache.get_version(1)
+    key = cache.make_key(1, version, (None, 10, 0))
+    await cache.set(key, b"[]")
+    assert await cache.get(key) == b"[]"
+
+    await cache.invalidate(1)
+    new_version = await cache.get_version(1)
+    assert new_version == version + 1
+    assert cache.make_key(1, new_version, (None, 10, 0)) != key
+
+
+@pytest.mark.anyio
+async def test_versions_are_per_user(cache):
+    other_version = await cache.get_version(2)
+    await cache.invalidate(1)
+    assert await cache.get_version(2) == other_version
+
+
+@pytest.mark.anyio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    await backend.set("a", b"1", ttl=60)
+    await backend.set("b", b"2", ttl=60)
+    await backend.get("a")
+    await backend.set("c", b"3", ttl=60)
+
+    assert await backend.get("a") == b"1"
+    assert await backend.get("b") is None
+    assert await backend.get("c") == b"3"
+
+
+@pytest.mark.anyio
+async def test_memory_backend_expires_entries():
+    backend = MemoryCacheBackend()
+    await backend.set("a", b"1", ttl=-1)
+    assert await backend.get("a") is None
@@ -0,0 +1,129 @@
+import gzip
+
+import brotli
+import pytest
+import zstandard
+from fastapi import FastAPI, Header, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.compression import CompressionMiddleware, negotiate_encoding
+
+LARGE_TEXT = "Product 1 x 10.50 = 26.25\n" * 200
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+
+@app.get("/large")
+def large():
+    return PlainTextResponse(LARGE_TEXT)
+
+
+@app.get("/small")
+def small():
+    return PlainTextResponse("small")
+
+
+@app.get("/stream")
+def stream():
+    def lines():
+        for line in LARGE_TEXT.splitlines(keepends=True):
+            yield line
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/etag")
+def etag(if_none_match: str | None = Header(None)):
+    if if_none_match == '"v1"':
+        return Response(status_code=304, headers={"ETag": '"v1"'})
+    return PlainTextResponse(LARGE_TEXT, headers={"ETag": '"v1"'})
+
+
+@app.get("/image")
+def image():
+    return PlainTextResponse(LARGE_TEXT, media_type="image/png")
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app=app) as c:
+        yield c
+
+
+DECOMPRESS = {
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+@pytest.mark.parametrize("path", ["/large", "/stream"])
+def test_compressed_response(client, encoding, path):
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        body = b"".join(response.iter_raw())
+        headers = response.headers
+
+    assert headers["Content-Encoding"] == encoding
+    assert "Accept-Encoding" in headers["Vary"]
+    assert len(body) < len(LARGE_TEXT)
+    assert DECOMPRESS[encoding](body).decode() == LARGE_TEXT
+
+
+def test_content_length_matches_compressed_body(client):
+    with client.stream(
+        "GET", "/large", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        body = b"".join(response.iter_raw())
+        assert int(response.headers["Content-Length"]) == len(body)
+
+
+def test_small_response_is_not_compressed(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text == "small"
+
+
+def test_incompressible_type_is_not_compressed(client):
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_identity_when_nothing_accepted(client):
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.text == LARGE_TEXT
+
+
+def test_vary_on_uncompressed_responses(client):
+    for path, accept_encoding in [("/small", "gzip"), ("/large", "identity")]:
+        response = client.get(path, headers={"Accept-Encoding": accept_encoding})
+        assert "Content-Encoding" not in response.headers
+        assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_etag_per_encoding(client):
+    identity = client.get("/etag", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["ETag"] == '"v1"'
+    gzipped = client.get("/etag", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["ETag"] == '"v1-gzip"'
+
+    for response in [identity, gzipped]:
+        etag = response.headers["ETag"]
+        response = client.get(
+            "/etag", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert "Accept-Encoding" in response.headers["Vary"]
+
+
+def test_negotiate_encoding():
+    supported = ["zstd", "br", "gzip"]
+    assert negotiate_encoding("gzip, deflate, br, zstd", supported) == "zstd"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", supported) == "gzip"
+    assert negotiate_encoding("br;q=0, *", supported) == "zstd"
+    assert negotiate_encoding("identity", supported) is None
+    assert negotiate_encoding("", supported) is None
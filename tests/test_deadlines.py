@@ -0,0 +1,185 @@
+import asyncio
+import os
+import time
+from typing import Annotated
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.deadlines import DisconnectMiddleware, database_error, deadline_exceeded
+from api.dependencies import get_config, get_repository, get_session_pools
+from api.exceptions import DeadlineExceeded
+from config import load_config
+from database.deadlines import is_query_canceled, limit_time, set_deadline
+from database.repo.requests import RequestsRepo
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def sleepy_app():
+    config = load_config()
+    config.deadline.deadline_routes = {"sleep": 0.3}
+    # A single connection, it has to be back in the pool for the next request
+    engine = create_async_engine(
+        config.db.get_connection_string(), pool_size=1, max_overflow=0, pool_timeout=2
+    )
+    session_pool = async_sessionmaker(engine, expire_on_commit=False)
+
+    app = FastAPI()
+    app.add_middleware(DisconnectMiddleware)
+    app.add_exception_handler(DeadlineExceeded, deadline_exceeded)
+    app.add_exception_handler(DBAPIError, database_error)
+    app.dependency_overrides[get_config] = lambda: config
+    app.dependency_overrides[get_session_pools] = lambda: [session_pool]
+
+    @app.get("/sleep")
+    async def sleep(
+        repo: Annotated[RequestsRepo, Depends(get_repository)],
+        seconds: float = 0,
+        times: int = 1,
+    ):
+        for _ in range(times):
+            await repo.session.execute(select(func.pg_sleep(seconds)))
+        timeout = await repo.session.scalar(text("SHOW statement_timeout"))
+        await repo.session.commit()
+        return {"statement_timeout": timeout}
+
+    yield app
+    await engine.dispose()
+
+
+def client_for(app: FastAPI) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    )
+
+
+@pytest.mark.anyio
+async def test_route_deadline_cancels_slow_queries(sleepy_app):
+    async with client_for(sleepy_app) as client:
+        started = time.monotonic()
+        response = await client.get("/sleep", params={"seconds": 5})
+        assert response.status_code == 504
+        assert response.json() == {"detail": "Request deadline exceeded"}
+        assert time.monotonic() - started < 2
+
+        # The timeout is local to the transaction of the request
+        response = await client.get("/sleep")
+        assert response.status_code == 200
+        assert response.json()["statement_timeout"] != "0"
+        [session_pool] = sleepy_app.dependency_overrides[get_session_pools]()
+        async with session_pool() as session:
+            assert await session.scalar(text("SHOW statement_timeout")) == "0"
+
+
+@pytest.mark.anyio
+async def test_deadline_limits_all_queries_together(sleepy_app):
+    async with client_for(sleepy_app) as client:
+        started = time.monotonic()
+        response = await client.get("/sleep", params={"seconds": 0.2, "times": 3})
+        assert response.status_code == 504
+        assert time.monotonic() - started < 0.5
+
+
+@pytest.mark.anyio
+async def test_savepoint_rolls_back_after_a_failed_query():
+    engine = create_async_engine(load_config().db.get_connection_string())
+    async with async_sessionmaker(engine)() as session:
+        set_deadline(session, time.monotonic() + 5)
+        with pytest.raises(DBAPIError):
+            async with session.begin_nested():
+                # Fails after the timeout may be re-armed
+                await session.execute(
+                    text("SELECT 1 / (count(*) - 1) FROM pg_sleep(0.05)")
+                )
+        assert await session.scalar(text("SELECT 1")) == 1
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_limit_time_within_the_deadline():
+    engine = create_async_engine(load_config().db.get_connection_string())
+    sleep = select(func.pg_sleep(1))
+    async with async_sessionmaker(engine)() as session:
+        set_deadline(session, time.monotonic() + 5)
+        with pytest.raises(DBAPIError) as error:
+            async with session.begin_nested(), limit_time(session, 0.1):
+                await session.execute(sleep)
+        assert is_query_canceled(error.value)
+        # Back to the deadline after the block
+        timeout = await session.scalar(text("SHOW statement_timeout"))
+        assert int(timeout.removesuffix("ms")) > 1000
+
+    async with async_sessionmaker(engine)() as session:
+        set_deadline(session, time.monotonic() + 0.1)
+        with pytest.raises(DeadlineExceeded):
+            async with session.begin_nested(), limit_time(session, 5):
+                await session.execute(sleep)
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_request_timeout_header(sleepy_app):
+    async with client_for(sleepy_app) as client:
+        response = await client.get(
+            "/sleep", params={"seconds": 1}, headers={"X-Request-Timeout": "5"}
+        )
+        assert response.status_code == 200
+
+        response = await client.get(
+            "/sleep", params={"seconds": 5}, headers={"X-Request-Timeout": "0.2"}
+        )
+        assert response.status_code == 504
+
+        response = await client.get("/sleep", headers={"X-Request-Timeout": "0"})
+        assert response.status_code == 422
+
+
+@pytest.mark.anyio
+async def test_disconnect_cancels_queries(sleepy_app):
+    sent = []
+
+    async def receive():
+        if not sent:
+            sent.append("request")
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(0.3)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/sleep",
+        "raw_path": b"/sleep",
+        "query_string": b"seconds=5",
+        "root_path": "",
+        "headers": [(b"x-request-timeout", b"30")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    started = time.monotonic()
+    await sleepy_app(scope, receive, send)
+    assert time.monotonic() - started < 2
+    # Nothing is sent to a client that is gone
+    assert sent == ["request"]
+
+    # The only connection of the pool is back and idle
+    async with client_for(sleepy_app) as client:
+        response = await client.get("/sleep")
+        assert response.status_code == 200
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+
+from api.app import app
+from config import load_config
+from database.repo.receipts import RECEIPTS_CHANNEL
+from services.feed import ReceiptFeed, stream_events
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def feed():
+    feed = ReceiptFeed([load_config().db.get_dsn()], queue_size=2)
+    yield feed
+    await feed.close()
+
+
+def make_event(user_id: int, receipt_id: int) -> dict:
+    return {"user_id": user_id, "receipt_id": receipt_id, "total": "1.00"}
+
+
+@pytest.mark.anyio
+async def test_notifications_reach_the_users_subscribers(feed):
+    async with feed.subscribe(1) as first, feed.subscribe(2) as second:
+        connection = await asyncpg.connect(load_config().db.get_dsn())
+        await connection.execute(
+            "SELECT pg_notify($1, $2)", RECEIPTS_CHANNEL, json.dumps(make_event(1, 10))
+        )
+        await connection.close()
+
+        event = await asyncio.wait_for(first.queue.get(), 5)
+        assert event["receipt_id"] == 10
+        assert second.queue.empty()
+
+    assert feed.subscriptions == {}
+
+
+@pytest.mark.anyio
+async def test_slow_subscriber_is_dropped(feed):
+    async with feed.subscribe(1) as fast, feed.subscribe(1) as slow:
+        for receipt_id in range(3):
+            feed.publish(make_event(1, receipt_id))
+            assert (await fast.queue.get())["receipt_id"] == receipt_id
+
+        assert await slow.queue.get() is None
+        assert feed.subscriptions[1] == {fast}
+        assert feed.dropped == 1
+
+
+@pytest.mark.anyio
+async def test_stream_events(feed):
+    events = stream_events(feed, 1, keepalive=0.05)
+    assert await anext(events) == "retry: 3000\n\n"
+    assert await anext(events) == ": keepalive\n\n"
+
+    feed.publish(make_event(1, 5))
+    message = await anext(events)
+    assert message.startswith("id: 5\nevent: receipt\ndata: ")
+    assert json.loads(message.split("data: ")[1]) == make_event(1, 5)
+    await events.aclose()
+
+
+@pytest.mark.anyio
+async def test_close_ends_the_streams(feed):
+    async with feed.subscribe(1) as subscription:
+        [connection] = feed.connections.values()
+        await feed.close()
+
+        assert connection.is_closed()
+        assert await subscription.queue.get() is None
+    assert feed.connections == {}
+    assert feed.subscriptions == {}
+
+
+@pytest.mark.anyio
+async def test_create_receipt_notifies(feed):
+    await feed.start()
+    notifications = asyncio.Queue()
+    [connection] = feed.connections.values()
+    await connection.add_listener(
+        RECEIPTS_CHANNEL, lambda *args: notifications.put_nowait(args[-1])
+    )
+
+    with TestClient(app=app) as client:
+        token = client.post(
+            "/api/v1/signup",
+            json={"username": "feed", "password": "feed", "full_name": "Feed"},
+        ).json()["access_token"]
+        response = client.post(
+            "/api/v1/receipts/",
+            json={
+                "products": [{"name": "Tea", "price": "2.00", "quantity": "1"}],
+                "payment": {"type": "card", "amount": "2.00"},
+            },
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+    event = json.loads(await asyncio.wait_for(notifications.get(), 5))
+    assert event["receipt_id"] == response.json()["receipt_id"]
+    assert event["total"] == "2.00"
+    assert event["payment_type"] == "card"
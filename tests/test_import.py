@@ -0,0 +1,93 @@
+import io
+import json
+from decimal import Decimal
+
+from cli.import_receipts import parse_chunk, read_chunks, read_csv, read_ndjson
+
+CSV_HEADER = (
+    "receipt,created_at,payment_type,payment_amount,comment,name,price,quantity\n"
+)
+
+
+def make_receipt(amount="10.00"):
+    receipt = {
+        "created_at": "2023-03-01T10:00:00+02:00",
+        "products": [{"name": "Tea", "price": "1.50", "quantity": "2"}],
+        "payment": {"type": "cash", "amount": amount},
+    }
+    return json.dumps(receipt).encode() + b"\n"
+
+
+def test_ndjson_resumes_from_checkpoint_offset():
+    data = make_receipt() + b"\n" + make_receipt("20.00") + make_receipt("30.00")
+    chunks = list(read_chunks(read_ndjson(io.BytesIO(data), 0), 2))
+    assert [len(chunk) for _, chunk in chunks] == [2, 1]
+
+    offset = chunks[0][0]
+    resumed = list(read_ndjson(io.BytesIO(data), offset))
+    assert [json.loads(line)["payment"]["amount"] for *_, line in resumed] == ["30.00"]
+
+
+def test_csv_groups_rows_by_receipt():
+    data = (
+        CSV_HEADER
+        + '1,2022-01-01 10:00,card,3.00,"multi\nline",Tea,1.00,1\n'
+        + "1,2022-01-01 10:00,card,3.00,,Milk,2.00,1\n"
+        + "2,2022-02-01 10:00,cash,10,,Bread,5.00,1\n"
+    ).encode()
+    receipts = list(read_csv(io.BytesIO(data), 0))
+    assert [len(rows) for *_, rows in receipts] == [2, 1]
+    assert receipts[0][2][0]["comment"] == "multi\nline"
+
+    _, end, _ = receipts[0]
+    resumed = list(read_csv(io.BytesIO(data), end))
+    assert [rows[0]["name"] for *_, rows in resumed] == ["Bread"]
+
+
+def test_parse_chunk_prepares_and_rejects_records():
+    receipts, errors = parse_chunk(
+        [(0, make_receipt()), (100, make_receipt("1.00")), (200, b'{"bad": 1}')]
+    )
+
+    created_at, total, rest, comment, payment_type, amount, items = receipts[0]
+    assert created_at.isoformat() == "2023-03-01T10:00:00+02:00"
+    assert (total, rest, payment_type) == (Decimal("3.00"), Decimal("7.00"), "CASH")
+    assert items == [("Tea", Decimal("1.50"), Decimal("2"), Decimal("3.00"))]
+
+    assert [offset for offset, _ in errors] == [100, 200]
+    assert "Not enough money" in errors[0][1]
+
+
+def test_parse_chunk_accepts_csv_rows_with_naive_dates():
+    rows = [
+        {
+            "receipt": "1",
+            "created_at": "2022-01-01 10:00",
+            "payment_type": "card",
+            "payment_amount": "3.00",
+            "comment": "",
+            "name": name,
+            "price": price,
+            "quantity": "1",
+        }
+        for name, price in [("Tea", "1.00"), ("Milk", "2.00")]
+    ]
+    receipts, errors = parse_chunk([(0, rows)])
+
+    assert errors == []
+    created_at, total, rest, comment, *_ = receipts[0]
+    assert created_at.isoformat() == "2022-01-01T10:00:00+00:00"
+    assert (total, rest, comment) == (Decimal("3.00"), Decimal("0.00"), None)
+
+
+def test_parse_chunk_rejects_invalid_utf8():
+    ndjson = make_receipt().replace(b"Tea", b"T\xff")
+    data = (CSV_HEADER + "1,2022-01-01 10:00,card,3.00,,Tea,1.00,1\n").encode()
+    data += "2,2022-02-01 10:00,cash,10,,Bread,5.00,1\n".encode().replace(
+        b"Bread", b"Br\xe9ad"
+    )
+    receipts = [(start, rows) for start, _, rows in read_csv(io.BytesIO(data), 0)]
+
+    prepared, errors = parse_chunk([(0, ndjson)] + receipts)
+    assert len(prepared) == 1
+    assert [offset for offset, _ in errors] == [0, receipts[1][0]]
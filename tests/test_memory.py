@@ -0,0 +1,111 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.models import CreateReceiptRequest
+from config import load_config
+from database.models.receipts import PaymentType
+from database.repo.memory import MemoryRequestsRepo
+from database.repo.requests import RequestsRepo
+from services.receipts import ReceiptService, build_search_query
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def repos():
+    engine = create_async_engine(load_config().db.get_connection_string())
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield [RequestsRepo(session), MemoryRequestsRepo()]
+    await engine.dispose()
+
+
+async def create_receipts(repo: RequestsRepo, username: str) -> int:
+    """
+    The same receipts on every backend: totals 1..6, alternating payment types.
+    """
+    await repo.users.create_user(username, username, "-")
+    await repo.session.commit()
+    user_id = (await repo.users.get_user(username)).user_id
+
+    service = ReceiptService(repo)
+    for n in range(1, 7):
+        await service.create_receipt(
+            user_id,
+            CreateReceiptRequest(
+                products=[
+                    dict(name=f"Memory product {n % 2}", price=Decimal(n), quantity=1)
+                ],
+                payment=dict(
+                    type=PaymentType.CASH if n % 2 else PaymentType.CARD,
+                    amount=Decimal(10),
+                ),
+                comment=f"receipt {n}",
+            ),
+        )
+    return user_id
+
+
+@pytest.mark.anyio
+async def test_memory_backend_matches_postgres_filters(repos):
+    username = f"memory-{uuid.uuid4().hex[:8]}"
+    user_ids = [await create_receipts(repo, username) for repo in repos]
+    now = datetime.now(timezone.utc)
+
+    filters = [
+        {},
+        dict(min_total=Decimal(2), max_total=Decimal(4)),
+        dict(min_total=Decimal(0), payment_type=PaymentType.CARD),
+        dict(start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1)),
+        dict(start_date=now + timedelta(hours=1)),
+        dict(end_date=(now - timedelta(hours=1)).replace(tzinfo=None)),
+        dict(limit=2, offset=5),
+    ]
+    for applied in filters:
+        results = [
+            await repo.receipts.get_receipts(user_id, **applied)
+            for repo, user_id in zip(repos, user_ids)
+        ]
+        postgres, memory = [
+            sorted((row.comment, row.total, row.payment, row.products) for row in rows)
+            for rows in results
+        ]
+        assert memory == postgres, applied
+
+    fields = frozenset({"receipt_id", "total", "created_at"})
+    for repo, user_id in zip(repos, user_ids):
+        rows = await repo.receipts.get_receipt_fields(user_id, fields, limit=1)
+        assert rows[0].total and rows[0].created_at and rows[0].payment is None
+
+
+@pytest.mark.anyio
+async def test_memory_backend_matches_postgres_search_and_stats(repos):
+    username = f"memory-{uuid.uuid4().hex[:8]}"
+    user_ids = [await create_receipts(repo, username) for repo in repos]
+
+    for text in ["memory 1", "receipt", "memo prod 0", "nothing"]:
+        postgres, memory = [
+            sorted(
+                receipt.comment
+                for receipt, _ in await repo.receipts.search_receipts(
+                    user_id, build_search_query(text), min_total=Decimal(2)
+                )
+            )
+            for repo, user_id in zip(repos, user_ids)
+        ]
+        assert memory == postgres, text
+
+    postgres, memory = [
+        [tuple(row) for row in await repo.analytics.get_top_products(user_id, limit=1)]
+        for repo, user_id in zip(repos, user_ids)
+    ]
+    assert memory == postgres == [("Memory product 0", Decimal(3), Decimal(12), 3)]
@@ -0,0 +1,81 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from pydantic import ValidationError
+
+from api.models import Product
+from services import money
+from services.receipts import price_product
+
+prices = st.decimals(
+    min_value=Decimal("0.01"), max_value=Decimal("99999999.99"), places=2
+)
+quantities = st.decimals(
+    min_value=Decimal("0.001"), max_value=Decimal("9999999.999"), places=3
+)
+
+
+def decimal_line_total(price: Decimal, quantity: Decimal) -> Decimal:
+    return (price * quantity).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+@given(prices)
+def test_kopecks_round_trip(price):
+    assert money.from_kopecks(money.to_kopecks(price)) == price
+
+
+@given(prices, quantities)
+def test_line_total_matches_decimal(price, quantity):
+    line_total = money.line_total(money.to_kopecks(price), money.to_milli(quantity))
+    assert money.from_kopecks(line_total) == decimal_line_total(price, quantity)
+
+
+@given(st.lists(st.tuples(prices, quantities), min_size=1, max_size=50))
+def test_receipt_total_matches_decimal(products):
+    total = sum(
+        money.line_total(money.to_kopecks(price), money.to_milli(quantity))
+        for price, quantity in products
+    )
+    assert money.from_kopecks(total) == sum(
+        decimal_line_total(price, quantity) for price, quantity in products
+    )
+
+
+def test_line_total_rounds_half_up():
+    assert money.line_total(15, 500) == 8
+    assert money.line_total(1, 499) == 0
+    assert money.line_total(1050, 2500) == 2625
+
+
+def test_from_kopecks_has_two_decimal_places():
+    assert str(money.from_kopecks(4125)) == "41.25"
+    assert str(money.from_kopecks(1000000)) == "10000.00"
+
+
+def test_inexact_amounts_are_rejected():
+    with pytest.raises(ValueError):
+        money.to_kopecks(Decimal("0.001"))
+    with pytest.raises(ValueError):
+        money.to_milli(Decimal("0.0001"))
+
+
+def test_line_total_below_a_kopeck_is_rejected():
+    with pytest.raises(ValidationError, match="less than 0.01"):
+        Product(name="Nail", price=Decimal("0.01"), quantity=Decimal("0.4"))
+    with pytest.raises(ValidationError, match="more than 16 digits"):
+        Product(name="Nail", price=Decimal("50000000"), quantity=Decimal("2000000"))
+    product = Product(name="Nail", price=Decimal("0.01"), quantity=Decimal("0.5"))
+    assert price_product(product)[1] == 1
+
+
+@given(prices, quantities)
+def test_products_are_accepted_with_a_line_total_that_fits(price, quantity):
+    line_total = money.line_total(money.to_kopecks(price), money.to_milli(quantity))
+    try:
+        price_product(Product(name="Nail", price=price, quantity=quantity))
+    except ValidationError:
+        assert not 0 < line_total < 10**16
+    else:
+        assert 0 < line_total < 10**16
@@ -0,0 +1,193 @@
+import asyncio
+import datetime
+import json
+import os
+import threading
+import uuid
+from http.server import ThreadingHTTPServer
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.app import app
+from cli.outbox_relay import ReceiveHandler
+from config import load_config
+from database.models import OutboxEvent
+from database.repo.requests import RequestsRepo
+from services.outbox import RECEIPT_CREATED, HttpSink, NdjsonSink, OutboxRelay
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_pool():
+    engine = create_async_engine(load_config().db.get_connection_string())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def add_events(session_pool, count: int) -> tuple[str, list[int]]:
+    topic = f"test.{uuid.uuid4().hex[:8]}"
+    async with session_pool() as session:
+        repo = RequestsRepo(session)
+        for number in range(count):
+            await repo.outbox.add_event(topic, {"number": number})
+        await session.commit()
+        event_ids = await session.scalars(
+            select(OutboxEvent.event_id)
+            .where(OutboxEvent.topic == topic)
+            .order_by(OutboxEvent.event_id)
+        )
+    return topic, list(event_ids)
+
+
+class ListSink:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.messages = []
+
+    async def publish(self, messages):
+        if self.fail:
+            raise ConnectionError("Sink is down")
+        self.messages += messages
+
+    async def close(self):
+        pass
+
+
+def test_create_receipt_writes_outbox_event():
+    with TestClient(app=app) as client:
+        username = f"outbox-{uuid.uuid4().hex[:8]}"
+        response = client.post(
+            "/api/v1/signup",
+            json={"username": username, "password": "secret", "full_name": "Outbox"},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = client.post(
+            "/api/v1/receipts",
+            json={
+                "products": [{"name": "Outbox tea", "price": "2.50", "quantity": 2}],
+                "payment": {"type": "cash", "amount": "10.00"},
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201
+        receipt = response.json()
+
+    async def read_event():
+        engine = create_async_engine(load_config().db.get_connection_string())
+        async with async_sessionmaker(engine)() as session:
+            event = await session.scalar(
+                select(OutboxEvent).where(
+                    OutboxEvent.payload["receipt_id"].as_integer()
+                    == receipt["receipt_id"]
+                )
+            )
+        await engine.dispose()
+        return event
+
+    event = asyncio.run(read_event())
+    assert event.topic == RECEIPT_CREATED
+    assert event.payload["total"] == "5.00"
+    assert event.payload["payment_type"] == "cash"
+    assert event.payload["payment_amount"] == "10.00"
+    assert event.payload["products"] == [
+        {"name": "Outbox tea", "price": "2.50", "quantity": "2", "total": "5.00"}
+    ]
+
+
+@pytest.mark.anyio
+async def test_relay_publishes_and_deletes_events(session_pool, tmp_path):
+    topic, event_ids = await add_events(session_pool, 5)
+
+    sink = NdjsonSink(tmp_path, max_bytes=1)
+    relay = OutboxRelay([session_pool], sink, batch_size=2)
+    while await relay.relay_batch(session_pool):
+        pass
+    await sink.close()
+
+    messages = [
+        json.loads(line)
+        for path in sorted(tmp_path.iterdir())
+        for line in path.read_text().splitlines()
+    ]
+    assert [
+        message["event_id"] for message in messages if message["topic"] == topic
+    ] == event_ids
+    # Every batch of 2 went to a new file
+    assert len(list(tmp_path.iterdir())) == relay.batches
+    assert relay.published == len(messages)
+    assert relay.last_batch_size <= 2
+
+    async with session_pool() as session:
+        assert not await session.scalar(
+            select(OutboxEvent.event_id).where(OutboxEvent.topic == topic)
+        )
+
+
+@pytest.mark.anyio
+async def test_failed_batches_are_retried(session_pool):
+    topic, event_ids = await add_events(session_pool, 3)
+
+    relay = OutboxRelay(
+        [session_pool], ListSink(fail=True), retry_delay=datetime.timedelta(0)
+    )
+    assert await relay.relay_batch(session_pool) == 0
+    assert relay.failures == 1
+    async with session_pool() as session:
+        attempts = await session.scalars(
+            select(OutboxEvent.attempts).where(OutboxEvent.topic == topic)
+        )
+        assert list(attempts) == [1, 1, 1]
+
+    sink = ListSink()
+    relay.sink = sink
+    while await relay.relay_batch(session_pool):
+        pass
+    assert [
+        message["payload"]["number"]
+        for message in sink.messages
+        if message["topic"] == topic
+    ] == [0, 1, 2]
+
+
+@pytest.mark.anyio
+async def test_relays_claim_disjoint_batches(session_pool):
+    await add_events(session_pool, 4)
+
+    async with session_pool() as first, session_pool() as second:
+        claimed = await RequestsRepo(first).outbox.claim_events(2)
+        other = await RequestsRepo(second).outbox.claim_events(2)
+        assert len(claimed) == len(other) == 2
+        assert not {event.event_id for event in claimed} & {
+            event.event_id for event in other
+        }
+
+
+@pytest.mark.anyio
+async def test_http_sink_posts_ndjson():
+    received = []
+
+    class Handler(ReceiveHandler):
+        def received(self, body):
+            received.append(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sink = HttpSink(f"http://127.0.0.1:{server.server_port}/events", timeout=5)
+        await sink.publish([{"event_id": 1}, {"event_id": 2}])
+        assert received == [b'{"event_id":1}\n{"event_id":2}\n']
+
+        Handler.fail_rate = 1.0
+        with pytest.raises(OSError):
+            await sink.publish([{"event_id": 3}])
+    finally:
+        server.shutdown()
@@ -1,4 +1,7 @@
+import asyncio
+import json
 import os
+import uuid
 from datetime import date
 from decimal import Decimal
 
@@ -6,6 +9,14 @@ import pytest
 from fastapi.testclient import TestClient
 
 from api.app import app
+from api.dependencies import get_config, get_session_pools, open_repository
+from api.exceptions import ReceiptStreamTimeout
+from api.models import CreateReceiptResponse
+from services.receipts import (
+    SUMMARY_FIELDS,
+    generate_receipt_text,
+    read_with_timeout,
+)
 
 os.environ["DB_HOST"] = "localhost:5439"
 os.environ["TESING"] = "1"
@@ -160,8 +171,8 @@ def test_multiple_products(client):
     assert response.status_code == 201
     assert "receipt_id" in response.json()
     assert len(response.json()["products"]) == 2
-    assert response.json()["total"] == "41.250"
-    assert response.json()["rest"] == "9958.750"
+    assert response.json()["total"] == "41.25"
+    assert response.json()["rest"] == "9958.75"
     assert response.json()["comment"] == "Testing"
 
 
@@ -201,6 +212,23 @@ def test_many_products_large_names(client):
     assert response.json()["comment"] == "Test"
 
 
+def test_repeated_product_names(client):
+    token = get_login(client)
+    products = [valid_product, valid_product, {**valid_product, "name": "New product"}]
+    for _ in range(2):
+        response = client.post(
+            "/api/v1/receipts",
+            json={"products": products, "payment": valid_payment_card},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 201
+        assert [product["name"] for product in response.json()["products"]] == [
+            "Product 1",
+            "Product 1",
+            "New product",
+        ]
+
+
 def test_get_receipts(client):
     token = get_login(client)
     response = client.get(
@@ -307,12 +335,377 @@ def test_get_receipts_no_filters(client):
     assert len(receipts) > 0
 
 
+def test_top_products(client):
+    token = get_login(client)
+    for order_by in ["revenue", "quantity"]:
+        response = client.get(
+            "/api/v1/receipts/analytics/products",
+            params={"order_by": order_by, "start_date": date.today().isoformat()},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+        products = response.json()
+        assert len(products) > 0
+        values = [Decimal(product[order_by]) for product in products]
+        assert values == sorted(values, reverse=True)
+
+
+def test_top_products_counts_new_receipt(client):
+    token = get_login(client)
+    product = {"name": "Analytics product", "price": "2.00", "quantity": "3"}
+
+    def get_stats():
+        response = client.get(
+            "/api/v1/receipts/analytics/products",
+            params={"limit": 100},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return next(
+            (p for p in response.json() if p["name"] == product["name"]),
+            {"quantity": "0", "revenue": "0", "receipts_count": 0},
+        )
+
+    before = get_stats()
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": [product, product], "payment": valid_payment_cash},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 201
+    after = get_stats()
+
+    assert Decimal(after["quantity"]) - Decimal(before["quantity"]) == 6
+    assert Decimal(after["revenue"]) - Decimal(before["revenue"]) == 12
+    assert after["receipts_count"] - before["receipts_count"] == 1
+
+
+def test_get_receipts_etag(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/v1/receipts", headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        "/api/v1/receipts", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    response = client.get(
+        "/api/v1/receipts",
+        params={"limit": 5},
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+
+
+def test_get_receipts_summary(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"limit": 1000}
+    full = client.get("/api/v1/receipts", params=params, headers=headers)
+    response = client.get(
+        "/api/v1/receipts", params={**params, "view": "summary"}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != full.headers["ETag"]
+
+    expected = {
+        receipt["receipt_id"]: {
+            key: value for key, value in receipt.items() if key in SUMMARY_FIELDS
+        }
+        for receipt in full.json()
+    }
+    assert {receipt["receipt_id"]: receipt for receipt in response.json()} == expected
+
+
+def test_get_receipts_fields(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get(
+        "/api/v1/receipts",
+        params={"fields": "receipt_id,total", "payment_type": "cash"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert all(set(receipt) == {"receipt_id", "total"} for receipt in response.json())
+
+    response = client.get(
+        "/api/v1/receipts",
+        params={"fields": "receipt_id,products", "view": "summary"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert all(receipt["products"] for receipt in response.json())
+
+    for fields in ["receipt_id,password_hash", ""]:
+        response = client.get(
+            "/api/v1/receipts", params={"fields": fields}, headers=headers
+        )
+        assert response.status_code == 400
+
+
+def test_create_receipt_invalidates_cached_receipts(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"limit": 1000}
+    before = client.get("/api/v1/receipts", params=params, headers=headers)
+
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": [valid_product], "payment": valid_payment_cash},
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+    after = client.get(
+        "/api/v1/receipts",
+        params=params,
+        headers={**headers, "If-None-Match": before.headers["ETag"]},
+    )
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert len(after.json()) == len(before.json()) + 1
+
+
 def test_get_receipt_by_id(client):
     response = client.get("/api/v1/receipts/3")
     assert response.status_code == 200
     assert "receipt_id" in response.json()
 
 
+def test_read_receipts_match_created_receipt(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        "/api/v1/receipts",
+        json={
+            "products": [valid_product, {**valid_product, "name": "Product 3"}],
+            "payment": valid_payment_card,
+            "comment": "Read back",
+        },
+        headers=headers,
+    )
+    assert response.status_code == 201
+    created = CreateReceiptResponse.model_validate(response.json())
+
+    response = client.get(f"/api/v1/receipts/{created.receipt_id}")
+    assert response.status_code == 200
+    by_id = CreateReceiptResponse.model_validate(response.json())
+    assert by_id.user_full_name == "Latand"
+    assert by_id.model_copy(update={"user_full_name": None}) == created
+
+    response = client.get(
+        "/api/v1/receipts",
+        params={"limit": 1000, "payment_type": "card"},
+        headers=headers,
+    )
+    listed = {receipt["receipt_id"]: receipt for receipt in response.json()}
+    assert CreateReceiptResponse.model_validate(listed[created.receipt_id]) == created
+
+
+def test_create_receipt_with_more_items_than_bind_parameters(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    products = [
+        {"name": f"Bulk item {number % 500}", "price": "0.10", "quantity": "1"}
+        for number in range(7000)
+    ]
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": products, "payment": valid_payment_cash},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    assert Decimal(response.json()["total"]) == Decimal("700.00")
+
+    response = client.get(f"/api/v1/receipts/{response.json()['receipt_id']}")
+    assert len(response.json()["products"]) == 7000
+
+
+def test_products_of_a_rolled_back_transaction_are_not_reused(client):
+    token = get_login(client)
+    name = f"Rolled back {uuid.uuid4().hex[:8]}"
+
+    async def create_and_roll_back():
+        opener = open_repository(get_config(), get_session_pools())
+        async with opener as repo:
+            user_repo = await repo.for_username("latand")
+            await user_repo.products.get_or_create_product_ids([name])
+            # Finds the row inserted above
+            await user_repo.products.get_or_create_product_ids([name])
+            await user_repo.session.rollback()
+
+    client.portal.call(create_and_roll_back)
+    response = client.post(
+        "/api/v1/receipts",
+        json={
+            "products": [{**valid_product, "name": name}],
+            "payment": valid_payment_cash,
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 201
+
+
+def stream_receipt(client, headers, header: dict, products: list[dict]):
+    lines = [json.dumps(header)] + [json.dumps(product) for product in products]
+    return client.post(
+        "/api/v1/receipts/stream",
+        content="\n".join(lines).encode(),
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+
+
+def test_create_streamed_receipt(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    products = [
+        {"name": f"Wholesale {number % 7}", "price": "1.25", "quantity": "2"}
+        for number in range(2500)
+    ]
+    response = stream_receipt(
+        client, headers, {"payment": valid_payment_card, "comment": "Invoice"}, products
+    )
+    assert response.status_code == 201
+    created = response.json()
+    assert created["items_count"] == 2500
+    assert Decimal(created["total"]) == Decimal("6250.00")
+    assert Decimal(created["rest"]) == Decimal("3750.00")
+
+    response = client.get(f"/api/v1/receipts/{created['receipt_id']}")
+    receipt = response.json()
+    assert Decimal(receipt["total"]) == Decimal("6250.00")
+    assert receipt["comment"] == "Invoice"
+    assert [product["name"] for product in receipt["products"]] == [
+        product["name"] for product in products
+    ]
+    assert {Decimal(product["total"]) for product in receipt["products"]} == {
+        Decimal("2.50")
+    }
+
+
+def test_create_streamed_receipt_errors(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = stream_receipt(
+        client, headers, {"payment": not_enough_money}, [valid_product] * 3
+    )
+    assert response.status_code == 400
+
+    response = stream_receipt(
+        client,
+        headers,
+        {"payment": valid_payment_cash},
+        [valid_product, invalid_product],
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("Line 3: quantity:")
+
+    response = stream_receipt(client, headers, {"payment": valid_payment_cash}, [])
+    assert response.status_code == 422
+    assert response.json()["detail"] == "No products"
+
+    # Whole in the first chunk of the body
+    long_product = {**valid_product, "name": "x" * 70_000}
+    response = stream_receipt(
+        client,
+        headers,
+        {"payment": valid_payment_cash},
+        [long_product, valid_product],
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Line longer than 65536 bytes"
+
+
+def test_failed_streamed_receipt_leaves_no_products_behind(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    name = f"Failed stream {uuid.uuid4().hex[:8]}"
+    product = {"name": name, "price": "1.00", "quantity": "1"}
+
+    # Runs out of money in the third chunk, after the first two stored items
+    response = stream_receipt(
+        client,
+        headers,
+        {"payment": {"type": "cash", "amount": "2500.00"}},
+        [product] * 3000,
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": [product], "payment": valid_payment_cash},
+        headers=headers,
+    )
+    assert response.status_code == 201
+
+
+def test_stalled_receipt_stream_times_out(client):
+    async def body():
+        yield b'{"payment": {"type": "cash", "amount": "10"}}\n'
+        await asyncio.sleep(1)
+        yield b'{"name": "Late", "price": "1", "quantity": "1"}\n'
+
+    async def read():
+        return [chunk async for chunk in read_with_timeout(body(), 0.1)]
+
+    with pytest.raises(ReceiptStreamTimeout):
+        client.portal.call(read)
+
+
+def test_get_receipts_batch(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    receipt_ids = []
+    for comment in ["Batch 1", "Batch 2"]:
+        response = client.post(
+            "/api/v1/receipts",
+            json={
+                "products": [valid_product],
+                "payment": valid_payment_cash,
+                "comment": comment,
+            },
+            headers=headers,
+        )
+        receipt_ids.append(response.json()["receipt_id"])
+
+    response = client.post(
+        "/api/v1/signup",
+        json={"username": "batch-other", "password": "secret", "full_name": "Other"},
+    )
+    other_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": [valid_product], "payment": valid_payment_cash},
+        headers=other_headers,
+    )
+    other_receipt_id = response.json()["receipt_id"]
+
+    first, second = receipt_ids
+    response = client.get(
+        "/api/v1/receipts/batch",
+        params={"ids": [second, 999999999, first, other_receipt_id, second]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    batch = response.json()
+    assert [receipt["receipt_id"] for receipt in batch["receipts"]] == [second, first]
+    assert [receipt["comment"] for receipt in batch["receipts"]] == [
+        "Batch 2",
+        "Batch 1",
+    ]
+    assert batch["receipts"][0]["products"][0]["name"] == "Product 1"
+    assert batch["missing"] == [999999999, other_receipt_id]
+
+    response = client.get(
+        "/api/v1/receipts/batch", params={"ids": list(range(1, 502))}, headers=headers
+    )
+    assert response.status_code == 422
+
+
 def test_show_receipt_length(client):
     lengths = [20, 30, 40, 50]
     for length in lengths:
@@ -324,3 +717,142 @@ def test_show_receipt_length(client):
 
         for line in response_text.split("\n"):
             assert len(line) <= length
+
+
+def test_show_prerendered_receipt(client):
+    token = get_login(client)
+    response = client.post(
+        "/api/v1/receipts/",
+        json={
+            "products": [valid_product],
+            "payment": valid_payment_card,
+            "comment": "Pre-rendered",
+        },
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    receipt = CreateReceiptResponse.model_validate(
+        client.get(f"/api/v1/receipts/{response.json()['receipt_id']}").json()
+    )
+
+    # The stored default width and a width rendered on read match a fresh render
+    for length in [30, 45]:
+        response = client.get(
+            f"/api/v1/receipts/show/{receipt.receipt_id}/",
+            params={"max_characters": length},
+        )
+        assert response.status_code == 200
+        assert response.text == generate_receipt_text(receipt, length)
+
+
+def test_show_missing_receipt(client):
+    response = client.get("/api/v1/receipts/show/999999999/")
+    assert response.status_code == 404
+
+
+def test_search_receipts_by_product_name(client):
+    token = get_login(client)
+    response = client.get(
+        "/api/v1/receipts/search",
+        params={"q": "produc"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    receipts = response.json()["receipts"]
+    assert len(receipts) > 0
+    assert all(
+        any("product" in product["name"].lower() for product in receipt["products"])
+        for receipt in receipts
+    )
+
+
+def test_search_receipts_by_comment_and_payment_type(client):
+    token = get_login(client)
+    response = client.get(
+        "/api/v1/receipts/search",
+        params={"q": "testing", "payment_type": "cash"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    receipts = response.json()["receipts"]
+    assert len(receipts) > 0
+    assert all(receipt["comment"] == "Testing" for receipt in receipts)
+    assert all(receipt["payment"]["type"] == "cash" for receipt in receipts)
+
+
+def test_search_receipts_pagination(client):
+    token = get_login(client)
+    response = client.get(
+        "/api/v1/receipts/search",
+        params={"q": "product", "limit": 1},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["receipts"]) == 1
+    assert first_page["next_cursor"]
+
+    response = client.get(
+        "/api/v1/receipts/search",
+        params={"q": "product", "limit": 1, "cursor": first_page["next_cursor"]},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert len(second_page["receipts"]) == 1
+    assert (
+        second_page["receipts"][0]["receipt_id"]
+        != first_page["receipts"][0]["receipt_id"]
+    )
+
+
+def test_search_receipts_invalid_cursor(client):
+    token = get_login(client)
+    response = client.get(
+        "/api/v1/receipts/search",
+        params={"q": "product", "cursor": "not-a-cursor"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
+
+
+def test_get_receipts_total_count(client):
+    token = get_login(client)
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/v1/receipts", params={"limit": 1}, headers=headers)
+    assert "X-Total-Count" not in response.headers
+
+    response = client.get(
+        "/api/v1/receipts", params={"limit": 1000, "count": True}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == str(len(response.json()))
+    assert response.headers["X-Total-Count-Exact"] == "true"
+    total = int(response.headers["X-Total-Count"])
+
+    response = client.post(
+        "/api/v1/receipts",
+        json={"products": [valid_product], "payment": valid_payment_card},
+        headers=headers,
+    )
+    params = {"limit": 1, "min_total": "0.01", "count": True}
+    response = client.get("/api/v1/receipts", params=params, headers=headers)
+    assert response.status_code == 200
+    assert 0 < int(response.headers["X-Total-Count"]) <= total + 1
+
+    response = client.get(
+        "/api/v1/receipts", params={**params, "exact": True}, headers=headers
+    )
+    assert response.headers["X-Total-Count"] == str(total + 1)
+    assert response.headers["X-Total-Count-Exact"] == "true"
+
+    response = client.get(
+        "/api/v1/receipts",
+        params={"payment_type": "card", "exact": True},
+        headers=headers,
+    )
+    cards = client.get(
+        "/api/v1/receipts",
+        params={"payment_type": "card", "limit": 1000},
+        headers=headers,
+    )
+    assert response.headers["X-Total-Count"] == str(len(cards.json()))
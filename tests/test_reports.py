@@ -0,0 +1,169 @@
+import os
+import random
+import statistics
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from api.app import app
+from database.models.receipts import PaymentType
+from services.reports import PERCENTILES, ReceiptSnapshot, build_report
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+START = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def random_rows(count: int, first_id: int = 1) -> list[tuple[int, ...]]:
+    return [
+        (
+            receipt_id,
+            random.randint(1, 500_000),
+            START + random.randint(0, 90 * 86400),
+            random.randrange(len(PaymentType)),
+            random.randint(1, 30),
+        )
+        for receipt_id in range(first_id, first_id + count)
+    ]
+
+
+def test_report_matches_python():
+    rows = random_rows(5000)
+    snapshot = ReceiptSnapshot()
+    snapshot.append(rows, settled_before=2**62)
+    start_date = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    report = build_report(snapshot.view(), start_date=start_date, utc_offset=180)
+
+    rows = [row for row in rows if row[2] >= start_date.timestamp()]
+    totals = [row[1] for row in rows]
+    assert report["receipts_count"] == len(rows)
+    assert report["totals"]["mean"] == Decimal(round(statistics.mean(totals))) / 100
+    quantiles = statistics.quantiles(totals, n=100, method="inclusive")
+    assert report["totals"]["percentiles"] == {
+        str(percentile): Decimal(round(quantiles[percentile - 1])) / 100
+        for percentile in PERCENTILES
+    }
+    histogram = report["totals"]["histogram"]
+    assert sum(histogram["counts"]) == len(rows)
+    assert histogram["edges"][0] == Decimal(min(totals)) / 100
+    assert histogram["edges"][-1] == Decimal(max(totals) + 1) / 100
+
+    assert report["basket_size"]["mean"] == round(statistics.mean(r[4] for r in rows))
+
+    local_times = [
+        datetime.fromtimestamp(row[2], timezone(timedelta(minutes=180))) for row in rows
+    ]
+    hours = Counter((time.weekday(), time.hour) for time in local_times)
+    assert report["hours"] == [
+        [hours[weekday, hour] for hour in range(24)] for weekday in range(7)
+    ]
+
+    payment_types = list(PaymentType)
+    for index, payment_type in enumerate(payment_types):
+        paid = [row[1] for row in rows if row[3] == index]
+        assert report["payments"][payment_type] == {
+            "count": len(paid),
+            "total": Decimal(sum(paid)) / 100,
+        }
+
+
+def test_snapshot_keeps_recent_receipts_above_the_watermark():
+    snapshot = ReceiptSnapshot()
+    rows = random_rows(3000)
+    settled_before = rows[-1][2]
+    snapshot.append(rows, settled_before=settled_before)
+
+    # The receipts from `settled_before` on may still have gaps below them
+    recent = [row[0] for row in rows if row[2] >= settled_before]
+    assert snapshot.watermark == min(recent) - 1
+    assert snapshot.pending == {row[0] for row in rows if row[0] > min(recent) - 1}
+
+    # They are read again with the late receipt and the new ones
+    late = (min(recent) + 1000000, 100, settled_before - 10, 0, 1)
+    refreshed = [row for row in rows if row[0] > snapshot.watermark]
+    snapshot.append(refreshed + [late] + random_rows(10, 4000), settled_before=2**62)
+    assert snapshot.size == len(rows) + 11
+    assert sorted(snapshot.view()[0].tolist()) == sorted(
+        [row[0] for row in rows] + [late[0]] + list(range(4000, 4010))
+    )
+    assert snapshot.watermark == late[0] and not snapshot.pending
+    assert np.array_equal(snapshot.view()[:, : len(rows)], np.array(rows).T)
+
+
+def test_distributions_endpoint():
+    with TestClient(app=app) as client:
+        username = f"reports-{uuid.uuid4().hex[:8]}"
+        response = client.post(
+            "/api/v1/signup",
+            json={"username": username, "password": "secret", "full_name": "Reports"},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def create_receipt(price: str, payment_type: str):
+            response = client.post(
+                "/api/v1/receipts",
+                json={
+                    "products": [
+                        {"name": "Report tea", "price": price, "quantity": "1"},
+                        {"name": "Report cake", "price": "1.00", "quantity": "2"},
+                    ],
+                    "payment": {"type": payment_type, "amount": "1000.00"},
+                },
+                headers=headers,
+            )
+            assert response.status_code == 201
+
+        def report(**params):
+            response = client.get(
+                "/api/v1/receipts/analytics/distributions",
+                params=params,
+                headers=headers,
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        assert report() == {
+            "receipts_count": 0,
+            "totals": None,
+            "basket_size": None,
+            "hours": [[0] * 24] * 7,
+            "payments": {
+                "cash": {"count": 0, "total": "0.00"},
+                "card": {"count": 0, "total": "0.00"},
+            },
+        }
+
+        create_receipt("10.00", "cash")
+        create_receipt("20.00", "card")
+        create_receipt("30.00", "cash")
+        first = report(stats=["totals", "payments"], bins=2)
+        assert first["receipts_count"] == 3
+        assert first["totals"]["mean"] == "22.00"
+        assert first["totals"]["percentiles"]["50"] == "22.00"
+        assert first["totals"]["histogram"] == {
+            "edges": ["12.00", "22.01", "32.01"],
+            "counts": [2, 1],
+        }
+        assert first["payments"]["cash"] == {"count": 2, "total": "44.00"}
+        assert first["basket_size"] is None and first["hours"] is None
+
+        # The snapshot only reads the new receipt, and the settling ones again
+        create_receipt("40.00", "card")
+        second = report(stats=["basket_size", "hours"])
+        assert second["receipts_count"] == 4
+        assert second["basket_size"]["percentiles"]["99"] == "2"
+        assert sum(map(sum, second["hours"])) == 4
+
+        future = datetime.now(timezone.utc) + timedelta(days=1)
+        assert report(start_date=future.isoformat())["receipts_count"] == 0
+
+        response = client.get(
+            "/api/v1/receipts/analytics/distributions",
+            params={"stats": "everything"},
+            headers=headers,
+        )
+        assert response.status_code == 422
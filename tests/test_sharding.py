@@ -0,0 +1,160 @@
+"""
+Needs a second Postgres for shard 1, migrated and reachable at SHARD_1_HOST:
+
+    docker-compose --profile shards up -d
+    DB_HOST=localhost:5440 alembic upgrade head
+"""
+
+import asyncio
+import json
+import os
+from decimal import Decimal
+
+import asyncpg
+import pytest
+from fastapi.testclient import TestClient
+
+from cli.shards import prepare
+from config import load_config
+from database.sharding import first_id, last_id, shard_for_username, shard_of
+
+os.environ["DB_HOST"] = "localhost:5439"
+SHARD_1_HOST = os.environ.setdefault("SHARD_1_HOST", "localhost:5440")
+os.environ["DB_SHARD_HOSTS"] = json.dumps([SHARD_1_HOST])
+
+from api.app import app  # noqa: E402
+
+# Usernames hashing to shard 0 and shard 1
+USERNAMES = {0: "shard-user-d", 1: "shard-user-a"}
+LEGACY_USERNAME = "old-merchant"
+
+receipt = {
+    "products": [{"name": "Sharded tea", "price": "3.00", "quantity": "2"}],
+    "payment": {"type": "cash", "amount": "10.00"},
+}
+
+
+def fetchval(shard: int, query: str, *args):
+    async def run():
+        host = load_config().db.get_shard_hosts()[shard]
+        connection = await asyncpg.connect(load_config().db.get_dsn(host))
+        try:
+            return await connection.fetchval(query, *args)
+        finally:
+            await connection.close()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope="module")
+def client():
+    config = load_config()
+    try:
+        asyncio.run(
+            prepare([config.db.get_dsn(host) for host in config.db.get_shard_hosts()])
+        )
+    except OSError:
+        pytest.skip(f"Shard 1 is not reachable at {SHARD_1_HOST}")
+
+    with TestClient(app=app) as c:
+        yield c
+
+
+def signup(client, username: str, password: str = "secret") -> str:
+    response = client.post(
+        "/api/v1/signup",
+        json={"username": username, "password": password, "full_name": username},
+    )
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+
+def test_ids_encode_the_shard():
+    assert shard_of(1) == 0
+    assert shard_of(first_id(1)) == 1
+    assert shard_of(last_id(1)) == 1
+    assert shard_of(last_id(1) + 1) == 2
+    assert [shard_for_username(USERNAMES[shard], 2) for shard in (0, 1)] == [0, 1]
+
+
+@pytest.mark.parametrize("shard", [0, 1])
+def test_users_and_receipts_live_on_their_shard(client, shard):
+    username = USERNAMES[shard]
+    token = signup(client, username)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    user_id = fetchval(0, "SELECT user_id FROM usernames WHERE username = $1", username)
+    assert shard_of(user_id) == shard
+    assert fetchval(shard, "SELECT count(*) FROM users WHERE user_id = $1", user_id)
+    assert not fetchval(
+        1 - shard, "SELECT count(*) FROM users WHERE username = $1", username
+    )
+
+    response = client.post("/api/v1/receipts/", json=receipt, headers=headers)
+    assert response.status_code == 201
+    receipt_id = response.json()["receipt_id"]
+    assert shard_of(receipt_id) == shard
+
+    response = client.get(f"/api/v1/receipts/{receipt_id}")
+    assert response.status_code == 200
+    assert Decimal(response.json()["total"]) == 6
+    assert response.json()["user_full_name"] == username
+
+    response = client.get(f"/api/v1/receipts/show/{receipt_id}/")
+    assert response.status_code == 200
+
+    response = client.get("/api/v1/receipts/", headers=headers)
+    assert response.status_code == 200
+    assert receipt_id in [receipt["receipt_id"] for receipt in response.json()]
+
+    response = client.get(
+        "/api/v1/token", params={"username": username, "password": "secret"}
+    )
+    assert response.status_code == 200
+
+
+def test_signup_is_idempotent(client):
+    signup(client, USERNAMES[1])
+    signup(client, USERNAMES[1])
+    assert (
+        fetchval(1, "SELECT count(*) FROM users WHERE username = $1", USERNAMES[1]) == 1
+    )
+
+
+def test_users_created_before_sharding_stay_on_shard_0(client):
+    assert shard_for_username(LEGACY_USERNAME, 2) == 1
+    signup(client, "legacy-password-source", "legacy")
+    fetchval(
+        0,
+        "INSERT INTO users (full_name, username, password_hash)"
+        " SELECT 'Legacy', $1, password_hash FROM users WHERE username = $2"
+        " ON CONFLICT DO NOTHING",
+        LEGACY_USERNAME,
+        "legacy-password-source",
+    )
+
+    response = client.get(
+        "/api/v1/token", params={"username": LEGACY_USERNAME, "password": "legacy"}
+    )
+    assert response.status_code == 200
+
+    # A signup for the name must not create a second user on its hash shard
+    signup(client, LEGACY_USERNAME, "other password")
+    legacy_id = fetchval(
+        0, "SELECT user_id FROM users WHERE username = $1", LEGACY_USERNAME
+    )
+    assert (
+        fetchval(
+            0, "SELECT user_id FROM usernames WHERE username = $1", LEGACY_USERNAME
+        )
+        == legacy_id
+    )
+    assert not fetchval(
+        1, "SELECT count(*) FROM users WHERE username = $1", LEGACY_USERNAME
+    )
+
+
+def test_unknown_receipt_ids_are_not_found(client):
+    for receipt_id in [last_id(0), first_id(7)]:
+        response = client.get(f"/api/v1/receipts/{receipt_id}")
+        assert response.status_code == 404
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.app import app
+from services.singleflight import SingleFlight
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_concurrent_calls_share_one_run():
+    flights = SingleFlight()
+    runs = 0
+
+    async def load():
+        nonlocal runs
+        runs += 1
+        await asyncio.sleep(0.01)
+        return runs
+
+    results = await asyncio.gather(*(flights.do("key", load) for _ in range(10)))
+    assert results == [1] * 10
+    assert (flights.calls, flights.coalesced) == (10, 9)
+
+    # Once done, the next call runs again
+    assert await flights.do("key", load) == 2
+    assert await flights.do("other", load) == 3
+    assert flights.flights == {}
+
+
+@pytest.mark.anyio
+async def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ValueError("Database is down")
+
+    results = await asyncio.gather(
+        *(flights.do("key", load) for _ in range(3)), return_exceptions=True
+    )
+    assert [type(result) for result in results] == [ValueError] * 3
+    assert flights.errors == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_caller_does_not_cancel_the_run():
+    flights = SingleFlight()
+    started = asyncio.Event()
+
+    async def load():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "receipt"
+
+    leader = asyncio.create_task(flights.do("key", load))
+    await started.wait()
+    follower = asyncio.create_task(flights.do("key", load))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    assert await follower == "receipt"
+    assert leader.cancelled()
+
+
+def test_metrics_count_receipt_reads():
+    with TestClient(app=app) as client:
+
+        def reads():
+            response = client.get("/api/v1/metrics")
+            assert response.status_code == 200
+            values = dict(
+                line.split()
+                for line in response.text.splitlines()
+                if not line.startswith("#")
+            )
+            return float(values["receipt_reads_total"])
+
+        before = reads()
+        assert client.get("/api/v1/receipts/999999999").status_code == 404
+        assert client.get("/api/v1/receipts/show/999999999/").status_code == 404
+        assert reads() == before + 2
@@ -0,0 +1,284 @@
+import json
+import os
+import uuid
+from decimal import Decimal
+from functools import partial
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from api.app import app
+from api.dependencies import get_receipt_spool, get_session_pools, open_repository
+from config import load_config
+from services.receipts import ReceiptService
+from services.spool import (
+    DEAD_LETTERS,
+    ReceiptSpool,
+    is_transient_error,
+    replay_receipts,
+    scan_segment,
+    segment_path,
+)
+
+os.environ["DB_HOST"] = "localhost:5439"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class Replayed:
+    def __init__(self):
+        self.records = []
+        self.fail = False
+
+    async def __call__(self, records):
+        if self.fail:
+            raise ConnectionRefusedError("Database is down")
+        self.records += records
+        return [(record, "Invalid") for record in records if record.get("invalid")]
+
+
+@pytest.mark.anyio
+async def test_spool_drains_in_order_across_segments(tmp_path):
+    replayed = Replayed()
+    spool = ReceiptSpool(tmp_path, replayed, segment_bytes=100, batch_size=3)
+    for number in range(7):
+        await spool.append({"number": number})
+    assert spool.depth == 7
+    assert len(spool.segments) > 1
+
+    replayed.fail = True
+    with pytest.raises(ConnectionRefusedError):
+        await spool.drain()
+    assert spool.depth == 7
+
+    replayed.fail = False
+    while await spool.drain():
+        pass
+    assert [record["number"] for record in replayed.records] == list(range(7))
+    assert spool.depth == 0
+    assert spool.replayed == 7
+    # Replayed segments are deleted, but the last one until it is drained past
+    assert len(list(spool.directory.glob("*.log"))) == 1
+    await spool.stop()
+
+
+@pytest.mark.anyio
+async def test_spool_recovers_pending_records(tmp_path):
+    replayed = Replayed()
+    spool = ReceiptSpool(tmp_path, replayed, batch_size=2)
+    for number in range(3):
+        await spool.append({"number": number})
+    await spool.drain()
+    # A crash while appending leaves a torn record behind
+    with open(segment_path(spool.directory, spool.writer_number), "ab") as file:
+        file.write(b"\x00\x00\x01\x00torn")
+    await spool.stop()
+
+    spool = ReceiptSpool(tmp_path, replayed, batch_size=10)
+    assert spool.depth == 1
+    await spool.append({"number": 3})
+    assert spool.depth == 2
+    await spool.drain()
+    assert [record["number"] for record in replayed.records] == [0, 1, 2, 3]
+    await spool.stop()
+
+
+@pytest.mark.anyio
+async def test_processes_take_separate_slots(tmp_path):
+    first = ReceiptSpool(tmp_path, Replayed())
+    second = ReceiptSpool(tmp_path, Replayed())
+    assert first.directory != second.directory
+    await first.stop()
+
+    third = ReceiptSpool(tmp_path, Replayed())
+    assert third.directory == first.directory
+    await second.stop()
+    await third.stop()
+
+
+@pytest.mark.anyio
+async def test_dropped_records_go_to_the_dead_letters(tmp_path):
+    spool = ReceiptSpool(tmp_path, Replayed())
+    for number in range(3):
+        await spool.append({"number": number, "invalid": number == 1})
+    await spool.drain()
+    assert spool.depth == 0
+    assert spool.dropped == 1
+
+    dead_letters = [
+        json.loads(payload)
+        for _, payload in scan_segment(spool.directory / DEAD_LETTERS, 0)
+    ]
+    assert dead_letters == [
+        {"record": {"number": 1, "invalid": True}, "reason": "Invalid"}
+    ]
+    await spool.stop()
+
+
+class DatabaseError(Exception):
+    def __init__(self, sqlstate: str):
+        self.sqlstate = sqlstate
+
+
+def test_transient_errors_are_retried():
+    def error(sqlstate: str) -> DBAPIError:
+        return DBAPIError("INSERT", {}, DatabaseError(sqlstate))
+
+    for sqlstate in ["08006", "57P01", "40001", "40P01", "53300", "57014"]:
+        assert is_transient_error(error(sqlstate)), sqlstate
+    for sqlstate in ["23505", "22003", "42P01"]:
+        assert not is_transient_error(error(sqlstate)), sqlstate
+    assert is_transient_error(ConnectionRefusedError())
+    assert not is_transient_error(ValueError())
+
+
+def test_receipts_are_spooled_while_the_database_is_down(tmp_path):
+    config = load_config()
+    username = f"spool-{uuid.uuid4().hex[:8]}"
+    receipt = {
+        "products": [{"name": "Spooled tea", "price": "2.50", "quantity": "2"}],
+        "payment": {"type": "card", "amount": "5.00"},
+        "comment": "Lane 3",
+    }
+    spool = ReceiptSpool(tmp_path, Replayed())
+
+    with TestClient(app=app) as client:
+        response = client.post(
+            "/api/v1/signup",
+            json={"username": username, "password": "secret", "full_name": "Spool"},
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        down = create_async_engine(config.db.get_connection_string("localhost:1"))
+        app.dependency_overrides[get_session_pools] = lambda: [async_sessionmaker(down)]
+        app.dependency_overrides[get_receipt_spool] = lambda: spool
+        try:
+            response = client.post("/api/v1/receipts", json=receipt, headers=headers)
+            assert response.status_code == 202
+            spooled = response.json()
+            assert Decimal(spooled["total"]) == Decimal("5.00")
+            assert Decimal(spooled["rest"]) == 0
+
+            response = client.post(
+                "/api/v1/receipts",
+                json={**receipt, "payment": {"type": "card", "amount": "1.00"}},
+                headers=headers,
+            )
+            assert response.status_code == 400
+        finally:
+            app.dependency_overrides.clear()
+        assert spool.depth == 1
+
+        # The database is back
+        spool.replay = partial(
+            replay_receipts,
+            partial(open_repository, config, get_session_pools()),
+            None,
+            [30],
+        )
+        assert client.portal.call(spool.drain) == 1
+        assert spool.depth == 0
+        # A record replayed again, after a crash before the checkpoint, is skipped
+        record = {
+            "spool_id": spooled["provisional_id"],
+            "username": username,
+            "created_at": "2020-01-01T00:00:00+00:00",
+            "request": receipt,
+        }
+        assert client.portal.call(spool.replay, [record]) == []
+
+        response = client.get(
+            f"/api/v1/receipts/spooled/{spooled['provisional_id']}", headers=headers
+        )
+        assert response.status_code == 200
+        stored = response.json()
+        assert stored["created_at"] == spooled["created_at"]
+        assert stored["comment"] == "Lane 3"
+        assert stored["products"][0]["name"] == "Spooled tea"
+
+        response = client.get("/api/v1/receipts", headers=headers)
+        assert [receipt["receipt_id"] for receipt in response.json()] == [
+            stored["receipt_id"]
+        ]
+
+        response = client.get(
+            f"/api/v1/receipts/spooled/{uuid.uuid4().hex}", headers=headers
+        )
+        assert response.status_code == 404
+        client.portal.call(down.dispose)
+        client.portal.call(spool.stop)
+
+
+def test_replay_retries_a_batch_that_created_products(tmp_path, monkeypatch):
+    config = load_config()
+    username = f"spool-{uuid.uuid4().hex[:8]}"
+    product = {"name": f"Spooled {uuid.uuid4().hex[:8]}", "price": "1", "quantity": "1"}
+    records = [
+        {
+            "spool_id": uuid.uuid4().hex,
+            "username": username,
+            "created_at": "2024-01-01T00:00:00+00:00",
+            "request": {
+                "products": [product],
+                "payment": {"type": "cash", "amount": "1"},
+                "comment": comment,
+            },
+        }
+        for comment in ["Creates the product", "Finds it", "Deadlocks"]
+    ]
+
+    create_receipt = ReceiptService.create_receipt
+    deadlocks = [DBAPIError("INSERT", {}, DatabaseError("40P01"))]
+
+    async def deadlock_once(self, user_id, request, **kwargs):
+        if request.comment == "Deadlocks" and deadlocks:
+            raise deadlocks.pop()
+        return await create_receipt(self, user_id, request, **kwargs)
+
+    monkeypatch.setattr(ReceiptService, "create_receipt", deadlock_once)
+
+    with TestClient(app=app) as client:
+        # Pools of this test's loop, the cached ones belong to an earlier client
+        pools = [
+            async_sessionmaker(
+                create_async_engine(config.db.get_connection_string(host)),
+                expire_on_commit=False,
+            )
+            for host in config.db.get_shard_hosts()
+        ]
+        app.dependency_overrides[get_session_pools] = lambda: pools
+        replay = partial(
+            replay_receipts, partial(open_repository, config, pools), None, [30]
+        )
+        try:
+            response = client.post(
+                "/api/v1/signup",
+                json={"username": username, "password": "secret", "full_name": "Spool"},
+            )
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            # The whole batch is rolled back, the products of its first receipt too
+            with pytest.raises(DBAPIError):
+                client.portal.call(replay, records)
+            assert client.portal.call(replay, records) == []
+
+            response = client.post(
+                "/api/v1/receipts",
+                json={
+                    "products": [product],
+                    "payment": {"type": "cash", "amount": "1"},
+                },
+                headers=headers,
+            )
+            assert response.status_code == 201
+            response = client.get("/api/v1/receipts", headers=headers)
+            assert len(response.json()) == 4
+        finally:
+            app.dependency_overrides.clear()
+            for pool in pools:
+                client.portal.call(pool.kw["bind"].dispose)